@@ -0,0 +1,187 @@
+"""Javadoc archives: Maven *-javadoc.jar artifacts, or any zip of a Javadoc tree.
+
+A build reads the archive in place, without extracting it first. The
+central directory is read once into a FileManifest of the members (lookup
+by path in O(1)). The root of the Javadoc is the directory of the
+shallowest index.html (the META-INF directory of a jar is not part of the
+Javadoc). The staging (see core.stage_file) streams each member into the
+working directory, cleaned-up in the same pass: the files are written once,
+and the other stages read the working directory as usual.
+
+A member is designated by the path of the archive and its path relative to
+the root of the Javadoc, separated by const.ARCHIVE_SEPARATOR
+(guava-javadoc.jar!/index.html). The functions of this module accept the
+path of a member or of a plain file.
+"""
+
+import os
+import posixpath
+import shutil
+import threading
+import time
+import zipfile
+
+import const
+import metrics as metrics_
+from manifest import FileManifest, normalize
+
+# Archives open in the current process: path -> (size, mtime, JavadocArchive)
+_archives = {}
+_archives_pid = None
+_archives_lock = threading.Lock()
+
+
+class JavadocArchive:
+    """Members of a Javadoc archive, indexed by path relative to the Javadoc root"""
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        infos = [info for info in self.zip.infolist() if not info.is_dir()]
+        self.root = get_root([info.filename for info in infos])
+        self.members = {}
+        self.manifest = FileManifest()
+        for info in infos:
+            if not info.filename.startswith(self.root):
+                continue
+            rel_path = normalize(info.filename[len(self.root):])
+            # Entries escaping the working directory are ignored
+            if not rel_path or posixpath.isabs(rel_path) or rel_path.split('/')[0] in ('..', const.META_INF):
+                continue
+            self.members[rel_path] = info
+            self.manifest.add(rel_path, info.file_size, get_mtime(info))
+
+    def read(self, rel_path):
+        """Returns the content of a member"""
+        info = self.get_info(rel_path)
+        data = self.zip.read(info)
+        metrics_.count(files_read=1, bytes_read=len(data))
+        return data
+
+    def extract(self, rel_path, dst):
+        """Writes a member into dst (streamed), with its modification time"""
+        info = self.get_info(rel_path)
+        with self.zip.open(info) as fsrc, open(dst, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, const.HASH_BLOCK_SIZE)
+        metrics_.count(files_read=1, bytes_read=info.file_size)
+        self.copystat(rel_path, dst)
+        metrics_.count_written(dst)
+        return dst
+
+    def copystat(self, rel_path, dst):
+        """Sets the modification time of dst to the one of a member"""
+        mtime = self.manifest.mtime(rel_path)
+        os.utime(dst, ns=(mtime, mtime))
+
+    def get_info(self, rel_path):
+        try:
+            return self.members[normalize(rel_path)]
+        except KeyError:
+            raise FileNotFoundError('%s not found in %s' % (rel_path, self.path)) from None
+
+    def get_hashes(self, rel_paths):
+        """Returns {relative path: hash} of members, from the CRC-32 of the central
+        directory (the members are not read)"""
+        return {rel_path: 'crc32:%08x' % self.get_info(rel_path).CRC for rel_path in rel_paths}
+
+
+def get_root(names):
+    """Returns the prefix of the Javadoc root ('' or 'dir/') in the member names:
+    the directory of the shallowest index.html"""
+    roots = [name[:-len(const.INDEX_HTML)] for name in names
+             if posixpath.basename(name) == const.INDEX_HTML and not name.startswith(const.META_INF + '/')]
+    if not roots:
+        return ''
+    return min(roots, key=lambda root: (root.count('/'), root))
+
+
+def get_mtime(info):
+    """Returns the modification time (ns) of a member (local time in the archive)"""
+    return int(time.mktime(info.date_time + (0, 0, -1))) * 1000000000
+
+
+def is_archive(path):
+    """Returns True if path is a Javadoc archive (jar or zip file)"""
+    return get_open(path) is not None or (os.path.isfile(path) and zipfile.is_zipfile(path))
+
+
+def get_open(path):
+    """Returns the JavadocArchive of path if already open in this process, else None"""
+    if _archives_pid != os.getpid():
+        return None
+    size, mtime, javadoc_archive = _archives.get(os.path.abspath(path), (None, None, None))
+    return javadoc_archive
+
+
+def get_archive(path):
+    """Returns the JavadocArchive of path, opened once per process (a forked
+    worker doesn't share the open file of its parent) and reopened if the
+    file changed"""
+    global _archives_pid
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    with _archives_lock:
+        if _archives_pid != os.getpid():
+            _archives.clear()
+            _archives_pid = os.getpid()
+        size, mtime, javadoc_archive = _archives.get(path, (None, None, None))
+        if (size, mtime) != (st.st_size, st.st_mtime_ns):
+            javadoc_archive = JavadocArchive(path)
+            _archives[path] = (st.st_size, st.st_mtime_ns, javadoc_archive)
+        return javadoc_archive
+
+
+def join(source, rel_path):
+    """Returns the path of a file of a Javadoc directory or archive"""
+    if is_archive(source):
+        return source + const.ARCHIVE_SEPARATOR + rel_path
+    return os.path.join(source, rel_path)
+
+
+def split_member(path):
+    """Returns the archive and the relative path of a member, None if path is
+    not the path of a member"""
+    start = path.find(const.ARCHIVE_SEPARATOR)
+    while start != -1:
+        javadoc_archive = get_open(path[:start])
+        if javadoc_archive is None and is_archive(path[:start]):
+            javadoc_archive = get_archive(path[:start])
+        if javadoc_archive is not None:
+            return javadoc_archive, path[start + len(const.ARCHIVE_SEPARATOR):]
+        start = path.find(const.ARCHIVE_SEPARATOR, start + 1)
+    return None
+
+
+def get_manifest(source):
+    """Returns the FileManifest of a Javadoc directory (scanned) or archive"""
+    if is_archive(source):
+        return get_archive(source).manifest
+    return FileManifest.scan(source)
+
+
+def isfile(path):
+    """Returns True if path is a file or a member"""
+    member = split_member(path)
+    if member:
+        return member[0].manifest.isfile(member[1])
+    return os.path.isfile(path)
+
+
+def read_file(path):
+    """Returns the content of a file or a member (counted, see metrics)"""
+    member = split_member(path)
+    if member:
+        return member[0].read(member[1])
+    with open(path, 'rb') as fo:
+        data = fo.read()
+        metrics_.count_read(fo)
+    return data
+
+
+def copystat(src, dst):
+    """Copies the modification time of a file or a member to dst"""
+    member = split_member(src)
+    if member:
+        member[0].copystat(member[1], dst)
+    else:
+        shutil.copystat(src, dst)
@@ -0,0 +1,234 @@
+"""
+Builds the CHM files of several Javadoc directories (see core.build).
+
+The builds are listed in a JSON or TOML manifest. Each build has the path
+of a Javadoc directory or archive (-javadoc.jar), and optionally the name
+of the project and the title (by default, extracted from the Javadoc
+index.html). Relative paths are relative to the manifest.
+
+JSON: [{"path": "guava/docs", "name": "guava31", "title": "Guava 31"}, ...]
+      (or {"builds": [...]})
+TOML: [[build]]
+      path = "guava/docs"
+      name = "guava31"
+      title = "Guava 31"
+
+The builds run in a pool of processes, the largest Javadoc trees first, so
+that a large tree doesn't start last and delay the end of the batch. A
+failing build doesn't stop the others. The logs of the builds are
+aggregated into one log file, in the order of the manifest, and a summary
+table of the durations and failures is displayed.
+
+Usage:
+
+  python batch.py [-b builds] [-j jobs] [-c compiler] [-o output_dir] [-l log_file] manifest
+
+  -b builds:     number of builds running concurrently (default: number of cores).
+  -j jobs:       number of worker processes of each build (default: 1).
+  -c compiler:   'hhc' or 'internal' (default: hhc, or internal if the HTML
+                 Help compiler is not found).
+  -o output_dir: directory of the CHM files (default: current directory).
+  -l log_file:   aggregated logs of the builds (default: batch.log in output_dir).
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import getopt
+import io
+import json
+import os
+import sys
+import time
+import traceback
+try:
+    import tomllib
+except ImportError:
+    # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+import archive
+import cli
+import const
+import core
+import log as log_
+import parallel
+
+# A build of the manifest: Javadoc directory, project name and title
+BatchEntry = collections.namedtuple('BatchEntry', ['path', 'name', 'title'])
+
+# Result of a build: size of the Javadoc tree (bytes), duration (seconds), path
+# of the CHM file, error message (None if succeeded) and log
+BatchResult = collections.namedtuple('BatchResult', ['entry', 'size', 'duration', 'chm_file', 'error', 'log'])
+
+
+def read_manifest(manifest_file):
+    """Returns the builds (BatchEntry) of a JSON or TOML manifest"""
+    if os.path.splitext(manifest_file)[1].lower() == '.toml':
+        if tomllib is None:
+            raise ValueError('Reading %s requires Python 3.11+ or the tomli package' % manifest_file)
+        with open(manifest_file, 'rb') as fo:
+            builds = tomllib.load(fo).get('build', [])
+    else:
+        with open(manifest_file) as fo:
+            builds = json.load(fo)
+        if isinstance(builds, dict):
+            builds = builds.get('builds', [])
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    entries = []
+    for build in builds:
+        if 'path' not in build:
+            raise ValueError('%s: build without path' % manifest_file)
+        path = os.path.join(base_dir, build['path'])
+        title = build.get('title')
+        if not title:
+            index_html = archive.join(path, const.INDEX_HTML)
+            title = cli.get_title(index_html) if archive.isfile(index_html) else os.path.basename(path)
+        name = build.get('name') or cli.get_project_name(title)
+        entries.append(BatchEntry(path, name, title))
+    names = [entry.name for entry in entries]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        raise ValueError('%s: duplicate project names %s' % (manifest_file, ', '.join(duplicates)))
+    return entries
+
+
+def get_tree_size(path):
+    """Returns the size (bytes) of the files of a Javadoc tree or archive (0 if not
+    found)"""
+    if not os.path.isdir(path) and not archive.is_archive(path):
+        return 0
+    return sum(size for size, mtime in archive.get_manifest(path).files.values())
+
+
+def run_build(entry, size, output_dir, jobs, compiler):
+    """Builds the CHM file of a batch entry. Returns a BatchResult.
+
+    Runs in the worker processes of run. The logs are captured, the console
+    output is discarded.
+    """
+    logging = log_.get_logging()
+    buffer = io.StringIO()
+    handler = logging.add_stream(buffer)
+    start = time.perf_counter()
+    chm_file = None
+    error = None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = core.build(entry.path, entry.name, entry.title, output_dir=output_dir, jobs=jobs,
+                                compiler=compiler)
+        chm_file = result.chm_file
+        if chm_file is None:
+            error = 'No CHM file generated'
+    except Exception as e:
+        error = '%s: %s' % (type(e).__name__, e)
+        buffer.write(traceback.format_exc())
+    finally:
+        logging.remove_handler(handler)
+    return BatchResult(entry, size, round(time.perf_counter() - start, 2), chm_file, error, buffer.getvalue())
+
+
+def run(entries, output_dir, builds=0, jobs=1, compiler=const.COMPILER):
+    """Runs the builds, the largest Javadoc trees first. Returns the results in the
+    order of entries."""
+    sizes = [get_tree_size(entry.path) for entry in entries]
+    order = sorted(range(len(entries)), key=lambda i: sizes[i], reverse=True)
+    results = [None] * len(entries)
+    log = log_.get_logger()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=parallel.get_jobs(builds)) as pool:
+        futures = {}
+        for i in order:
+            futures[pool.submit(run_build, entries[i], sizes[i], output_dir, jobs, compiler)] = i
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # The worker process died (the pool is broken)
+                results[i] = BatchResult(entries[i], sizes[i], 0, None, '%s: %s' % (type(e).__name__, e), '')
+            status = 'failed' if results[i].error else 'done'
+            log.info('%s: %s (%.2fs)' % (entries[i].name, status, results[i].duration))
+    return results
+
+
+def write_log(results, log_file):
+    """Writes the logs of the builds, in the order of the results"""
+    with open(log_file, 'w') as fo:
+        for result in results:
+            fo.write('==== %s (%s) ====\n' % (result.entry.name, result.entry.path))
+            fo.write(result.log)
+            if result.error:
+                fo.write('ERROR: %s\n' % result.error)
+            fo.write('\n')
+
+
+def format_summary(results):
+    """Returns the summary table of the builds"""
+    width = max([len(result.entry.name) for result in results] + [len('Project')])
+    lines = ['%-*s  %-6s  %10s  %9s  %s' % (width, 'Project', 'Status', 'Size (KB)', 'Time (s)', 'CHM file / error')]
+    for result in results:
+        lines.append('%-*s  %-6s  %10d  %9.2f  %s' % (width, result.entry.name, 'FAILED' if result.error else 'OK',
+                                                      result.size // 1024, result.duration,
+                                                      result.error or result.chm_file))
+    failures = len([result for result in results if result.error])
+    lines.append('%d builds, %d failed, %.2fs in total' % (len(results), failures,
+                                                            sum(result.duration for result in results)))
+    return '\n'.join(lines)
+
+
+def main(args):
+    try:
+        opts, args = getopt.getopt(args, "hb:j:c:o:l:")
+    except getopt.GetoptError:
+        print(__doc__)
+        sys.exit(2)
+    builds = 0
+    jobs = 1
+    compiler = const.COMPILER
+    output_dir = os.getcwd()
+    log_file = None
+    for o, a in opts:
+        if o == "-h":
+            print(__doc__)
+            sys.exit()
+        if o == "-b":
+            builds = int(a)
+        if o == "-j":
+            jobs = int(a)
+        if o == "-c":
+            if a not in (const.COMPILER_HHC, const.COMPILER_INTERNAL):
+                print(__doc__)
+                sys.exit(2)
+            compiler = a
+        if o == "-o":
+            output_dir = os.path.abspath(a)
+        if o == "-l":
+            log_file = os.path.abspath(a)
+    if len(args) != 1:
+        print(__doc__)
+        sys.exit(2)
+    if log_file is None:
+        log_file = os.path.join(output_dir, 'batch.log')
+
+    log = log_.get_logger()
+    try:
+        entries = read_manifest(args[0])
+    except (OSError, ValueError) as e:
+        log.error(e)
+        sys.exit(1)
+    os.makedirs(output_dir, exist_ok=True)
+    log.info('%d builds' % len(entries))
+    results = run(entries, output_dir, builds, jobs, compiler)
+    write_log(results, log_file)
+    print()
+    print(format_summary(results))
+    print('Logs written to %s' % log_file)
+    if [result for result in results if result.error]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
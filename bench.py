@@ -0,0 +1,178 @@
+"""
+Benchmarks the jd2chm build stages on synthetic Javadoc trees (see corpus.py).
+
+Each stage of the build (task of core.build) is timed, for each size and
+index layout, the total being the elapsed time of the build. A stub stands
+in for the HTML Help compiler (hhc.exe), so the benchmark runs on any
+platform. The results are written as a JSON report that can be compared
+across commits.
+
+Usage:
+
+  python bench.py [-s sizes] [-l layouts] [-j jobs] [-c compiler] [-o report]
+
+  -s sizes:   comma separated numbers of pages (default: 1000,10000).
+  -l layouts: comma separated index layouts, 'unsplit' (index-all.html)
+              and/or 'split' (index-files) (default: unsplit,split).
+  -j jobs:    number of worker processes (default: number of cores).
+  -c compiler: 'hhc' (stub of the HTML Help compiler) or 'internal'
+              (CHM writer, module chm) (default: hhc).
+  -o report:  JSON report (default: bench_output.json).
+"""
+
+import getopt
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import const
+import core
+import corpus
+import log as log_
+import metrics as metrics_
+import taskgraph
+
+DEFAULT_SIZES = [1000, 10000]
+LAYOUTS = ["unsplit", "split"]
+STAGES = ["copy_javadoc", "create_css_about", "create_hhp", "create_hhc", "create_hhk", "make"]
+
+# Stands in for hhc.exe: reads the project files and the [FILES] section of
+# the project, and writes them into a fake CHM file.
+STUB_COMPILER = '''import sys
+hhp = sys.argv[1]
+name = hhp[:-4]
+with open(hhp, 'rb') as fo:
+    files = fo.read().decode().split('[FILES]')[1].split()
+with open(name + '.chm', 'wb') as chm:
+    for path in [hhp, name + '.hhc', name + '.hhk'] + files:
+        with open(path, 'rb') as fo:
+            chm.write(fo.read())
+'''
+
+
+class StubChmEnv(core.ChmEnv):
+    """ChmEnv compiling with the stub compiler"""
+
+    def __init__(self, stub_path):
+        super().__init__()
+        self.stub_path = stub_path
+
+    def get_html_compiler_path(self):
+        return self.stub_path
+
+    def get_compiler_command(self):
+        return '"%s" "%s"' % (sys.executable, self.html_compiler)
+
+
+def get_commit():
+    """Returns the current git commit of jd2chm, if available"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_stages(javadoc_dir, project_name, out_dir, stub_path, jobs, compiler=const.COMPILER_HHC):
+    """Builds the project of javadoc_dir with the task graph of core.build. Returns
+    the duration (seconds) of each stage and the elapsed time of the build (the
+    HHP, HHC and HHK files are created concurrently)."""
+    env = StubChmEnv(stub_path)
+    graph = taskgraph.TaskGraph()
+    metrics_.set_metrics(None)
+    try:
+        env.configure(project_name, jobs, compiler=compiler, work_dir=core.get_work_dir(project_name),
+                      output_dir=out_dir)
+        env.add_tasks(graph, javadoc_dir)
+        core.ChmProject().add_tasks(graph, env, "Benchmark")
+        graph.add('make', env.compile, inputs=(const.RESOURCE_STAGED, const.RESOURCE_HHP, const.RESOURCE_HHC,
+                                               const.RESOURCE_HHK), outputs=(const.RESOURCE_CHM,))
+        graph.run()
+    finally:
+        if env.temp_dir:
+            shutil.rmtree(env.temp_dir, ignore_errors=True)
+    report = graph.report()
+    return {stage: report['tasks'][stage]['duration'] for stage in STAGES}, report['elapsed']
+
+
+def run(sizes, layouts, jobs, compiler=const.COMPILER_HHC):
+    """Runs the benchmark. Returns the report (dictionary)."""
+    report = {
+        "version": const.VERSION,
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "jobs": jobs,
+        "compiler": compiler,
+        "stages": STAGES,
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="jd2chm-bench-") as bench_dir:
+        stub_path = os.path.join(bench_dir, "hhc_stub.py")
+        with open(stub_path, 'w') as fo:
+            fo.write(STUB_COMPILER)
+        for size in sizes:
+            for layout in layouts:
+                javadoc_dir = os.path.join(bench_dir, "javadoc-%d-%s" % (size, layout))
+                generator = corpus.Corpus.for_pages(javadoc_dir, size, split_index=(layout == "split"))
+                pages = generator.generate()
+                project_name = "bench-%d-%d-%s" % (os.getpid(), size, layout)
+                timings, elapsed = run_stages(javadoc_dir, project_name, bench_dir, stub_path, jobs, compiler)
+                report["runs"].append({
+                    "pages": pages,
+                    "layout": layout,
+                    "packages": generator.packages,
+                    "stages": timings,
+                    "total": elapsed,
+                })
+                shutil.rmtree(javadoc_dir, ignore_errors=True)
+    return report
+
+
+def main(args):
+    try:
+        opts, args = getopt.getopt(args, "hs:l:j:c:o:")
+    except getopt.GetoptError:
+        print(__doc__)
+        sys.exit(2)
+    sizes = DEFAULT_SIZES
+    layouts = LAYOUTS
+    jobs = const.JOBS
+    compiler = const.COMPILER_HHC
+    report_file = "bench_output.json"
+    for o, a in opts:
+        if o == "-h":
+            print(__doc__)
+            sys.exit()
+        if o == "-s":
+            sizes = [int(size) for size in a.split(',')]
+        if o == "-l":
+            layouts = [layout for layout in a.split(',') if layout in LAYOUTS]
+        if o == "-j":
+            jobs = int(a)
+        if o == "-c":
+            compiler = a
+        if o == "-o":
+            report_file = a
+
+    # Only the errors are displayed (the clean-up logs every modified file)
+    log_.get_logging().set_level(4)
+    report = run(sizes, layouts, jobs, compiler)
+    with open(report_file, 'w') as fo:
+        json.dump(report, fo, indent=2)
+    print()
+    for result in report["runs"]:
+        print("%7d pages %-8s %s total=%.2fs" % (result["pages"], result["layout"],
+                                                 " ".join("%s=%.2fs" % (stage, result["stages"][stage])
+                                                          for stage in STAGES),
+                                                 result["total"]))
+    print("Report written to %s" % report_file)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,611 @@
+"""
+Pure Python writer of Compiled HTML Help files (CHM).
+
+An alternative to the Microsoft HTML Help compiler (hhc.exe), available on
+any platform. The CHM file is an ITSF container:
+
+- ITSF header, header section 0 (file size) and the ITSP directory: PMGL
+  listing chunks with the entries sorted by name (case insensitive), and
+  PMGI index chunks when the directory spans more than one chunk.
+- Content section 0 (uncompressed): the system streams (#SYSTEM, #STRINGS,
+  #TOPICS, #URLTBL, #URLSTR), the ::DataSpace streams and the content of
+  section 1.
+- Content section 1 (MSCompressed): the project files, streamed into an
+  LZX stream. The frames are stored as LZX uncompressed blocks: the LZX
+  compressor is not implemented, the CHM file is therefore about the size
+  of the files.
+
+Only the data read by the help viewers is written: no binary TOC or index,
+no full-text search and no custom windows (#WINDOWS). ChmReader reads the
+files written by ChmWriter back (used to verify the output).
+"""
+
+import collections
+import os
+import posixpath
+import re
+import shutil
+import struct
+import tempfile
+import time
+import uuid
+
+import const
+import log as log_
+import metrics as metrics_
+from manifest import FileManifest
+
+CHUNK_SIZE = 0x1000
+# A quickref entry every 1 + 2**density entries of a directory chunk
+QUICKREF_DENSITY = 2
+PMGL_HEADER_SIZE = 0x14
+PMGI_HEADER_SIZE = 0x08
+
+ITSF_HEADER_SIZE = 0x60
+HEADER_SECTION0_SIZE = 0x18
+ITSP_HEADER_SIZE = 0x54
+
+ITSF_GUID1 = uuid.UUID('7C01FD10-7BAA-11D0-9E0C-00A0C922E6EC').bytes_le
+ITSF_GUID2 = uuid.UUID('7C01FD11-7BAA-11D0-9E0C-00A0C922E6EC').bytes_le
+ITSP_GUID = uuid.UUID('5D02926A-212E-11D0-9DF9-00A0C922E6EC').bytes_le
+LZX_TRANSFORM_GUID = '{7FC28940-9D31-11D0-9B27-00A0C91E9C7C}'
+
+SECTION_UNCOMPRESSED = 0
+SECTION_COMPRESSED = 1
+SECTION_NAMES = ['Uncompressed', 'MSCompressed']
+
+# LZX frames (uncompressed size), reset interval and window (in frames)
+LZX_FRAME_SIZE = 0x8000
+LZX_RESET_INTERVAL = 2
+LZX_WINDOW_SIZE = 2
+LZX_BLOCKTYPE_UNCOMPRESSED = 3
+
+NAME_LIST = '::DataSpace/NameList'
+CONTROL_DATA = '::DataSpace/Storage/MSCompressed/ControlData'
+CONTENT = '::DataSpace/Storage/MSCompressed/Content'
+SPAN_INFO = '::DataSpace/Storage/MSCompressed/SpanInfo'
+TRANSFORM_LIST = '::DataSpace/Storage/MSCompressed/Transform/List'
+RESET_TABLE = '::DataSpace/Storage/MSCompressed/Transform/%s/InstanceData/ResetTable' % LZX_TRANSFORM_GUID
+
+# Codes of the #SYSTEM entries
+SYSTEM_CONTENTS_FILE = 0
+SYSTEM_INDEX_FILE = 1
+SYSTEM_DEFAULT_TOPIC = 2
+SYSTEM_TITLE = 3
+SYSTEM_LCID = 4
+SYSTEM_COMPILED_FILE = 6
+SYSTEM_COMPILER_VERSION = 9
+SYSTEM_VERSION = 3
+
+# #STRINGS is made of blocks that the strings don't cross
+STRINGS_BLOCK_SIZE = 0x1000
+# #URLTBL is made of blocks of 341 entries (12 bytes, 4 unused bytes per block)
+URLTBL_BLOCK_ENTRIES = 341
+# Flags of a topic (#TOPICS): listed in the contents or not
+TOPIC_IN_CONTENTS = 6
+TOPIC_NOT_IN_CONTENTS = 2
+
+DEFAULT_LCID = 0x409
+# Windows code page of the language 0x409 (strings of the system streams, project files)
+DEFAULT_ENCODING = const.PROJECT_ENCODING
+
+COPY_BLOCK_SIZE = 1 << 16
+
+# Entry of the directory: content section, offset in the section and length
+DirectoryEntry = collections.namedtuple('DirectoryEntry', ['name', 'section', 'offset', 'length'])
+
+RE_OPTION = re.compile(r'^([^=]+)=(.*)$')
+RE_LANGUAGE = re.compile(r'^(0x[0-9a-fA-F]+)')
+RE_SITEMAP_PARAM = re.compile(r'<param name="(Name|Local)" value="([^"]*)">', re.I)
+
+
+def encode_int(value):
+    """Returns the ENCINT of a positive integer: 7 bits per byte, most significant
+    first, the high bit is set on all the bytes but the last."""
+    data = bytearray([value & 0x7f])
+    value >>= 7
+    while value:
+        data.append(0x80 | (value & 0x7f))
+        value >>= 7
+    data.reverse()
+    return bytes(data)
+
+
+def decode_int(data, pos):
+    """Returns the ENCINT at data[pos] and the position following it."""
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            return value, pos
+
+
+def sort_key(name):
+    """Directory entries are sorted case insensitively (as compared by the readers)"""
+    data = name.encode('utf-8')
+    return data.lower(), data
+
+
+def quickref_size(count):
+    """Size of the quickref area (and entry count) of a chunk with count entries"""
+    return 2 + 2 * ((count - 1) // (1 + (1 << QUICKREF_DENSITY)))
+
+
+def make_chunk(header, entries):
+    """Returns a directory chunk: header, entries and quickref area (written
+    backwards from the end of the chunk)."""
+    chunk = bytearray(CHUNK_SIZE)
+    chunk[:len(header)] = header
+    pos = len(header)
+    density = 1 + (1 << QUICKREF_DENSITY)
+    quickref = []
+    for i, entry in enumerate(entries):
+        if i and i % density == 0:
+            quickref.append(pos - len(header))
+        chunk[pos:pos + len(entry)] = entry
+        pos += len(entry)
+    struct.pack_into('<H', chunk, CHUNK_SIZE - 2, len(entries))
+    for i, offset in enumerate(quickref):
+        struct.pack_into('<H', chunk, CHUNK_SIZE - 4 - 2 * i, offset)
+    return chunk
+
+
+def split_chunks(entries, header_size):
+    """Splits the encoded entries into the groups fitting in a chunk"""
+    groups = []
+    group = []
+    used = header_size
+    for entry in entries:
+        if group and used + len(entry) + quickref_size(len(group) + 1) > CHUNK_SIZE:
+            groups.append(group)
+            group = []
+            used = header_size
+        group.append(entry)
+        used += len(entry)
+    if group:
+        groups.append(group)
+    return groups
+
+
+def make_directory(entries):
+    """Returns the directory chunks (listing chunks, then index chunks), the
+    number of the root index chunk (-1 if none) and the depth of the index tree."""
+    entries = sorted(entries, key=lambda entry: sort_key(entry.name))
+    encoded = []
+    for entry in entries:
+        name = entry.name.encode('utf-8')
+        encoded.append(encode_int(len(name)) + name + encode_int(entry.section) + encode_int(entry.offset) +
+                       encode_int(entry.length))
+    groups = split_chunks(encoded, PMGL_HEADER_SIZE)
+    chunks = []
+    children = []
+    for i, group in enumerate(groups):
+        name_length, pos = decode_int(group[0], 0)
+        children.append((group[0][pos:pos + name_length], i))
+        free_space = CHUNK_SIZE - PMGL_HEADER_SIZE - sum(len(entry) for entry in group)
+        header = struct.pack('<4sIIii', b'PMGL', free_space, 0, i - 1, i + 1 if i < len(groups) - 1 else -1)
+        chunks.append(make_chunk(header, group))
+    depth = 1
+    root = -1
+    while len(children) > 1:
+        # One more level of index chunks, each entry points to the first name of a chunk
+        encoded = [encode_int(len(name)) + name + encode_int(number) for name, number in children]
+        children = []
+        for group in split_chunks(encoded, PMGI_HEADER_SIZE):
+            name_length, pos = decode_int(group[0], 0)
+            children.append((group[0][pos:pos + name_length], len(chunks)))
+            free_space = CHUNK_SIZE - PMGI_HEADER_SIZE - sum(len(entry) for entry in group)
+            chunks.append(make_chunk(struct.pack('<4sI', b'PMGI', free_space), group))
+        depth += 1
+        root = children[0][1]
+    return chunks, len(groups), root, depth
+
+
+class LzxStream:
+    """Content of the MSCompressed section: an LZX stream made of uncompressed
+    blocks, one block per frame of LZX_FRAME_SIZE bytes."""
+
+    def __init__(self, fo):
+        self.fo = fo
+        self.frame = bytearray()
+        self.length = 0
+        self.compressed_length = 0
+        # Offset in the LZX stream of each frame
+        self.reset_table = []
+
+    def write(self, data):
+        self.length += len(data)
+        self.frame += data
+        while len(self.frame) >= LZX_FRAME_SIZE:
+            self.write_frame(self.frame[:LZX_FRAME_SIZE])
+            del self.frame[:LZX_FRAME_SIZE]
+
+    def close(self):
+        """Writes the last frame. As with hhc.exe, the stream is padded with zeros up
+        to the next reset interval (self.length is the length of the content)."""
+        if self.frame:
+            self.frame += bytes(LZX_FRAME_SIZE - len(self.frame))
+            self.write_frame(self.frame)
+            self.frame = bytearray()
+        while len(self.reset_table) % LZX_RESET_INTERVAL:
+            self.write_frame(bytes(LZX_FRAME_SIZE))
+
+    def write_frame(self, data):
+        """Writes a frame as an uncompressed block. The block header is followed by
+        1 to 16 bits of padding, the repeated offsets R0, R1, R2 and the data."""
+        if len(self.reset_table) % LZX_RESET_INTERVAL == 0:
+            # After a reset, the stream starts with the Intel E8 translation bit (off)
+            bits, count = (LZX_BLOCKTYPE_UNCOMPRESSED << 24) | len(data), 28
+        else:
+            bits, count = (LZX_BLOCKTYPE_UNCOMPRESSED << 24) | len(data), 27
+        # The bits are read by 16 bits words (little endian), most significant bit first
+        bits <<= 32 - count
+        block = struct.pack('<HHIII', bits >> 16, bits & 0xffff, 1, 1, 1) + bytes(data)
+        self.reset_table.append(self.compressed_length)
+        self.fo.write(block)
+        self.compressed_length += len(block)
+
+
+class ChmWriter:
+    """Writes a CHM file. The files added are streamed into the compressed section,
+    the directory and the system streams are written by write()."""
+
+    def __init__(self, chm_file, lcid=DEFAULT_LCID, encoding=DEFAULT_ENCODING, timestamp=None):
+        self.chm_file = chm_file
+        self.lcid = lcid
+        self.encoding = encoding
+        self.timestamp = int(time.time()) if timestamp is None else timestamp
+        self.log = log_.get_logger()
+        self.entries = {}
+        self.system = []
+        self.topics = []
+        self.content = tempfile.TemporaryFile()
+        self.lzx = LzxStream(self.content)
+
+    def add_file(self, name, path):
+        """Adds the file path as name (relative path, '/' separator)."""
+        offset = self.lzx.length
+        with open(path, 'rb') as fo:
+            metrics_.count_read(fo)
+            for block in iter(lambda: fo.read(COPY_BLOCK_SIZE), b''):
+                self.lzx.write(block)
+        self.add_entry('/' + name, SECTION_COMPRESSED, offset, self.lzx.length - offset)
+
+    def add_data(self, name, data):
+        """Adds a file, from its content (bytes)"""
+        offset = self.lzx.length
+        self.lzx.write(data)
+        self.add_entry('/' + name, SECTION_COMPRESSED, offset, len(data))
+
+    def add_entry(self, name, section, offset, length):
+        self.entries[name] = DirectoryEntry(name, section, offset, length)
+        # Directories of the file
+        parent = name
+        while parent != '/':
+            parent = parent.rstrip('/').rsplit('/', 1)[0] + '/'
+            if parent in self.entries:
+                break
+            self.entries[parent] = DirectoryEntry(parent, SECTION_UNCOMPRESSED, 0, 0)
+
+    def add_system(self, code, data):
+        """Adds a #SYSTEM entry (data: bytes, or str stored as a zero terminated string)"""
+        if isinstance(data, str):
+            data = data.encode(self.encoding, 'replace') + b'\0'
+        self.system.append((code, data))
+
+    def add_topic(self, local, title=None, in_contents=True):
+        """Adds a topic (#TOPICS): a page and its title"""
+        self.topics.append((local, title, in_contents))
+
+    def get_system(self):
+        data = bytearray(struct.pack('<I', SYSTEM_VERSION))
+        for code, value in self.system:
+            data += struct.pack('<HH', code, len(value)) + value
+        return bytes(data)
+
+    def get_topic_streams(self):
+        """Returns the #STRINGS, #TOPICS, #URLTBL and #URLSTR streams"""
+        strings = bytearray(b'\0')
+        topics = bytearray()
+        urltbl = bytearray()
+        urlstr = bytearray(b'\0')
+        for i, (local, title, in_contents) in enumerate(self.topics):
+            title_offset = -1
+            if title:
+                value = title.encode(self.encoding, 'replace') + b'\0'
+                if len(strings) % STRINGS_BLOCK_SIZE + len(value) > STRINGS_BLOCK_SIZE:
+                    strings += bytes(STRINGS_BLOCK_SIZE - len(strings) % STRINGS_BLOCK_SIZE)
+                title_offset = len(strings)
+                strings += value
+            if i and i % URLTBL_BLOCK_ENTRIES == 0:
+                urltbl += bytes(4)
+            urltbl_offset = len(urltbl)
+            urltbl += struct.pack('<III', i, i, len(urlstr))
+            urlstr += struct.pack('<II', urltbl_offset, 0) + local.encode(self.encoding, 'replace') + b'\0'
+            topics += struct.pack('<IiIHH', 0, title_offset, urltbl_offset,
+                                  TOPIC_IN_CONTENTS if in_contents else TOPIC_NOT_IN_CONTENTS, 0)
+        return bytes(strings), bytes(topics), bytes(urltbl), bytes(urlstr)
+
+    def get_name_list(self):
+        data = bytearray()
+        for name in SECTION_NAMES:
+            data += struct.pack('<H', len(name)) + name.encode('utf-16-le') + b'\0\0'
+        return struct.pack('<HH', (len(data) + 4) // 2, len(SECTION_NAMES)) + bytes(data)
+
+    def write(self):
+        """Writes the CHM file"""
+        self.lzx.close()
+        strings, topics, urltbl, urlstr = self.get_topic_streams()
+        reset_table = struct.pack('<IIIIQQQ', 2, len(self.lzx.reset_table), 8, 0x28, self.lzx.length,
+                                  self.lzx.compressed_length, LZX_FRAME_SIZE)
+        reset_table += b''.join(struct.pack('<Q', offset) for offset in self.lzx.reset_table)
+        streams = [
+            ('/#SYSTEM', self.get_system()),
+            ('/#STRINGS', strings),
+            ('/#TOPICS', topics),
+            ('/#URLTBL', urltbl),
+            ('/#URLSTR', urlstr),
+            (NAME_LIST, self.get_name_list()),
+            (CONTROL_DATA, struct.pack('<I4sIIIII', 6, b'LZXC', 2, LZX_RESET_INTERVAL, LZX_WINDOW_SIZE, 1, 0)),
+            (SPAN_INFO, struct.pack('<Q', self.lzx.length)),
+            (TRANSFORM_LIST, LZX_TRANSFORM_GUID.encode('utf-16-le')),
+            (RESET_TABLE, reset_table),
+        ]
+        offset = 0
+        for name, data in streams:
+            self.entries[name] = DirectoryEntry(name, SECTION_UNCOMPRESSED, offset, len(data))
+            offset += len(data)
+        self.entries[CONTENT] = DirectoryEntry(CONTENT, SECTION_UNCOMPRESSED, offset, self.lzx.compressed_length)
+        self.entries.setdefault('/', DirectoryEntry('/', SECTION_UNCOMPRESSED, 0, 0))
+        chunks, listing_chunks, root, depth = make_directory(self.entries.values())
+        directory_size = ITSP_HEADER_SIZE + len(chunks) * CHUNK_SIZE
+        content_offset = ITSF_HEADER_SIZE + HEADER_SECTION0_SIZE + directory_size
+        file_size = content_offset + offset + self.lzx.compressed_length
+
+        with open(self.chm_file, 'wb') as fo:
+            fo.write(struct.pack('<4sIII', b'ITSF', 3, ITSF_HEADER_SIZE, 1))
+            fo.write(struct.pack('>I', self.timestamp & 0xffffffff))
+            fo.write(struct.pack('<I', self.lcid) + ITSF_GUID1 + ITSF_GUID2)
+            fo.write(struct.pack('<QQQQQ', ITSF_HEADER_SIZE, HEADER_SECTION0_SIZE,
+                                 ITSF_HEADER_SIZE + HEADER_SECTION0_SIZE, directory_size, content_offset))
+            fo.write(struct.pack('<IIQII', 0x01fe, 0, file_size, 0, 0))
+            fo.write(struct.pack('<4sIIIIIIiiiiiI', b'ITSP', 1, ITSP_HEADER_SIZE, 0x0a, CHUNK_SIZE, QUICKREF_DENSITY,
+                                 depth, root, 0, listing_chunks - 1, -1, len(chunks), self.lcid))
+            fo.write(ITSP_GUID + struct.pack('<Iiii', ITSP_HEADER_SIZE, -1, -1, -1))
+            for chunk in chunks:
+                fo.write(chunk)
+            for name, data in streams:
+                fo.write(data)
+            self.content.seek(0)
+            shutil.copyfileobj(self.content, fo, COPY_BLOCK_SIZE)
+        self.content.close()
+        self.log.debug('%s: %d entries, %d directory chunks, %d bytes' % (self.chm_file, len(self.entries),
+                                                                          len(chunks), file_size))
+
+
+class ChmReader:
+    """Reads the directory and the files of a CHM file written by ChmWriter (the
+    LZX compressed blocks are not supported)."""
+
+    def __init__(self, chm_file):
+        with open(chm_file, 'rb') as fo:
+            self.data = fo.read()
+        signature, version, header_size = struct.unpack_from('<4sII', self.data, 0)
+        if signature != b'ITSF' or version != 3:
+            raise ValueError('%s is not a CHM file (version 3)' % chm_file)
+        self.timestamp, = struct.unpack_from('>I', self.data, 0x10)
+        self.lcid, = struct.unpack_from('<I', self.data, 0x14)
+        directory_offset, directory_size, self.content_offset = struct.unpack_from('<QQQ', self.data, 0x48)
+        self.file_size, = struct.unpack_from('<Q', self.data, 0x60 + 8)
+        (signature, _, self.directory_header_size, _, self.chunk_size, self.density, self.depth, self.root,
+         self.first_listing, self.last_listing, _, self.chunk_count) = struct.unpack_from('<4sIIIIIIiiiiI', self.data,
+                                                                                       directory_offset)
+        if signature != b'ITSP':
+            raise ValueError('Invalid CHM directory')
+        self.chunks_offset = directory_offset + self.directory_header_size
+        self.entries = collections.OrderedDict()
+        number = self.first_listing
+        while number != -1:
+            chunk = self.get_chunk(number)
+            if chunk[:4] != b'PMGL':
+                raise ValueError('Invalid listing chunk %d' % number)
+            for entry in self.iter_listing(chunk):
+                self.entries[entry.name] = entry
+            number, = struct.unpack_from('<i', chunk, 0x10)
+        self.section1 = None
+
+    def get_chunk(self, number):
+        start = self.chunks_offset + number * self.chunk_size
+        return self.data[start:start + self.chunk_size]
+
+    def iter_listing(self, chunk):
+        free_space, = struct.unpack_from('<I', chunk, 4)
+        pos = PMGL_HEADER_SIZE
+        while pos < self.chunk_size - free_space:
+            name_length, pos = decode_int(chunk, pos)
+            name = chunk[pos:pos + name_length].decode('utf-8')
+            section, pos = decode_int(chunk, pos + name_length)
+            offset, pos = decode_int(chunk, pos)
+            length, pos = decode_int(chunk, pos)
+            yield DirectoryEntry(name, section, offset, length)
+
+    def resolve(self, name):
+        """Looks up a name through the index chunks, as the help viewers do. Returns
+        the DirectoryEntry or None."""
+        key = name.encode('utf-8').lower()
+        number = self.root if self.root != -1 else self.first_listing
+        while True:
+            chunk = self.get_chunk(number)
+            if chunk[:4] == b'PMGL':
+                for entry in self.iter_listing(chunk):
+                    if entry.name.encode('utf-8').lower() == key:
+                        return entry
+                return None
+            free_space, = struct.unpack_from('<I', chunk, 4)
+            pos = PMGI_HEADER_SIZE
+            child = None
+            while pos < self.chunk_size - free_space:
+                name_length, pos = decode_int(chunk, pos)
+                entry_key = chunk[pos:pos + name_length].lower()
+                child_number, pos = decode_int(chunk, pos + name_length)
+                if entry_key > key:
+                    break
+                child = child_number
+            if child is None:
+                return None
+            number = child
+
+    def read(self, name):
+        """Returns the content of a file (name as in the directory: '/path')"""
+        entry = self.entries[name]
+        if entry.section == SECTION_UNCOMPRESSED:
+            start = self.content_offset + entry.offset
+            return self.data[start:start + entry.length]
+        if self.section1 is None:
+            self.section1 = self.read_lzx_content()
+        return self.section1[entry.offset:entry.offset + entry.length]
+
+    def read_lzx_content(self):
+        """Returns the uncompressed content of the MSCompressed section"""
+        _, signature, version, reset_interval, window_size, windows_per_reset, _ = struct.unpack(
+            '<I4sIIIII', self.read(CONTROL_DATA))
+        if signature != b'LZXC':
+            raise ValueError('Unknown compression')
+        # Frames between two resets of the LZX decoder
+        reset_frames = reset_interval // max(1, window_size // 2) * windows_per_reset
+        reset_table = self.read(RESET_TABLE)
+        _, frames, entry_size, header_size, length, _, _ = struct.unpack_from('<IIIIQQQ', reset_table, 0)
+        offsets = [struct.unpack_from('<Q', reset_table, header_size + i * entry_size)[0] for i in range(frames)]
+        stream = self.read(CONTENT)
+        content = bytearray()
+        for i, offset in enumerate(offsets):
+            words = struct.unpack_from('<HH', stream, offset)
+            bits = (words[0] << 16) | words[1]
+            bits_left = 32
+            if i % reset_frames == 0:
+                bits_left -= 1
+                if bits >> bits_left & 1:
+                    raise ValueError('LZX Intel E8 translation is not supported')
+            block_type = bits >> (bits_left - 3) & 7
+            block_length = bits >> (bits_left - 27) & 0xffffff
+            if block_type != LZX_BLOCKTYPE_UNCOMPRESSED:
+                raise ValueError('LZX compressed blocks are not supported')
+            start = offset + 4 + 12
+            content += stream[start:start + block_length]
+        if len(content) < length:
+            raise ValueError('Invalid LZX content length')
+        return bytes(content[:length])
+
+    def get_system(self):
+        """Returns the #SYSTEM entries {code: data}"""
+        data = self.read('/#SYSTEM')
+        system = {}
+        pos = 4
+        while pos < len(data):
+            code, length = struct.unpack_from('<HH', data, pos)
+            system[code] = data[pos + 4:pos + 4 + length]
+            pos += 4 + length
+        return system
+
+
+def read_project(hhp_file):
+    """Returns the options ({name: value}) and the files of an HTML Help project"""
+    options = {}
+    files = []
+    section = None
+    with open(hhp_file, encoding=DEFAULT_ENCODING, errors='replace') as fo:
+        metrics_.count_read(fo)
+        for line in fo:
+            line = line.strip()
+            if not line or line.startswith(';'):
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                section = line[1:-1].upper()
+            elif section == 'OPTIONS':
+                match = RE_OPTION.match(line)
+                if match:
+                    options[match.group(1).strip()] = match.group(2).strip()
+            elif section == 'FILES':
+                files.append(line.replace('\\', '/'))
+    return options, files
+
+
+def read_sitemap(sitemap_file):
+    """Yields the (name, local) of the items of a sitemap file (HHC or HHK)"""
+    with open(sitemap_file, encoding=DEFAULT_ENCODING, errors='replace') as fo:
+        metrics_.count_read(fo)
+        params = {}
+        for line in fo:
+            for match in RE_SITEMAP_PARAM.finditer(line):
+                params[match.group(1)] = match.group(2)
+            if '</object>' in line.lower():
+                if 'Local' in params:
+                    yield params.get('Name'), params['Local']
+                params = {}
+
+
+def compile_project(hhp_file, manifest=None, timestamp=None):
+    """Compiles an HTML Help project into a CHM file, like hhc.exe. The files of the
+    project are the ones of manifest (FileManifest of the project directory,
+    scanned if not provided). Returns the path of the CHM file."""
+    log = log_.get_logger()
+    options, files = read_project(hhp_file)
+    project_dir = os.path.dirname(os.path.abspath(hhp_file))
+    chm_file = os.path.join(project_dir, options.get('Compiled file', os.path.splitext(hhp_file)[0] + '.chm'))
+    lcid = DEFAULT_LCID
+    match = RE_LANGUAGE.match(options.get('Language', ''))
+    if match:
+        lcid = int(match.group(1), 16)
+    writer = ChmWriter(chm_file, lcid, timestamp=timestamp)
+    contents_file = options.get('Contents file')
+    index_file = options.get('Index file')
+
+    # Topics: the pages of the contents, with their title
+    titles = collections.OrderedDict()
+    if contents_file and os.path.isfile(os.path.join(project_dir, contents_file)):
+        for name, local in read_sitemap(os.path.join(project_dir, contents_file)):
+            titles.setdefault(local.split('#')[0], name)
+
+    # The contents and index files are created after the scan of the project files
+    names = [name for name in (contents_file, index_file) if name and os.path.isfile(os.path.join(project_dir, name))]
+    if manifest is None:
+        manifest = FileManifest.scan(project_dir)
+    # Not compiled: the project files, the outputs of a previous build and the
+    # original Javadoc stylesheet saved by ChmEnv.create_css
+    project_file = os.path.basename(hhp_file)
+    chm_name = os.path.basename(chm_file)
+    excluded = set(names + [project_file, os.path.splitext(project_file)[0] + '.chm', chm_name,
+                            chm_name + const.FINGERPRINT_EXT, options.get('Error log file', const.HHC_LOG),
+                            const.CSS_FILE_NAME + '.bak'])
+    for name in files:
+        if name in excluded:
+            continue
+        if manifest.isfile(name):
+            names.append(name)
+        else:
+            log.warning('File %s not found, skipped' % name)
+    # Like hhc.exe, the files referenced by the pages (stylesheet, images, scripts)
+    # are compiled as well: all the other files of the project directory
+    listed = set(names)
+    names += [name for name in manifest.walk()
+              if name not in listed and name not in excluded and posixpath.basename(name) != const.STAGING_MANIFEST]
+    for name in names:
+        writer.add_file(name, os.path.join(project_dir, name))
+        if os.path.splitext(name)[1].lower() in ('.html', '.htm'):
+            writer.add_topic(name, titles.get(name), name in titles)
+
+    if contents_file:
+        writer.add_system(SYSTEM_CONTENTS_FILE, contents_file)
+    if index_file:
+        writer.add_system(SYSTEM_INDEX_FILE, index_file)
+    writer.add_system(SYSTEM_DEFAULT_TOPIC, options.get('Default topic', ''))
+    writer.add_system(SYSTEM_TITLE, options.get('Title', ''))
+    # LCID, DBCS, full-text search, KLinks, ALinks, time stamp (FILETIME) and two unknown values
+    filetime = (writer.timestamp + 11644473600) * 10000000
+    writer.add_system(SYSTEM_LCID, struct.pack('<IIIIIQII', lcid, 0, 0, 0, 0, filetime, 0, 0))
+    writer.add_system(SYSTEM_COMPILED_FILE, os.path.splitext(os.path.basename(chm_file))[0])
+    writer.add_system(SYSTEM_COMPILER_VERSION, 'jd2chm %s' % const.VERSION)
+    writer.write()
+    return chm_file
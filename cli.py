@@ -7,10 +7,13 @@ import os
 import getopt
 import re
 
+import archive
 import log as log_
 import const
 import core
 import console
+import merge
+import split
 
 logging = log_.get_logging()
 log = log_.get_logger()
@@ -44,13 +47,11 @@ def get_title(index_html):
     """Extracts the default title from the root Javadoc index.html file."""
     log.debug(os.path.abspath(index_html))
     title = 'Javadoc Title'
-    re_title = re.compile(r'<title>\s*([^<]*)\s*</title>')
-    fo = open(index_html)
-    data = fo.read()
-    fo.close()
+    re_title = re.compile(rb'<title>([^<]*)</title>')
+    data = archive.read_file(index_html)
     match = re_title.search(data)
     if match:
-        title = match.group(1)
+        title = core.decode(match.group(1), core.get_charset(data))
         title = title.strip()
     return title
 
@@ -64,32 +65,56 @@ def get_project_name(title):
 
 
 def get_index_html(javadoc_dir):
-    """Checks and returns the index.html path if found. Otherwise returns None."""
+    """Checks and returns the index.html path if found (in a Javadoc directory or
+    archive). Otherwise returns None."""
     if not os.path.exists(javadoc_dir):
         console.print_error(const.NOT_DIR_MESSAGE.format(javadoc_dir))
         return None
 
-    index_html = os.path.join(javadoc_dir, const.INDEX_HTML)
-    if not os.path.exists(index_html):
+    index_html = archive.join(javadoc_dir, const.INDEX_HTML)
+    if not archive.isfile(index_html):
         console.print_error(const.NOT_JAVADOC_DIR_MESSAGE.format(javadoc_dir, index_html))
         return None
     return index_html
 
 
+def remove_chm(chm_file):
+    """Removes the CHM file of a previous build, waiting for the user to close it
+    if it is open."""
+    if os.path.exists(chm_file):
+        while 1:
+            try:
+                os.unlink(chm_file)
+                break
+            except OSError:
+                # TODO: this will have to be handled differently via the GUI (not with a raw input...)
+                log.warning("The file %s is open" % chm_file)
+                print("\nThe file %s is open" % chm_file)
+                print("Close the corresponding Window and type any key")
+                input()
+
+
 def main(args):
     welcome()
 
     # Arguments processing
     try:
-        opts, args = getopt.getopt(args, "hclvp:o:t:")
+        opts, args = getopt.getopt(args, "hclvip:o:t:j:s:", ["jobs=", "staging=", "incremental", "compiler=", "metrics=",
+                                                         "verify-toc", "split="])
     except getopt.GetoptError:
         usage()
         sys.exit(2)
 
     project_name = None
     project_title = None
-    start_dir = os.getcwd()
-    javadoc_dir = '.'
+    javadoc_dirs = []
+    jobs = const.JOBS
+    staging_mode = const.STAGING
+    incremental = const.INCREMENTAL
+    compiler = const.COMPILER
+    metrics_file = None
+    verify_toc = const.VERIFY_TOC
+    split_parts = const.SPLIT
 
     for o, a in opts:
         if o == "-h":
@@ -111,20 +136,64 @@ def main(args):
             # Title that will show up as the title of the CHM Window
             project_title = a
         if o == "-p":
-            # Path containing a Javadoc documentation (there should be an index.html in that path)
-            javadoc_dir = a
+            # Path containing a Javadoc documentation (there should be an index.html in that path).
+            # Several paths are merged into one CHM file.
+            javadoc_dirs.append(a)
+        if o in ("-j", "--jobs"):
+            # Number of worker processes (0: one per core)
+            try:
+                jobs = int(a)
+            except ValueError:
+                usage()
+                sys.exit(2)
+        if o in ("-s", "--staging"):
+            # Staging of the Javadoc files: copy or link
+            if a not in (const.STAGING_COPY, const.STAGING_LINK):
+                usage()
+                sys.exit(2)
+            staging_mode = a
+        if o in ("-i", "--incremental"):
+            # Only process the files changed since the previous build
+            incremental = 1
+        if o == "--compiler":
+            # Compiler of the CHM file: hhc or internal
+            if a not in (const.COMPILER_HHC, const.COMPILER_INTERNAL):
+                usage()
+                sys.exit(2)
+            compiler = a
+        if o == "--metrics":
+            # JSON report of the build stages
+            metrics_file = os.path.abspath(a)
+        if o == "--verify-toc":
+            # Checks the TOC built from the search index against the class pages
+            verify_toc = 1
+        if o == "--split":
+            # Number of sub-projects of a split build (master CHM file merging their CHM files)
+            try:
+                split_parts = int(a)
+            except ValueError:
+                usage()
+                sys.exit(2)
         if o == "-v":
             # verbose (debug = level)
             logging.set_level(logging.DEBUG)
 
     log.debug(args)
-    index_html = get_index_html(javadoc_dir)
-    if not index_html:
+    if not javadoc_dirs:
+        javadoc_dirs = ['.']
+    index_htmls = [get_index_html(javadoc_dir) for javadoc_dir in javadoc_dirs]
+    if not all(index_htmls):
         sys.exit(1)
+    javadoc_dir = javadoc_dirs[0]
+    titles = [get_title(index_html) for index_html in index_htmls] if len(javadoc_dirs) > 1 else None
+    if titles and split_parts:
+        # A split build is made of one Javadoc
+        usage()
+        sys.exit(2)
 
     if not project_title:
         try:
-            title = get_title(index_html)
+            title = ' + '.join(titles) if titles else get_title(index_htmls[0])
             print("The title will be assign to the CHM window")
             project_title = input("Enter the project title [%s]: " % title)
             if not project_title:
@@ -150,21 +219,31 @@ def main(args):
     log.info("Project: %s" % project_name)
     log.info("Title: %s" % project_title)
 
-    log.debug("javadoc_dir: {}".format(javadoc_dir))
-    os.chdir(javadoc_dir)
-
-    # Prepare Environment
-    env = core.ChmEnv()
-    env.prepare_env(project_name, javadoc_dir)
+    log.debug("javadoc_dirs: {}".format(javadoc_dirs))
 
-    # Create HTML help files
-    project = core.ChmProject()
-    project.create_project(project_name, project_title)
+    # The CHM file is written into the (first) Javadoc directory (or the directory of the archive)
+    remove_chm(os.path.join(core.get_output_dir(javadoc_dir), '%s.chm' % project_name))
 
-    # Generate the CHM and clean-up
-    env.make()
+    # Stage the files, create the HTML help files, generate the CHM and clean-up
+    try:
+        if titles:
+            result = merge.build(merge.get_libraries(javadoc_dirs, titles), project_name, project_title, jobs=jobs,
+                                 staging_mode=staging_mode, incremental=incremental, compiler=compiler,
+                                 verify_toc=verify_toc)
+        elif split_parts:
+            result = split.build(javadoc_dir, project_name, project_title, split_parts, jobs=jobs,
+                                 staging_mode=staging_mode, incremental=incremental, compiler=compiler,
+                                 verify_toc=verify_toc)
+        else:
+            result = core.build(javadoc_dir, project_name, project_title, jobs=jobs, staging_mode=staging_mode,
+                                incremental=incremental, compiler=compiler, verify_toc=verify_toc)
+    except PermissionError as pe:
+        print(pe)
+        sys.exit(4)
 
     # End
     log.info('Compilation completed')
-    os.chdir(start_dir)
+    if metrics_file:
+        result.metrics.write(metrics_file)
+        log.info('Build metrics written to %s' % metrics_file)
     thanks()
@@ -3,7 +3,13 @@ Exposes methods to change the color of the output in a console (Windows specific
 """
 import collections
 import shutil
-from ctypes import windll, Structure, c_short, c_ushort, byref
+from ctypes import Structure, c_short, c_ushort, byref
+
+try:
+    from ctypes import windll
+except ImportError:
+    # Not on Windows: the colors are not supported
+    windll = None
 
 DEFAULT_TERM_WIDTH = 80
 DEFAULT_TERM_HEIGHT = 40
@@ -71,9 +77,20 @@ DefaultColors = collections.namedtuple('DefaultColors', ['colors', 'foreground',
 BRIGHT = True
 default_colors = None
 
-h_stdout = windll.kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
-SetConsoleTextAttribute = windll.kernel32.SetConsoleTextAttribute
-GetConsoleScreenBufferInfo = windll.kernel32.GetConsoleScreenBufferInfo
+if windll:
+    h_stdout = windll.kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
+    SetConsoleTextAttribute = windll.kernel32.SetConsoleTextAttribute
+    GetConsoleScreenBufferInfo = windll.kernel32.GetConsoleScreenBufferInfo
+else:
+    h_stdout = None
+
+    def SetConsoleTextAttribute(handle, attributes):
+        """No console attributes outside of Windows."""
+        return 0
+
+    def GetConsoleScreenBufferInfo(handle, csbi):
+        """No console attributes outside of Windows (csbi is left empty)."""
+        return 0
 
 
 def default():
@@ -3,19 +3,97 @@
 # Set to 1 uses a custom CSS. If 0, uses the default Javadoc CSS (recommended)
 CUSTOM_CSS = 0
 
-# Reuse temp file (mostly for development or to avoid copying large Javadoc like the JDK API
-REUSE_TEMP_FILES = 0
+# Incremental build: reuses the temporary directory of the previous build and
+# only syncs the files added, changed or deleted (checked against a manifest)
+INCREMENTAL = 0
+
+# Javadoc version (1.8 is 8) from which the method URL's never have spaces: the
+# clean-up of the HTML files is disabled (see core.get_doclet_version)
+CLEAN_UP_MAX_VERSION = 8
+
+# The Javadoc pages are parsed as bytes: only the titles and URL's extracted are
+# decoded, with the charset of the page (<meta charset>, searched in the first
+# CHARSET_SCAN_SIZE bytes), DEFAULT_CHARSET if not declared
+DEFAULT_CHARSET = "utf-8"
+CHARSET_SCAN_SIZE = 8192
+
+# Code page of the project files (HHP, HHC and HHK): the Windows code page of the
+# Language of FORMAT_PROJECT (0x409). In the HHC and HHK files, the characters
+# out of the code page are written as character references (&#...;).
+PROJECT_ENCODING = "cp1252"
+# The project files are encoded by blocks of PROJECT_WRITE_BLOCK_SIZE characters
+PROJECT_WRITE_BLOCK_SIZE = 1 << 16
+
+# Set to 1 to check the TOC built from the search index against the class pages
+# (the pages are read only to find the anchors of the members)
+VERIFY_TOC = 0
+
+# Manifest of the source files in the temporary directory (incremental build)
+STAGING_MANIFEST = ".jd2chm-manifest.json"
+STAGING_MANIFEST_VERSION = 1
+# Fingerprint of the inputs of the compiler, next to the CHM file in the working
+# directory (incremental build): the CHM file is reused if they are unchanged
+FINGERPRINT_EXT = ".fingerprint"
+# Error log file of the HTML Help compiler (see FORMAT_PROJECT)
+HHC_LOG = "hhc.log"
+HASH_BLOCK_SIZE = 1 << 20
+
+# Path of a member of a Javadoc archive (see archive): archive path, separator,
+# path relative to the Javadoc root
+ARCHIVE_SEPARATOR = "!/"
+# Metadata directory of a jar, not part of the Javadoc
+META_INF = "META-INF"
+
+# Resources read and written by the build stages (see taskgraph): the stages that
+# don't conflict on a resource run concurrently
+RESOURCE_JAVADOC = "javadoc"  # Javadoc directory
+RESOURCE_STAGED = "staged"  # Working directory and its manifest
+RESOURCE_HHP = "hhp"
+RESOURCE_HHC = "hhc"
+RESOURCE_HHK = "hhk"
+RESOURCE_CHM = "chm"
 
 MAX_SIZE_KEYWORD = 300
 
+# The entries of the HHK index are sorted by runs of INDEX_RUN_SIZE entries in
+# memory, the other runs being spilled to temporary files (see extsort), by
+# blocks of RUN_BLOCK_SIZE entries
+INDEX_RUN_SIZE = 200000
+RUN_BLOCK_SIZE = 1024
+
+# Maximum number of class pages (inner classes and methods) kept in memory while
+# building the contents file
+CLASS_PAGE_CACHE_SIZE = 4096
+
+# Maximum number of package TOC fragments in flight per job (parallel HHC build)
+TOC_FRAGMENTS_PER_JOB = 2
+
+# Staging of the Javadoc files into the temporary directory: full copy, or
+# reflinks/hard links (a file is copied only when jd2chm modifies it)
+STAGING_COPY = "copy"
+STAGING_LINK = "link"
+STAGING = STAGING_COPY
+
+# Number of worker processes used by the parallel stages (0: one per core)
+JOBS = 0
+
+# Split build (see split): number of sub-projects (0: no split) and name of the
+# sub-projects (project name, number of the part)
+SPLIT = 0
+SPLIT_PART_NAME = "%s_%d"
+
 # jd2chm version
 VERSION = "1.0.0b1"
 
 # Temporary working directory
 WORKING_DIR = "jd2chm"
 
-# Uses the HTML Help compiler installed via HTML Help Workshop (default)
-EXTERNAL_COMPILER = 1
+# Compiler of the CHM file: the HTML Help compiler installed via HTML Help
+# Workshop (hhc.exe, Windows only), or the internal CHM writer (module chm).
+# The internal compiler is used if hhc.exe is not found.
+COMPILER_HHC = "hhc"
+COMPILER_INTERNAL = "internal"
+COMPILER = COMPILER_HHC
 
 HTML_HELP_WSHOP_KEY = r"Software\Microsoft\HTML Help Workshop"
 
@@ -42,17 +120,50 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE."""
 
 USAGE = r"""Usage:
 
-  jd2chm [ -h | -c | -l | [-p path] [-o output] [-t title] [-v] ]
+  jd2chm [ -h | -c | -l | [-p path] [-o output] [-t title] [-j jobs] [-s mode] [-i] [-v] [--compiler name] [--metrics file] [--verify-toc] [--split parts] ]
 
   -h: Displays usage.
   -c: Checks if the HHC compiler is installed.
   -l: Displays license.
   -v: Verbose (displays debug information)
+  -i, --incremental:
+      Incremental build: only the files changed since the previous
+      build of the project are staged and processed. The compiler
+      is not run if its inputs are unchanged.
   -p path:   'path' is the path of a  directory containing a Javadoc
-             documentation (default: current directory).
+             documentation, or of a Javadoc archive (-javadoc.jar or
+             zip, read without extracting it) (default: current
+             directory). Repeated, merges the Javadoc sets into one CHM
+             file: a book per Javadoc in the contents, and one index.
   -o output: base name of the CHM output file
              Ex: -o 'product' will result in a CHM file named 'product.chm'.
   -t title:  Assign 'title' as the title of the project.
+  -j jobs, --jobs jobs:
+             Number of worker processes used to process the Javadoc
+             files (default: number of cores).
+  -s mode, --staging mode:
+             'copy' copies the Javadoc files into the working directory,
+             'link' stages them as reflinks or hard links, which only
+             copies the files modified by jd2chm (default: copy).
+  --compiler name:
+             'hhc' compiles the CHM file with the Microsoft HTML Help
+             compiler (Windows only), 'internal' with the jd2chm CHM
+             writer, available on any platform (default: hhc, or
+             internal if the HTML Help compiler is not found).
+  --metrics file:
+             Writes a JSON report of the build stages into 'file': wall
+             and CPU time, files and bytes read/written, HTML files
+             skipped by the clean-up and regex matches of each stage,
+             the peak memory of the build and the critical path of the
+             stages.
+  --verify-toc:
+             With a Javadoc 9+, the TOC is built from the search index
+             without reading the class pages. Checks the anchors of the
+             members in the class pages (warnings if not found).
+  --split parts:
+             Splits a large Javadoc into 'parts' CHM files (packages
+             balanced by size), compiled concurrently, and a master
+             CHM file merging their contents (modular HTML Help).
 
 Notes:
 - The user is prompted if the output and document title are not
@@ -69,6 +180,9 @@ jd2chm.py -p C:\beanshell\javadoc -o bsh20b4 -t "Beanshell 2.0b4" -v
 
 jd2chm.py -p C:\j2se\docs\api -o j2se142_02 -t "Java(TM) 2 SDK 1.4.2"
 
+jd2chm.py -p C:\guava\apidocs -p C:\commons-lang\apidocs -o libs -t "Libraries"
+  The two Javadoc sets are merged into libs.chm.
+
 jd2chm.py -o jython21 -t "Jython 2.1"
   The Javadoc is assumed to be in the current directory.
 
@@ -100,6 +214,13 @@ INDEX_DIR = "index-files"     # Either a directory with splitted index files
 INDEX_ALL = "index-all.html"  # or one unique index file
 ABOUT_FILE = "about.html"     # About file generated by jd2chm
 PACKAGE_LIST = "package-list" # Raw list of the packages
+ELEMENT_LIST = "element-list" # Raw list of the modules and packages (Javadoc 10+)
+ALL_CLASSES = ["allclasses-noframe.html", "allclasses-index.html"]  # All classes page (Javadoc 11+)
+# Search index of the Javadoc 9+ (.js), or zipped .json with Javadoc 9 and 10
+PACKAGE_SEARCH_INDEX = "package-search-index"
+TYPE_SEARCH_INDEX = "type-search-index"
+MEMBER_SEARCH_INDEX = "member-search-index"
+UNNAMED_PACKAGE = "<Unnamed>"
 
 DEFAULT_TERM_WIDTH = 80
 DEFAULT_TERM_HEIGHT = 40
@@ -119,14 +240,14 @@ http://www.burgaud.com/
 
 FORMAT_PROJECT = """[OPTIONS]
 Compatibility=1.1 or later
-Binary TOC=Yes
-Binary Index=Yes
+Binary TOC=%s
+Binary Index=%s
 Compiled file=%s.chm
 Contents file=%s.hhc
 Index file=%s.hhk
 Default Window=main
 Default topic=%s
-Error log file=hhc.log
+Error log file=%s
 Display compile progress=Yes
 Display compile notes=No
 Full-text search=Yes
@@ -193,6 +314,12 @@ FORMAT_CONTENT_CLASS_ITEM = """<li><object type="text/sitemap">
 </object>
 """
 
+# Contents of a CHM file merged at run time (listed in [MERGE FILES], see core.Hhp)
+FORMAT_CONTENT_MERGE_ITEM = """<li><object type="text/sitemap">
+  <param name="Merge" value="%s::/%s">
+</object>
+"""
+
 FORMAT_CONTENT_METHOD_ITEM = """<li><object type="text/sitemap">
   <param name="Name" value="%s">
   <param name="Local" value="%s">
@@ -4,98 +4,242 @@ files and initiate the hhc compilation."""
 import sys
 import re
 import os
+import codecs
+import collections
+import functools
+import hashlib
+import html
+import io
+import mmap
 import shutil
+import subprocess
 import time
 import tempfile
 import urllib
 import urllib.parse
-import win32api
-import win32con
-import pywintypes
+try:
+    import win32api
+    import win32con
+    import pywintypes
+except ImportError:
+    # pywin32 is only available on Windows, where the HTML Help compiler runs
+    win32api = None
 
+import archive
+import chm
 import const
+import extsort
+import metrics as metrics_
+import parallel
+import searchindex
+import staging
+import taskgraph
 import log as log_
+from manifest import FileManifest
+
+# Regex used to clean-up the URL's of the methods (link and anchor)
+# TODO: this regex is not working with recent Javadoc. Revisit the cleanup concept
+RE_METHOD_URL = re.compile(rb'<td><code><b><a\s+href="([^"]*)">')
+RE_BOOKMARK = re.compile(rb'<a name="([^"]*)">')
+# Pages of the frames of index.html (see read_index_frames)
+RE_FRAME_SRC = re.compile(rb'^<frame src="([^"]*)"')
+# Charset of a page: <meta charset="..."> or <meta http-equiv="Content-Type" content="text/html; charset=...">
+RE_CHARSET = re.compile(rb'<meta\s[^>]*charset\s*=\s*["\']?([-\w.:]+)', re.I)
+# Prefix "../" of the relative URL's (group 2 is the URL without the prefix)
+RE_PARENT_PREFIX = re.compile(r'(\.\./)*(.*)')
+# Fast check of a whole file (bytes) before the clean-up: one of the markers of
+# the lines above, and an attribute value ending with ')' that has a space
+CLEAN_UP_MARKERS = (b'<a name="', b'<td><code><b><a')
+RE_UNQUOTED_METHOD = re.compile(rb'"[^" ]* [^"]*\)"')
+# Version of the Javadoc in the comment of index.html (1.6: build 1.6.0_45, 1.7: version 1.7.0_80)
+RE_DOCLET_VERSION = re.compile(rb'<!-- Generated by javadoc \((?:build |version )?(\d+)(?:\.(\d+))?')
+
+# Inner classes (href, title) and methods (name, href) extracted from a class page
+ClassPage = collections.namedtuple('ClassPage', ['inners', 'methods'])
+
+# Result of a build: path of the CHM file (None if not generated), working
+# directory (None if removed) and metrics.Metrics of the stages
+BuildResult = collections.namedtuple('BuildResult', ['chm_file', 'project_name', 'work_dir', 'metrics'])
+
+
+class ProjectFile:
+    """Text file in the code page of the project (HHP, HHC, HHK). The writes are
+    encoded by blocks: unlike UTF-8, the codecs of the Windows code pages encode
+    each write separately, which is slow with the many small writes of the
+    project files."""
+
+    def __init__(self, path, errors='xmlcharrefreplace'):
+        self.fo = open(path, 'w', encoding=const.PROJECT_ENCODING, errors=errors)
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= const.PROJECT_WRITE_BLOCK_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.fo.write(''.join(self.parts))
+        self.parts = []
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.fo.close()
 
 
 class Hhp:
     """Creates the HTML Help Project file (HHP file)
     """
 
-    def __init__(self, project_name, project_title, default_file):
+    def __init__(self, project_name, project_title, default_file, manifest, root='.', skip=(const.INDEX_DIR,),
+                 merge_files=(), binary=True, log_file=const.HHC_LOG):
         self.project_name = project_name
         self.project_title = project_title
         self.default_file = default_file
+        self.manifest = manifest
+        self.root = root
+        # Directories not listed in the file section (split index files)
+        self.skip = skip
+        # CHM files merged at run time (modular help, see split): the TOC and the
+        # index of the project are then not binary (not merged by the viewer)
+        self.merge_files = merge_files
+        self.binary = binary
+        self.log_file = log_file
         self.log = log_.get_logger()
         self.hhp_file = None
+        self.cpt = 0
 
     def create_hhp(self):
-        hhp_file_name = self.project_name + ".hhp"
-        self.hhp_file = open(hhp_file_name, 'w')
+        hhp_file_name = os.path.join(self.root, self.project_name + ".hhp")
+        staging.unshare(hhp_file_name)
+        # Not an HTML file: the characters out of the code page are replaced
+        self.hhp_file = ProjectFile(hhp_file_name, errors='replace')
 
         # Create the project file: .HHP
-        self.hhp_file.write(
-            const.FORMAT_PROJECT % (self.project_name,   # chm name
-                                    self.project_name,   # hhc name (contents)
-                                    self.project_name,   # hhk name (index)
-                                    self.default_file,   # default topic
-                                    self.project_title,  # project title
-                                    self.project_title,  # main wnd title
-                                    self.project_name,   # hhc for wnd
-                                    self.project_name,   # hhk for wnd
-                                    self.default_file,   # default topic for wnd
-                                    self.default_file)   # home topic for wnd
-        )
+        self.hhp_file.write(self.get_header())
         self.create_file_section()
+        if self.merge_files:
+            self.hhp_file.write('\n[MERGE FILES]\n')
+            for chm_file in self.merge_files:
+                self.hhp_file.write(chm_file + '\n')
         self.hhp_file.close()
+        metrics_.count_written(hhp_file_name)
+
+    def get_header(self):
+        binary = 'Yes' if self.binary else 'No'
+        return const.FORMAT_PROJECT % (binary,              # binary TOC
+                                       binary,              # binary index
+                                       self.project_name,   # chm name
+                                       self.project_name,   # hhc name (contents)
+                                       self.project_name,   # hhk name (index)
+                                       self.default_file,   # default topic
+                                       self.log_file,       # error log file
+                                       self.project_title,  # project title
+                                       self.project_title,  # main wnd title
+                                       self.project_name,   # hhc for wnd
+                                       self.project_name,   # hhk for wnd
+                                       self.default_file,   # default topic for wnd
+                                       self.default_file)   # home topic for wnd
+
+    def has_header(self):
+        """Checks if the existing project file starts with the expected header
+        (same project name, title and default topic)"""
+        # As written (see create_hhp)
+        header = self.get_header().encode(const.PROJECT_ENCODING, 'replace').decode(const.PROJECT_ENCODING)
+        try:
+            with open(os.path.join(self.root, self.project_name + ".hhp"), encoding=const.PROJECT_ENCODING) as fo:
+                return fo.read(len(header)) == header
+        except OSError:
+            return False
 
     def create_file_section(self):
-        """Parses the directory tree to collect the HTML files"""
-        walktree(".", self.write_file_section)
+        """Collects the HTML files from the manifest of the directory tree"""
+        for folder in self.skip:
+            if self.manifest.isdir(folder):
+                self.log.debug("Skipping %s" % folder)
+        # Sorted: the scan order depends on the file system
+        for rel_path in sorted(self.manifest.walk(skip=self.skip)):
+            self.cpt = print_dot(self.cpt)
+            self.write_file_section(rel_path)
         print()  # Carriage return after the dots...
 
     def write_file_section(self, html_file_path):
-        """Writes only if '.html' files.
-        Doesn't write the './' at the beginning of the path"""
+        """Writes only if '.html' files."""
         if html_file_path[html_file_path.rfind('.'):] == '.html':
-            self.hhp_file.write(html_file_path[2:] + '\n')
+            self.hhp_file.write(html_file_path + '\n')
 
 
 class Hhc:
     """Creates the contents file (HHC file)
     """
 
-    def __init__(self, project_name, content_file, default_file):
+    def __init__(self, project_name, content_file, default_file, manifest, jobs=const.JOBS,
+                 verify=const.VERIFY_TOC, root='.'):
         self.cpt = 0
         self.hhc_file_name = project_name + ".hhc"
         self.content_file = content_file
         self.default_file = default_file
+        self.manifest = manifest
+        self.jobs = jobs
+        self.verify = verify
+        self.root = root
         self.log = log_.get_logger()
-        # Regex to extract href and title for a book topic
-        self.re_anchor_book = re.compile(r'^<li><a\shref="([^"]*)".*>(.*)</a></li>', re.I)
+        # The pages are scanned as bytes, only the groups are decoded (see get_charset).
+        # The regex's below don't backtrack: no two parts of a pattern can match the
+        # same characters, and a match never spans several cells (<td>) or entries,
+        # therefore the time is linear in the size of a line or a page.
+        # Regex to extract href and title for a book topic (the title can be in tags)
+        self.re_anchor_book = re.compile(rb'^<li><a\shref="([^"]*)"[^<>]*>(?:<[^/<>][^<>]*>)*([^<]*)(?:</[^<>]*>)*'
+                                         rb'</a></li>', re.I)
         # Capture 3 groups if interface. Group 1 = url to class/interface. Group 2 flags if interface. Group 3 = title.
-        self.re_anchor_page = re.compile(r'^<li><a href="([^"]*)"[^<]*>([^>]*>)?([^>]*)(?:</span>)?</a></li>', re.I)
+        self.re_anchor_page = re.compile(rb'^<li><a href="([^"]*)"[^<>]*>(<[^<>]*>)?([^<>]*)(?:</span>)?</a></li>',
+                                         re.I)
         # Regex to extract the url from the prefix "../"
-        self.re_href = re.compile(r'(../)*(.*)')
-        # Regex to extract inner class from class html file
-        self.re_inner = re.compile(r'<td>.*<a\s+href="([^"]*)"[^>]*>([^<]*)</a></b></code>', re.I)
+        self.re_href = RE_PARENT_PREFIX
+        # Regex to extract inner class from class html file: the tags of the cell
+        # before the link are skipped, up to the next cell or the end of the line
+        self.re_inner = re.compile(rb'<td>[^<\n]*(?:<(?!a\s|/?td[\s>])[^<\n]*)*'
+                                   rb'<a\s+href="([^"]*)"[^>]*>([^<]*)</a></b></code>', re.I)
         # Regex to extract methods from class html file
-        self.re_method = re.compile(r'<td><code><b><a\s+href="([^"]*)">([^<]*)</a></b>(\([^)]*\))?</code>', re.I)
-        # Regex to extract the type and the variable of an 'anchored' argument
-        self.re_args = re.compile(r'<a\s+href=[^>]*>([^<]*)</a>(.*;.*)', re.I)
+        self.re_method = re.compile(rb'<td><code><b><a\s+href="([^"]*)">([^<]*)</a></b>(\([^)]*\))?</code>', re.I)
+        # Regex to extract the type and the variable of an 'anchored' argument (decoded)
+        self.re_args = re.compile(r'<a\s+href=[^>]*>([^<]*)</a>([^;]*;.*)', re.I)
+        # Regex to extract the anchors of a class page (verification of the TOC)
+        self.re_anchor = re.compile(rb'<a\s+(?:name|id)="([^"]*)"|\sid="([^"]*)"', re.I)
+        self.missing_anchors = 0
         self.hhc_file = None
+        # Time written into the header (default: see get_build_time)
+        self.build_time = None
+        # Class pages (inners and methods) cached by path
+        self.class_pages = functools.lru_cache(maxsize=const.CLASS_PAGE_CACHE_SIZE)(self.read_class_page)
 
     def create_hhc(self):
-        self.hhc_file = open(self.hhc_file_name, 'w')
-        str_time = time.strftime("%B-%d-%Y", time.localtime(time.time()))
+        hhc_file_name = os.path.join(self.root, self.hhc_file_name)
+        staging.unshare(hhc_file_name)
+        self.hhc_file = ProjectFile(hhc_file_name)
+        build_time = get_build_time(self.manifest) if self.build_time is None else self.build_time
+        str_time = time.strftime("%B-%d-%Y", time.gmtime(build_time))
         self.hhc_file.write(const.FORMAT_TOC_HEADER % str_time)
         self.hhc_file.write('<ul>\n')
-        if os.path.exists(self.default_file):
-            title = "Overview"
-            self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (self.default_file, title))
-        if os.path.exists(const.OVERVIEW_TREE):
-            title = "Hierarchy For All Packages"
-            self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (const.OVERVIEW_TREE, title))
-        if self.content_file == const.JDK_BOOK_FILE:
+        self.write_contents()
+        self.hhc_file.write('</ul>\n</body>\n</html>\n')
+        self.hhc_file.close()
+        metrics_.count_written(hhc_file_name)
+        cache_info = self.class_pages.cache_info()
+        self.log.debug('Class pages cache: %d hits, %d misses (%d/%d pages)' % (cache_info.hits, cache_info.misses,
+                                                                                cache_info.currsize,
+                                                                                cache_info.maxsize))
+
+    def write_contents(self):
+        """Writes the items of the contents into self.hhc_file (without the header of
+        the HHC file)"""
+        self.write_overview()
+        if searchindex.has_search_index(self.manifest):
+            # Javadoc 9+: packages, types and members from the package list and the search index
+            self.create_search_packages()
+        elif self.content_file == const.JDK_BOOK_FILE:
             # Content file is "overview-frame.html"
             self.create_packages(self.content_file)
         else:
@@ -103,28 +247,122 @@ class Hhc:
             # self.hhc_file.write(const.FORMAT_ALLCLASSES_CONTENT_ITEM % self.default_file)
             self.hhc_file.write(const.FORMAT_ALLCLASSES_CONTENT_ITEM)
             html_class = "allclasses-frame.html"
-            if os.path.exists(html_class):
+            if self.manifest.exists(html_class):
                 self.hhc_file.write('<ul>\n')
                 self.create_classes('', html_class, "All Classes")
                 self.hhc_file.write('</ul>\n')
-        self.hhc_file.write('</ul>\n</body>\n</html>\n')
-        self.hhc_file.close()
+
+    def write_overview(self):
+        """Writes the overview and the hierarchy of all the packages"""
+        if self.manifest.exists(self.default_file):
+            title = "Overview"
+            self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (self.default_file, title))
+        if self.manifest.exists(const.OVERVIEW_TREE):
+            title = "Hierarchy For All Packages"
+            self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (const.OVERVIEW_TREE, title))
+
+    def create_search_packages(self):
+        """Writes the package books from the package list and the search index.
+
+        No class page is read, unless the TOC is verified (see self.verify).
+        """
+        index = searchindex.SearchIndex(self.manifest, self.root)
+        self.missing_anchors = 0
+        all_classes = [name for name in const.ALL_CLASSES if self.manifest.exists(name)]
+        if all_classes:
+            self.hhc_file.write(const.FORMAT_CONTENT_BOOK_ITEM % ("All Classes", all_classes[0]))
+            self.hhc_file.write('<ul>\n')
+            for record in index.get_all_types():
+                self.create_search_type(index, record, record['l'])
+            self.hhc_file.write('</ul>\n')
+        for package in index.get_packages():
+            path = index.get_prefix(package).rstrip('/')
+            html_package = index.get_prefix(package) + const.PACKAGE_SUMMARY
+            if not self.manifest.exists(html_package):
+                continue
+            self.hhc_file.write(const.FORMAT_CONTENT_BOOK_ITEM % (html.escape(package), html_package))
+            self.hhc_file.write('<ul>\n')
+            self.create_package_pages(path, package)
+            for record in index.get_types(package):
+                self.create_search_type(index, record, record['l'])
+            self.hhc_file.write('</ul>\n')
+        if self.verify:
+            self.log.info('TOC verified: %d missing anchors' % self.missing_anchors)
+
+    def create_search_type(self, index, record, title):
+        """Writes a type of the search index, its nested types and its members"""
+        self.cpt = print_dot(self.cpt)
+        href = index.type_url(record)
+        # The labels of the search index are plain text (generics: 'addAll(int, Collection<? extends E>)')
+        self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (href, html.escape(title)))
+        if not self.manifest.exists(href):
+            return
+        self.hhc_file.write('<ul>\n')
+        for inner in index.get_inners(record):
+            self.create_search_type(index, inner, inner['l'].rpartition('.')[2])
+        members = [(html.escape(get_member_title(member['l'])), quote_method(index.member_url(member)))
+                   for member in index.get_members(record)]
+        for name, member_href in members:
+            self.hhc_file.write(const.FORMAT_CONTENT_METHOD_ITEM % (name, member_href))
+        self.hhc_file.write('</ul>\n')
+        if self.verify:
+            self.verify_members(href, [member_href for name, member_href in members])
+
+    def verify_members(self, html_class, hrefs):
+        """Checks that the anchors of the members (hrefs) are found in the class page"""
+        fd = open(os.path.join(self.root, html_class), 'rb')
+        data = fd.read()
+        metrics_.count_read(fd)
+        fd.close()
+        charset = get_charset(data)
+        anchors = set()
+        for match in self.re_anchor.finditer(data):
+            metrics_.count(regex_matches=1)
+            anchors.add(decode(match.group(1) or match.group(2), charset))
+        for href in hrefs:
+            anchor = href.partition('#')[2]
+            if anchor not in anchors and urllib.parse.unquote(anchor) not in anchors:
+                self.missing_anchors += 1
+                self.log.warning('%s: anchor not found' % href)
 
     def create_packages(self, html_file):
-        """Parses overview-frame.html file"""
+        """Parses overview-frame.html file.
+
+        The packages are independent: with more than one job, the TOC fragment of
+        each package (book, classes, inners and methods) is built in a pool of
+        processes and the fragments are written in the order of overview-frame.html.
+        """
+        books = list(self.iter_books(html_file))
+        jobs = parallel.get_jobs(self.jobs)
+        if jobs == 1 or len(books) < 2:
+            for book in books:
+                self.create_package(*book)
+            return
+        fragments = parallel.imap_ordered(create_package_fragment, books, jobs,
+                                          initializer=init_package_worker,
+                                          initargs=(self.content_file, self.default_file, self.manifest, self.root),
+                                          window=jobs * const.TOC_FRAGMENTS_PER_JOB)
+        for fragment in fragments:
+            self.hhc_file.write(fragment)
+
+    def iter_books(self, html_file):
+        """Yields the (title, html_package, path, html_class) of the books listed in
+        overview-frame.html"""
         self.log.debug(html_file)
-        fd = open(html_file)
-        lines = fd.readlines()
+        fd = open(os.path.join(self.root, html_file), 'rb')
+        data = fd.read()
+        metrics_.count_read(fd)
         fd.close()
+        charset = get_charset(data)
         # href = None
         title = None
         html_class = ''
         html_package = ''
-        for line in lines:
+        for line in data.splitlines():
             res = self.re_anchor_book.search(line)
             if res:
                 # href = res.group(1)
-                title = res.group(2)
+                title = decode(res.group(2), charset)
                 if title != "All Classes":
                     # The book is associated with the package info (package-summary)
                     path = title.replace('.', '/')
@@ -143,62 +381,88 @@ class Hhc:
                     html_package = "allclasses-noframe.html"
                     path = ''  # Current path
                     html_class = "allclasses-frame.html"  # file that will be parsed to generate content topics
-                if os.path.exists(html_class):
-                    self.hhc_file.write(const.FORMAT_CONTENT_BOOK_ITEM % (title, html_package))
-                    self.hhc_file.write('<ul>\n')
-                    self.create_classes(path, html_class, title)
-                    self.hhc_file.write('</ul>\n')
+                if self.manifest.exists(html_class):
+                    yield title, html_package, path, html_class
 
-    def create_inners(self, html_class):
-        fd = open(html_class)
+    def create_package(self, title, html_package, path, html_class):
+        self.hhc_file.write(const.FORMAT_CONTENT_BOOK_ITEM % (title, html_package))
+        self.hhc_file.write('<ul>\n')
+        self.create_classes(path, html_class, title)
+        self.hhc_file.write('</ul>\n')
+
+    def read_class_page(self, html_class):
+        """Reads a class HTML file once and extracts its inner classes and its methods.
+
+        The class pages are cached (see self.class_pages) as a page can be visited from
+        the package, from the All Classes book and as an inner class.
+        """
+        fd = open(os.path.join(self.root, html_class), 'rb')
         data = fd.read()
+        metrics_.count_read(fd)
         fd.close()
-        iteration = re.finditer(self.re_inner, data)
-        if iteration:
-            for match in iteration:
-                href = match.group(1)
-                title = match.group(2)
-                try:
-                    (clazz, inner) = title.split('.')
-                except ValueError:
-                    # This is a method (not an inner class or interface)
-                    continue
-                title = inner  # Keeps only the inner class name. Will be shown as a child of the class
-                res = self.re_href.search(href)  # removes the prefix ../..
-                if res:
-                    href = res.group(2)
-                self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (href, title))
-                if (os.path.exists(href)):
-                    # We do not build the method level for the All Class book
-                    self.hhc_file.write('<ul>\n')
-                    self.create_methods(href)
-                    self.hhc_file.write('</ul>\n')
+        charset = get_charset(data)
+        return ClassPage(self.extract_inners(data, charset), self.extract_methods(data, charset))
 
-    def create_classes(self, path, html_file, package_name):
-        """Parses package-frame.html file"""
+    def extract_inners(self, data, charset=const.DEFAULT_CHARSET):
+        """Returns the (href, title) of the inner classes found in a class page (bytes)"""
+        inners = []
+        for match in self.re_inner.finditer(data):
+            metrics_.count(regex_matches=1)
+            href = decode(match.group(1), charset)
+            title = decode(match.group(2), charset)
+            try:
+                (clazz, inner) = title.split('.')
+            except ValueError:
+                # This is a method (not an inner class or interface)
+                continue
+            title = inner  # Keeps only the inner class name. Will be shown as a child of the class
+            res = self.re_href.search(href)  # removes the prefix ../..
+            if res:
+                href = res.group(2)
+            inners.append((href, title))
+        return inners
+
+    def create_inners(self, html_class):
+        for href, title in self.class_pages(html_class).inners:
+            self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (href, title))
+            if (self.manifest.exists(href)):
+                # We do not build the method level for the All Class book
+                self.hhc_file.write('<ul>\n')
+                self.create_methods(href)
+                self.hhc_file.write('</ul>\n')
+
+    def create_package_pages(self, path, package_name):
+        """Writes the hierarchy and the uses of a package"""
         package_tree_path = os.path.join(path, const.PACKAGE_TREE_HTML)
-        if os.path.exists(package_tree_path):
+        if self.manifest.exists(package_tree_path):
             title = "Hierarchy For Package %s" % package_name
             self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (package_tree_path, title))
         package_use_path = os.path.join(path, const.PACKAGE_USE)
-        if os.path.exists(package_use_path):
+        if self.manifest.exists(package_use_path):
             title = "Uses of Package %s" % package_name
             self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (package_use_path, title))
-        fo = open(html_file)
-        lines = fo.readlines()
+
+    def create_classes(self, path, html_file, package_name):
+        """Parses package-frame.html file"""
+        self.create_package_pages(path, package_name)
+        fo = open(os.path.join(self.root, html_file), 'rb')
+        data = fo.read()
+        metrics_.count_read(fo)
         fo.close()
+        charset = get_charset(data)
         href = None
         title = None
         # type = None
-        for line in lines:
+        for line in data.splitlines():
             self.cpt = print_dot(self.cpt)
             res = self.re_anchor_page.match(line)
             if res:
-                href = res.group(1)  # url
+                metrics_.count(regex_matches=1)
+                href = decode(res.group(1), charset)  # url
                 if href.find(const.PACKAGE_SUMMARY) > 0:
                     # The package summary url is caught by the class regexp, skip
                     continue
-                title = res.group(3)  # title
+                title = decode(res.group(3), charset)  # title
                 interface = res.group(2)  # interface or class
                 res = self.re_href.search(href)  # removes the prefix ../..
                 if res:
@@ -212,22 +476,22 @@ class Hhc:
                 # therefore visible in the package-frame file
                 if title.find('.') == -1:
                     self.hhc_file.write(const.FORMAT_CONTENT_CLASS_ITEM % (href, title))
-                    if os.path.exists(href):
+                    if self.manifest.exists(href):
                         # We do not build the method level for the All Class book
                         self.hhc_file.write('<ul>\n')
                         self.create_inners(href)
                         self.create_methods(href)
                         self.hhc_file.write('</ul>\n')
 
-    def create_methods(self, html_file):
-        fo = open(html_file)
-        data = fo.read()
-        fo.close()
-        iteration = re.finditer(self.re_method, data)
+    def extract_methods(self, data, charset=const.DEFAULT_CHARSET):
+        """Returns the (name, href) of the methods found in a class page (bytes)"""
+        methods = []
+        iteration = self.re_method.finditer(data)
         arg = None
         for match in iteration:
-            href = match.group(1)
-            name = match.group(2)
+            metrics_.count(regex_matches=1)
+            href = decode(match.group(1), charset)
+            name = decode(match.group(2), charset)
             if name.find('.') > 0:
                 # This is an inner class of interface, skip
                 continue
@@ -236,6 +500,7 @@ class Hhc:
                 href = res.group(2)
             arg = match.group(3)
             if arg:  # This is a method
+                arg = decode(arg, charset)
                 # Remove parenthesis
                 arg = arg[1:-1]
                 # Split to process multiple parameter
@@ -256,6 +521,11 @@ class Hhc:
                 else:
                     args = ', '.join(new_args)
                 name = "%s (%s)" % (name, args)
+            methods.append((name, href))
+        return methods
+
+    def create_methods(self, html_file):
+        for name, href in self.class_pages(html_file).methods:
             self.hhc_file.write(const.FORMAT_CONTENT_METHOD_ITEM % (name, href))
 
 
@@ -266,74 +536,90 @@ class Hhk:
     in the main dir.
     Write an object bloc that includes href, title and class information.
 
+    The entries of all the index files are sorted by keyword (see entry_key)
+    with an external sort (see extsort): all the entries of a keyword are
+    grouped, even if the index files are not sorted, and at most run_size
+    entries are held in memory.
     """
 
-    def __init__(self, project_name):
+    def __init__(self, project_name, manifest, jobs=const.JOBS, root='.', run_size=const.INDEX_RUN_SIZE):
         self.hhk_file_name = project_name + ".hhk"
-        # Regexp to extract the href and title
-        # First capture is the url, second is the entry in the index
-        self.re_index = re.compile(r'<dt><span class=".*"><a href="(.*)">(.*)</a></span>', re.I)
-        # Regexp to extract the Java class name
-        self.re_class = re.compile(r'(.*).html')
-        # Regexp to eliminate the "../.." prefix
-        self.re_href = re.compile(r'(../)*(.*)')
-        self.cpt = 0
+        self.manifest = manifest
+        self.jobs = jobs
+        self.root = root
+        self.run_size = run_size
+        # Time written into the header (default: see get_build_time)
+        self.build_time = None
+        self.parser = IndexParser()
         self.log = log_.get_logger()
 
-    def create_hhk(self):
-        self.hhk_file = open(self.hhk_file_name, 'w')
-        str_time = time.strftime("%B-%d-%Y", time.localtime(time.time()))
+    def create_hhk(self, entries=None):
+        """Creates the HHK file from the entries (href, title, java_class) sorted by
+        entry_key, by default the entries of the index (see create_index)"""
+        self.open_file()
+        if entries is None:
+            self.create_index()
+        else:
+            self.write_entries(entries)
+        print()  # Add a CR after the dots
+        self.close_file()
+
+    def open_file(self):
+        """Opens the HHK file and writes its header. The entries are then written
+        with write_index."""
+        hhk_file_name = os.path.join(self.root, self.hhk_file_name)
+        staging.unshare(hhk_file_name)
+        self.hhk_file = ProjectFile(hhk_file_name)
+        build_time = get_build_time(self.manifest) if self.build_time is None else self.build_time
+        str_time = time.strftime("%B-%d-%Y", time.gmtime(build_time))
         self.hhk_file.write(const.FORMAT_INDEX_HEADER % str_time)
         self.hhk_file.write('<ul>\n')
-        self.create_index()
-        print()  # Add a CR after the dots
+        self.kword = ''
+        self.entries = []
+
+    def close_file(self):
+        """Writes the last keyword and the footer, and closes the HHK file"""
+        if self.kword:
+            self.write_index()
         self.hhk_file.write('</ul>\n</body>\n</html>\n')
         self.hhk_file.close()
+        metrics_.count_written(os.path.join(self.root, self.hhk_file_name))
 
     def create_index(self):
-        if os.path.exists(const.INDEX_ALL):
+        self.write_entries(extsort.sort(self.iter_entries(), entry_key, self.run_size))
+
+    def iter_entries(self):
+        """Yields the (href, title, java_class) entries of the index, unsorted"""
+        if searchindex.has_search_index(self.manifest):
+            # Javadoc 9+: the entries are built from the records of the search index,
+            # the HTML index files are only parsed with older doclets
+            self.log.debug('Index built from the search index')
+            yield from self.iter_search_entries()
+        elif self.manifest.isfile(const.INDEX_ALL):
             # Javadoc generated with one unique index file in the main dir
-            self.parse_re_idxfile(const.INDEX_ALL)
+            yield from self.parser.iter_entries(os.path.join(self.root, const.INDEX_ALL))
         else:
-            # Javadoc generated with splitted index files in the index dir
-            for index_file in os.listdir(const.INDEX_DIR):
-                index_file = '%s/%s' % (const.INDEX_DIR, index_file)
-                self.parse_re_idxfile(index_file)
+            # Javadoc generated with splitted index files in the index dir (index-1.html,
+            # index-2.html...). The files are parsed in parallel.
+            index_files = [os.path.join(self.root, const.INDEX_DIR, index_file)
+                           for index_file in sorted(self.manifest.listdir(const.INDEX_DIR), key=index_file_key)]
+            jobs = parallel.get_jobs(self.jobs)
+            for entries in parallel.imap_ordered(read_index_file, index_files, jobs, window=jobs * 2):
+                yield from entries
 
-    @staticmethod
-    def sanitize_title(title):
-        """During the compilation, any keyword with more than 488 triggers and error from the CHM compiler:
-        Warning: Keyword string: ... The maximum is 488 characters
-        """
-        if len(title) > const.MAX_SIZE_KEYWORD:
-            return title[:const.MAX_SIZE_KEYWORD] + "..."
-        return title
+    def iter_search_entries(self):
+        """Yields the (href, title, java_class) entries of the search index. The labels
+        are escaped, like the titles matched in the HTML index files."""
+        for href, title, java_class in searchindex.SearchIndex(self.manifest, self.root).iter_records():
+            entry = self.parser.get_entry(href, html.escape(title), html.escape(java_class))
+            if entry:
+                yield entry
 
-    def parse_re_idxfile(self, index_file):
-        fo = open(index_file)
-        data = fo.read()
-        fo.close()
-        iteration = re.finditer(self.re_index, data)
-        self.kword = ''
-        self.entries = []
-        for match in iteration:
-            self.cpt = print_dot(self.cpt)
-            href = match.group(1)
-            res_href = self.re_href.search(href)  # Removes the (../)* preceding the url
-            if res_href:
-                href = res_href.group(2)
-            title = match.group(2)
-            res_class = self.re_class.match(href)
-            java_class = ''
-            if res_class:
-                java_class = res_class.group(1)
-                java_class = java_class.replace('/', '.')  # substitute / separator by .
-            if len(href) < const.MAX_SIZE_KEYWORD and len(title) < const.MAX_SIZE_KEYWORD:
-                # Too long href or title causes the HHC compiler too crash (example with createArray method in Groovy).
-                # It is better to simply skip those exceptional cases.
-                self.write_index(href, self.sanitize_title(title), java_class)
-        if self.kword:
-            self.write_index()
+    def write_entries(self, entries):
+        """Writes the (href, title, java_class) entries, sorted by keyword. Only the
+        entries of the current keyword are kept in memory."""
+        for href, title, java_class in entries:
+            self.write_index(href, title, java_class)
 
     def write_index(self, href="", title="", java_class=""):
         if self.kword and self.kword != title:
@@ -356,58 +642,131 @@ class Hhk:
         self.entries.append((href, java_class))
 
 
+class IndexParser:
+    """Extracts the entries (href, title, java_class) of the Javadoc index files"""
+
+    def __init__(self):
+        # Regexp to extract the href and title
+        # First capture is the url, second is the entry in the index. The parts
+        # are delimited by '"' and '<' (no backtracking), therefore the scan of an
+        # index file is linear, even with all the entries on one line.
+        self.re_index = re.compile(rb'<dt><span class="[^"]*"><a href="([^"]*)">([^<]*)</a></span>', re.I)
+        # Regexp to extract the Java class name
+        self.re_class = re.compile(r'([^#]*)\.html')
+        # Regexp to eliminate the "../.." prefix
+        self.re_href = RE_PARENT_PREFIX
+        self.cpt = 0
+
+    @staticmethod
+    def sanitize_title(title):
+        """During the compilation, any keyword with more than 488 triggers and error from the CHM compiler:
+        Warning: Keyword string: ... The maximum is 488 characters
+        """
+        if len(title) > const.MAX_SIZE_KEYWORD:
+            return title[:const.MAX_SIZE_KEYWORD] + "..."
+        return title
+
+    def iter_entries(self, index_file):
+        """Yields the (href, title, java_class) entries of an index file.
+
+        The file is memory mapped and scanned as bytes. Only the matches are decoded
+        (charset of the page), therefore the memory used doesn't depend on the size
+        of the index file.
+        """
+        with open(index_file, 'rb') as fo:
+            metrics_.count_read(fo)
+            if os.fstat(fo.fileno()).st_size == 0:
+                return
+            with mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                charset = get_charset(data)
+                for match in self.re_index.finditer(data):
+                    self.cpt = print_dot(self.cpt)
+                    metrics_.count(regex_matches=1)
+                    entry = self.get_entry(decode(match.group(1), charset), decode(match.group(2), charset))
+                    if entry:
+                        yield entry
+
+    def get_entry(self, href, title, java_class=None):
+        """Returns the (href, title, java_class) of an index entry, or None if the entry
+        has to be skipped. The Java class is taken from the url if not provided."""
+        res_href = self.re_href.search(href)  # Removes the (../)* preceding the url
+        if res_href:
+            href = res_href.group(2)
+        if java_class is None:
+            res_class = self.re_class.match(href)
+            java_class = ''
+            if res_class:
+                java_class = res_class.group(1)
+                java_class = java_class.replace('/', '.')  # substitute / separator by .
+        if len(href) < const.MAX_SIZE_KEYWORD and len(title) < const.MAX_SIZE_KEYWORD:
+            # Too long href or title causes the HHC compiler too crash (example with createArray method in Groovy).
+            # It is better to simply skip those exceptional cases.
+            return href, self.sanitize_title(title), java_class
+        return None
+
+
 class ChmProject:
     """Create the HTML Help project file (extension .hhp)"""
 
     def __init__(self):
-        self.content_file = ''
-        self.default_file = ''
         self.log = log_.get_logger()
 
-    def parse_re_index_html(self):
-        """Parses index.html file to retrieve the files to be parsed in order to create
-        the contents table and to set the default page
+    def add_tasks(self, graph, env, project_title, verify_toc=const.VERIFY_TOC):
+        """Adds the tasks creating the HHP, HHC and HHK files of the working directory
+        of env (ChmEnv). The tasks only read the staged files: they run
+        concurrently. env is read when the tasks run, after the staging."""
+        graph.add('create_hhp', functools.partial(self.create_hhp, env, project_title),
+                  inputs=(const.RESOURCE_STAGED,), outputs=(const.RESOURCE_HHP,))
+        graph.add('create_hhc', functools.partial(self.create_hhc, env, verify_toc),
+                  inputs=(const.RESOURCE_STAGED,), outputs=(const.RESOURCE_HHC,))
+        graph.add('create_hhk', functools.partial(self.create_hhk, env),
+                  inputs=(const.RESOURCE_STAGED,), outputs=(const.RESOURCE_HHK,))
 
-        1) JavaDoc with multiple packages (JDK, :
-        Takes the attribute src in the 1st tag <frame>, "overview-frame.html" and in
-        the 3rd tag <frame>, "overview-summary.html"
-
-        2) JavaDoc with one package (example BeanShell):
-        Takes the attribute src in the 1st tag <frame>, "allclasses-frame.html" and
-        in the 2nd tag <frame>, example: "bsh/package-summary.html"
+    def create_hhp(self, env, project_title):
+        """Creates the HHP file, if outdated"""
+        content_file, default_file = read_index_frames(env.temp_dir)
+        self.log.debug('Content file: %s' % content_file)
+        self.log.debug('Default file: %s' % default_file)
+        hhp = Hhp(env.project_name, project_title, default_file, env.manifest, env.temp_dir)
+        # The file section only depends on the list of files, not on their content
+        file_list_changes = env.changes and env.changes.added + env.changes.deleted
+        if self.is_outdated(env.manifest, env.project_name + ".hhp", env.changes, is_html_file, file_list_changes) \
+                or not hhp.has_header():
+            self.log.info("Creating HTML Help Project")
+            hhp.create_hhp()
+        else:
+            self.log.info("HTML Help Project is up to date")
 
-        3) JavaDoc with no package?
-        """
-        fo = open(const.INDEX_HTML)
-        lines = fo.readlines()
-        fo.close()
-        self.re_src = re.compile(r'^<frame src="([^"]*)"')
-        for line in lines:
-            res = self.re_src.match(line)
-            if res:
-                if not self.content_file:
-                    self.content_file = res.group(1)
-                else:
-                    self.default_file = res.group(1)
-
-    def create_project(self, project_name, project_title):
-        self.log.debug('create_project...')
-        self.parse_re_index_html()
-        self.log.debug('Content file: %s' % self.content_file)
-        self.log.debug('Default file: %s' % self.default_file)
-        hhp = Hhp(project_name, project_title, self.default_file)
-        self.log.info("Creating HTML Help Project")
-        hhp.create_hhp()
-        # Create hhc file (contents)
+    def create_hhc(self, env, verify_toc=const.VERIFY_TOC):
+        """Creates the HHC file (contents), if outdated"""
         # The default file is passed to be used in case of a single package
-        hhc = Hhc(project_name, self.content_file, self.default_file)
-        self.log.info("Creating HTML Help Contents")
-        hhc.create_hhc()
-        # Create hhk file (index)
-        hhk = Hhk(project_name)
-        print()  # Add a CR after the dots
-        self.log.info("Creating HTML Help Index")
-        hhk.create_hhk()
+        content_file, default_file = read_index_frames(env.temp_dir)
+        hhc = Hhc(env.project_name, content_file, default_file, env.manifest, env.jobs, verify_toc, env.temp_dir)
+        if self.is_outdated(env.manifest, hhc.hhc_file_name, env.changes, is_content_file):
+            self.log.info("Creating HTML Help Contents")
+            hhc.create_hhc()
+            print()  # Add a CR after the dots
+        else:
+            self.log.info("HTML Help Contents is up to date")
+
+    def create_hhk(self, env):
+        """Creates the HHK file (index), if outdated"""
+        hhk = Hhk(env.project_name, env.manifest, env.jobs, env.temp_dir)
+        if self.is_outdated(env.manifest, hhk.hhk_file_name, env.changes, is_index_file):
+            self.log.info("Creating HTML Help Index")
+            hhk.create_hhk()
+        else:
+            self.log.info("HTML Help Index is up to date")
+
+    def is_outdated(self, manifest, file_name, changes, depends_on, rel_paths=None):
+        """Returns True if file_name has to be (re)generated: full build, missing
+        file (see manifest), or one of the changed files (rel_paths, default: all
+        the changes) satisfies depends_on."""
+        if not changes or changes.full or not manifest.isfile(file_name):
+            return True
+        if rel_paths is None:
+            rel_paths = changes.added + changes.changed + changes.deleted
+        return any(depends_on(rel_path) for rel_path in rel_paths)
 
 
 class ChmEnv:
@@ -425,56 +784,65 @@ class ChmEnv:
         self.project_name = None
         self.start_dir = None
         self.temp_dir = None
+        self.jobs = const.JOBS
+        self.staging = const.STAGING
+        self.incremental = const.INCREMENTAL
+        self.compiler = const.COMPILER
+        self.changes = None
+        self.manifest = None
+        self.clean_up = True
+        # Time stamp of the CHM file (default: see get_build_time)
+        self.build_time = None
 
-        # Regex
-        self.re_method = None
-        self.re_bookmark = None
-
-    def prepare_env(self, project_name, jdoc_dir):
+    def configure(self, project_name, jobs=const.JOBS, staging_mode=const.STAGING, incremental=const.INCREMENTAL,
+                  compiler=const.COMPILER, work_dir=None, output_dir=None):
+        """Sets the options of the build (see build) and removes the CHM file of
+        a previous build"""
         self.project_name = project_name
-        self.start_dir = os.getcwd()
+        self.jobs = jobs
+        self.staging = staging_mode
+        self.incremental = incremental
+        self.compiler = compiler
+        self.start_dir = os.path.abspath(output_dir) if output_dir else os.getcwd()
+        self.temp_dir = os.path.abspath(work_dir) if work_dir else get_work_dir(project_name)
 
-        if const.EXTERNAL_COMPILER:
-            # If HH Compiler not installed, it prompts the user and stops
+        if self.compiler == const.COMPILER_HHC:
+            # If HH Compiler not installed, falls back to the internal compiler
             self.html_compiler = self.get_html_compiler_path()
-        else:
-            self.log.info('Using internal compiler (module pyhhc)')
+            if not self.html_compiler:
+                self.log.warning('HTML Help compiler not found')
+                self.compiler = const.COMPILER_INTERNAL
+        if self.compiler == const.COMPILER_INTERNAL:
+            self.log.info('Using internal compiler (module chm)')
 
-        # Check if a project with the same name is already open
+        # Removes the CHM file of a previous build (raises OSError if the file is open)
         chm_file = os.path.join(self.start_dir, '%s.chm' % project_name)
         if os.path.exists(chm_file):
-            while 1:
-                try:
-                    os.unlink(chm_file)
-                    break
-                except OSError:
-                    # TODO: this will have to be handled differently via the GUI (not with a raw input...)
-                    self.log.warning("The file %s is open" % chm_file)
-                    print("\nThe file %s is open" % chm_file)
-                    print("Close the corresponding Window and type any key")
-                    input()
-
-        # Copy full javadoc files into working directory
-        self.temp_dir = self.copy_javadoc(jdoc_dir)
-        # Working directory becomes current dir
-        os.chdir(self.temp_dir)
-        # Modify files (URL clean-up)
-        # TODO: this regex is not working with recent Javadoc. Revisit the cleanup concept
-        self.re_method = re.compile(r'<td><code><b><a\s+href="([^"]*)">')
-        self.re_bookmark = re.compile(r'<a name="([^"]*)">')
-        self.clean_html_files()
-        # Create CSS file
+            os.unlink(chm_file)
+
+    def add_tasks(self, graph, jdoc_dir):
+        """Adds the tasks preparing the working directory: staging of the Javadoc files
+        (cleaned-up in the same pass), CSS and About files"""
+        graph.add('copy_javadoc', functools.partial(self.copy_javadoc, jdoc_dir),
+                  inputs=(const.RESOURCE_JAVADOC,), outputs=(const.RESOURCE_STAGED,))
+        graph.add('create_css_about', self.create_css_about, outputs=(const.RESOURCE_STAGED,))
+
+    def create_css_about(self):
+        """Creates the CSS (see const.CUSTOM_CSS) and About files"""
         if const.CUSTOM_CSS:
             self.create_css()
-        # Create about file
-        create_about()
+        create_about(self.temp_dir)
+        self.manifest.add(const.ABOUT_FILE)
 
     def get_html_compiler_path(self):
         """HTML Help Workshop may be installed and found in %programfiles(x86)%\\HTML Help Workshop.
         If installed via the installer found at http://bit.ly/hhdownload, the path may be found in the
         registry. The comiler is hhc.exe. If no compiler found stop the
         """
-        hhc_path = os.path.join(os.environ['programfiles(x86)'], 'HTML Help Workshop', 'hhc.exe')
+        if win32api is None:
+            self.log.info("The HTML Help Workshop compiler is only available on Windows.")
+            return None
+        hhc_path = os.path.join(os.environ.get('programfiles(x86)', ''), 'HTML Help Workshop', 'hhc.exe')
         if not os.path.exists(hhc_path):
             hhc_path = None
             try:
@@ -497,109 +865,161 @@ class ChmEnv:
                 hhc_path = None
         return hhc_path
 
-    def make(self, handle=0):
-        if const.EXTERNAL_COMPILER:
-            compiler = win32api.GetShortPathName(self.html_compiler)
+    def get_compiler_command(self):
+        """Returns the command starting the HTML Help compiler (short path on Windows)"""
+        return win32api.GetShortPathName(self.html_compiler)
+
+    def compile(self, handle=0):
+        """Runs the HTML Help compiler in the working directory and copies the CHM file
+        into the output directory (self.start_dir). Returns the path of the copy.
+
+        In incremental mode, the compiler is not run if the fingerprint of its inputs
+        (see get_fingerprint) matches the one of the CHM file of the previous build.
+        """
+        hhp_file = '%s.hhp' % self.project_name
+        chm_file = os.path.join(self.temp_dir, '%s.chm' % self.project_name)
+        fingerprint_file = chm_file + const.FINGERPRINT_EXT
+        fingerprint = None
+        if self.incremental:
+            fingerprint = self.get_fingerprint()
+            if os.path.isfile(chm_file) and read_fingerprint(fingerprint_file) == fingerprint:
+                self.log.info('Compiler inputs unchanged, %s reused' % os.path.basename(chm_file))
+                return self.copy_chm(chm_file)
+        for path in (fingerprint_file, chm_file):
+            if os.path.exists(path):
+                os.unlink(path)
+        if self.compiler == const.COMPILER_HHC:
+            compiler = self.get_compiler_command()
             self.log.info('HTML Help Compilation (Microsoft HTML Help compiler)')
-            if handle:
-                # TODO: Start compilation in a thread (only for UI if any)
-                os.system('%s %s.hhp' % (compiler, self.project_name))
-            else:
-                os.system('%s %s.hhp' % (compiler, self.project_name))
+            # TODO: Start compilation in a thread (only for UI if any, see handle)
+            # hhc.exe returns 1 on success: the result is checked with the CHM file
+            subprocess.call('%s %s' % (compiler, hhp_file), cwd=self.temp_dir, shell=True)
         else:
-            self.log.error('Only the external compiler, HHC.exe, can be used with this version of jd2chm')
-            sys.exit(1)
+            self.log.info('HTML Help Compilation (internal compiler)')
+            build_time = get_build_time(self.manifest) if self.build_time is None else self.build_time
+            chm.compile_project(os.path.join(self.temp_dir, hhp_file), self.manifest, timestamp=build_time)
 
         # Copy back the compiled chm file (if any)
-        chm = '%s.chm' % self.project_name
-        if os.path.isfile(chm):
-            shutil.copyfile(chm, os.path.join(self.start_dir, chm))
-        else:
-            self.log.error("No compiled HTML %s file generated" % chm)
+        if os.path.isfile(chm_file):
+            metrics_.count_written(chm_file)
+            if fingerprint:
+                with open(fingerprint_file, 'w') as fo:
+                    fo.write(fingerprint + '\n')
+            return self.copy_chm(chm_file)
+        self.log.error("No compiled HTML %s file generated" % chm_file)
+        return None
 
-        # Come back to the starting directory
-        # Could be needed to start the chm for example
-        os.chdir(self.start_dir)
+    def copy_chm(self, chm_file):
+        """Copies the CHM file into the output directory. Returns the path of the copy."""
+        output_file = os.path.join(self.start_dir, os.path.basename(chm_file))
+        shutil.copyfile(chm_file, output_file)
+        return output_file
+
+    def get_fingerprint(self):
+        """Returns the fingerprint (SHA-256) of the inputs of the compiler: the sorted
+        list of the files of the working directory and the hash of their content.
+        The hashes of the staged Javadoc files are taken from the staging manifest,
+        the files generated by jd2chm (project files, CSS, About) are hashed."""
+        chm_file = '%s.chm' % self.project_name
+        outputs = (chm_file, chm_file + const.FINGERPRINT_EXT, const.STAGING_MANIFEST, const.HHC_LOG)
+        generated = [self.project_name + ext for ext in ('.hhp', '.hhc', '.hhk')]
+        generated += [const.CSS_FILE_NAME, const.ABOUT_FILE]
+        recorded = staging.load_manifest(self.temp_dir) or {}
+        rel_paths = set(self.manifest.files)
+        rel_paths.update(name for name in generated if os.path.isfile(os.path.join(self.temp_dir, name)))
+        rel_paths = sorted(rel_path for rel_path in rel_paths if rel_path not in outputs)
+        hashes = staging.hash_files(self.temp_dir, [rel_path for rel_path in rel_paths
+                                                    if rel_path in generated or rel_path not in recorded],
+                                    self.jobs)
+        digest = hashlib.sha256()
+        # A new version of jd2chm, or another compiler, may generate another CHM file
+        digest.update(('%s %s\n' % (const.VERSION, self.compiler)).encode('utf-8'))
+        for rel_path in rel_paths:
+            digest.update(('%s %s\n' % (rel_path, hashes.get(rel_path) or recorded[rel_path]['hash']))
+                          .encode('utf-8'))
+        return digest.hexdigest()
 
     def copy_javadoc(self, jdoc_dir):
-        """Copy the current tree into the temporary working directory"""
-        tmp_dir = tempfile.gettempdir()
-        tmp_dir = os.path.join(tmp_dir, const.WORKING_DIR, self.project_name)
-
-        if not const.REUSE_TEMP_FILES:
-            if os.path.isdir(tmp_dir):
-                self.log.info("Deleting old directory %s" % tmp_dir)
-                try:
-                    shutil.rmtree(tmp_dir)
-                except OSError as ose:
-                    # TODO: will need to abort something here
-                    self.log.error(ose)
-            cpt = 0
-            while True:
-                try:
-                    cpt += 1
+        """Copy the current tree into the temporary working directory. The HTML files
+        are cleaned-up while they are staged (see stage_file).
+
+        In incremental mode, only the files added, changed or deleted since the
+        previous build are synced (see staging.sync_tree). self.changes records
+        the files staged. The working directory is self.temp_dir (default: see
+        get_work_dir). jdoc_dir may be a Javadoc archive: its members are staged
+        without extracting it first (see archive).
+        """
+        if not self.temp_dir:
+            self.temp_dir = get_work_dir(self.project_name)
+        tmp_dir = self.temp_dir
+        version = get_doclet_version(archive.join(jdoc_dir, const.INDEX_HTML))
+        self.clean_up = version is None or version < const.CLEAN_UP_MAX_VERSION
+        if not self.clean_up:
+            self.log.info("Javadoc %d: the clean-up of the HTML files is disabled" % version)
+        copy_function = functools.partial(stage_file, self.staging, clean_up=self.clean_up)
+
+        if self.incremental and os.path.isdir(tmp_dir):
+            self.log.info("Syncing Javadoc files to {}".format(tmp_dir))
+            self.manifest = FileManifest.scan(tmp_dir)
+            self.changes = staging.sync_tree(jdoc_dir, tmp_dir, copy_function, self.manifest, self.jobs)
+            if self.changes is not None:
+                self.log.info("%d files added, %d changed, %d deleted" % (len(self.changes.added),
+                                                                         len(self.changes.changed),
+                                                                         len(self.changes.deleted)))
+                return tmp_dir
+            self.log.info("No valid manifest found in %s, staging all the files" % tmp_dir)
+
+        if os.path.isdir(tmp_dir) and os.listdir(tmp_dir):
+            self.log.info("Deleting old directory %s" % tmp_dir)
+            try:
+                shutil.rmtree(tmp_dir)
+            except OSError as ose:
+                # TODO: will need to abort something here
+                self.log.error(ose)
+        cpt = 0
+        while True:
+            try:
+                cpt += 1
+                if self.staging == const.STAGING_LINK:
+                    self.log.info("Linking Javadoc files to {}".format(tmp_dir))
+                else:
                     self.log.info("Copying Javadoc files to {}".format(tmp_dir))
                     self.log.warning("It may take a while for a large size Java Documentation")
-                    shutil.copytree(jdoc_dir, tmp_dir)
-                    break
-                except PermissionError as pe:
-                    self.log.warn("First attempt copying Javadoc file failed...")
-                    if cpt > 3:
-                        print("There was an error copying the Javadoc files to a temporary directory")
-                        print(pe)
-                        sys.exit(4)
-                    time.sleep(5)
+                self.stage_tree(jdoc_dir, tmp_dir)
+                break
+            except PermissionError:
+                self.log.warning("First attempt copying Javadoc file failed...")
+                if cpt > 3:
+                    self.log.error("There was an error copying the Javadoc files to a temporary directory")
+                    raise
+                time.sleep(5)
+        if self.incremental:
+            self.changes = staging.record_tree(jdoc_dir, tmp_dir, self.jobs)
+        else:
+            self.changes = staging.Changes(True, [], [], [])
+        self.manifest = FileManifest.scan(tmp_dir)
         return tmp_dir
 
-    def clean_html_files(self):
-        # TODO: validate if this is still necessary with recent Javadoc
-        # Assume current directory
-        self.log.debug('trigger cleanup...')
-        for root, dirs, files in os.walk('.'):
-            for file in files:
-                if os.path.splitext(file)[1] == ".html":
-                    lines_modified = 0
-                    new_lines = []
-                    html_dir = os.path.abspath(root)
-                    path = os.path.join(html_dir, file)
-                    fo = open(path)
-                    lines = fo.readlines()
-                    fo.close()
-                    for line in lines:
-                        # Check link method
-                        new_line = self.quote_url(self.re_method, line)
-                        if new_line:
-                            line = new_line
-                            lines_modified += 1
-                            new_lines.append(line)
-                            # Should not have the link and anchor on the same line
-                            continue
-                        # Check bookmark method
-                        new_line = self.quote_url(self.re_bookmark, line)
-                        if new_line:
-                            line = new_line
-                            lines_modified += 1
-                        new_lines.append(line)
-                    if lines_modified:
-                        self.log.warning('%s: %s lines modified' % (file, lines_modified))
-                        fo = open(path, "w")
-                        fo.writelines(new_lines)
-                        fo.close()
-                    else:
-                        self.log.debug('%s: %s lines modified' % (file, lines_modified))
-
-    def quote_url(self, regex, line):
-        match = regex.search(line)
-        new_line = None
-        # The line can be a method line (link or anchor)
-        if match:
-            method = match.group(1)
-            # if the last char is ')', it is a method (not a field)
-            # if if has a space, need to be modified
-            if method[-1] == ')' and method.find(' ') != -1:
-                href = urllib.parse.quote(method, safe='()/,#')
-                new_line = line.replace(method, href)
-        return new_line
+    def stage_tree(self, jdoc_dir, tmp_dir):
+        """Stages (see stage_file) all the files of jdoc_dir into tmp_dir. The files
+        are sharded across a pool of processes (see self.jobs)."""
+        source = archive.get_manifest(jdoc_dir)
+        for rel_dir in source.dirs:
+            os.makedirs(os.path.join(tmp_dir, rel_dir), exist_ok=True)
+        items = [(archive.join(jdoc_dir, rel_path), os.path.join(tmp_dir, rel_path)) for rel_path in source.files]
+        self.log.debug('%d files, %d jobs' % (len(items), parallel.get_jobs(self.jobs)))
+        skipped = 0
+        for path, lines_modified in parallel.imap_ordered(functools.partial(stage_item, self.staging, self.clean_up),
+                                                          items, self.jobs):
+            file = os.path.basename(path)
+            if lines_modified:
+                self.log.warning('%s: %s lines modified' % (file, lines_modified))
+            else:
+                if lines_modified is None:
+                    skipped += 1
+                if is_html_file(path):
+                    self.log.debug('%s: 0 lines modified' % file)
+        self.log.info('%d HTML files skipped by the clean-up' % skipped)
 
     def create_css(self):
 
@@ -608,44 +1028,333 @@ class ChmEnv:
         """
 
         css_file_bak = const.CSS_FILE_NAME + ".bak"
-        if os.path.exists(const.CSS_FILE_NAME):
-            if not os.path.exists(css_file_bak):
+        css_path = os.path.join(self.temp_dir, const.CSS_FILE_NAME)
+        if self.manifest.isfile(const.CSS_FILE_NAME):
+            if not self.manifest.isfile(css_file_bak):
                 self.log.info("Saves the original Javadoc css file ({}) as {}".format(const.CSS_FILE_NAME,
                                                                                       css_file_bak))
-                shutil.copyfile(const.CSS_FILE_NAME, const.CSS_FILE_NAME + ".bak")
-        css_file = open(const.CSS_FILE_NAME, 'w')
+                shutil.copyfile(css_path, css_path + ".bak")
+                self.manifest.add(css_file_bak)
+        staging.unshare(css_path)
+        css_file = open(css_path, 'w')
         css_file.write(const.FORMAT_CSS)
         css_file.close()
+        metrics_.count_written(css_path)
+        self.manifest.add(const.CSS_FILE_NAME)
 
 
-def create_about():
-    """Creates an HTML about file to be included in the project."""
-    about_file = open(const.ABOUT_FILE, 'w')
-    about_file.write(const.ABOUT_TEXT)
-    about_file.close()
+def read_index_frames(root='.'):
+    """Parses index.html file to retrieve the files to be parsed in order to create
+    the contents table and to set the default page. Returns the content file and
+    the default file.
+
+    1) JavaDoc with multiple packages (JDK, :
+    Takes the attribute src in the 1st tag <frame>, "overview-frame.html" and in
+    the 3rd tag <frame>, "overview-summary.html"
 
+    2) JavaDoc with one package (example BeanShell):
+    Takes the attribute src in the 1st tag <frame>, "allclasses-frame.html" and
+    in the 2nd tag <frame>, example: "bsh/package-summary.html"
 
-# TODO: Replace walktree with os.walk
-def walktree(folder, callback):
-    """Recursively descends the directory rooted at dir, calling the callback
-    function for each HTML file
+    3) JavaDoc with no package?
     """
+    fo = open(os.path.join(root, const.INDEX_HTML), 'rb')
+    data = fo.read()
+    metrics_.count_read(fo)
+    fo.close()
+    charset = get_charset(data)
+    content_file = ''
+    default_file = ''
+    for line in data.splitlines():
+        res = RE_FRAME_SRC.match(line)
+        if res:
+            if not content_file:
+                content_file = decode(res.group(1), charset)
+            else:
+                default_file = decode(res.group(1), charset)
+    return content_file, default_file
 
-    # debug("[walktree] Directory: %s" % dir)
-    sys.stdout.write('.')
-    if folder == './' + const.INDEX_DIR:
-        print()  # Carriage return after the dots...
-        print("Skipping %s" % folder)
-        return
-    for f in os.listdir(folder):
-        pathname = '%s/%s' % (folder, f)
-        if os.path.isdir(pathname):
-            walktree(pathname, callback)
-        elif os.path.isfile(pathname):
-            callback(pathname)  # Writes the line in the project file section
-        else:
-            print()  # Carriage return after the dots...
-            print("Skipping %s" % pathname)
+
+def read_fingerprint(fingerprint_file):
+    """Returns the fingerprint of the previous build (None if not found)"""
+    try:
+        with open(fingerprint_file) as fo:
+            return fo.read().strip()
+    except OSError:
+        return None
+
+
+def get_build_time(manifest=None):
+    """Returns the time (seconds since the epoch) written into the generated files:
+    SOURCE_DATE_EPOCH if set, else the modification time of the Javadoc index.html,
+    so that a build of the same Javadoc generates the same files."""
+    epoch = os.environ.get('SOURCE_DATE_EPOCH', '')
+    if epoch.isdigit():
+        return int(epoch)
+    if manifest is not None and manifest.isfile(const.INDEX_HTML):
+        return manifest.mtime(const.INDEX_HTML) // 1000000000
+    return int(time.time())
+
+
+def get_output_dir(javadoc_dir):
+    """Returns the default directory of the CHM file: the Javadoc directory, or the
+    directory of a Javadoc archive"""
+    if archive.is_archive(javadoc_dir):
+        return os.path.dirname(os.path.abspath(javadoc_dir))
+    return javadoc_dir
+
+
+def get_work_dir(project_name):
+    """Returns the working directory of a project, reused by the incremental builds"""
+    return os.path.join(tempfile.gettempdir(), const.WORKING_DIR, project_name)
+
+
+def create_work_dir(project_name):
+    """Creates a unique working directory for a build (removed by the caller)"""
+    parent_dir = os.path.join(tempfile.gettempdir(), const.WORKING_DIR)
+    os.makedirs(parent_dir, exist_ok=True)
+    return tempfile.mkdtemp(prefix=project_name + '-', dir=parent_dir)
+
+
+def build(javadoc_dir, project_name, project_title, work_dir=None, output_dir=None, jobs=const.JOBS,
+          staging_mode=const.STAGING, incremental=const.INCREMENTAL, compiler=const.COMPILER,
+          verify_toc=const.VERIFY_TOC):
+    """Builds the CHM file of a Javadoc directory. Returns a BuildResult.
+
+    All the paths are resolved against javadoc_dir, work_dir and output_dir: the
+    current directory is not changed and the user is never prompted, therefore
+    several builds can run concurrently (threads or processes). work_dir is
+    the staging directory. By default, a unique directory is created and
+    removed after the build, except for an incremental build that reuses the
+    working directory of the project (see get_work_dir). The CHM file is
+    written into output_dir (default: see get_output_dir). javadoc_dir may be
+    a Javadoc archive (see archive).
+    """
+    javadoc_dir = os.path.abspath(javadoc_dir)
+    if output_dir is None:
+        output_dir = get_output_dir(javadoc_dir)
+    remove_work_dir = work_dir is None and not incremental
+    if work_dir is None:
+        work_dir = get_work_dir(project_name) if incremental else create_work_dir(project_name)
+    metrics = metrics_.set_metrics(None)
+    env = ChmEnv()
+    # The stages run as a task graph: the HHP, HHC and HHK files are created concurrently
+    graph = taskgraph.TaskGraph()
+    try:
+        env.configure(project_name, jobs, staging_mode, incremental, compiler, work_dir, output_dir)
+        env.add_tasks(graph, javadoc_dir)
+        ChmProject().add_tasks(graph, env, project_title, verify_toc)
+        graph.add('make', env.compile, inputs=(const.RESOURCE_STAGED, const.RESOURCE_HHP, const.RESOURCE_HHC,
+                                               const.RESOURCE_HHK), outputs=(const.RESOURCE_CHM,))
+        chm_file = graph.run()['make']
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    metrics.task_graph = graph.report()
+    log_.get_logger().info('Build stages:\n%s' % graph.format_report())
+    return BuildResult(chm_file, project_name, None if remove_work_dir else env.temp_dir, metrics)
+
+
+def is_html_file(rel_path):
+    return os.path.splitext(rel_path)[1] == ".html"
+
+
+def is_index_file(rel_path):
+    """Index files (HTML or search index) are the input of the HHK file"""
+    return rel_path == const.INDEX_ALL or rel_path.startswith(const.INDEX_DIR + '/') \
+        or searchindex.is_search_index_file(rel_path)
+
+
+def is_content_file(rel_path):
+    """HTML files (frames, packages and classes), the package list and the search
+    index are the input of the HHC file"""
+    return (is_html_file(rel_path) and not is_index_file(rel_path)) \
+        or rel_path in (const.PACKAGE_LIST, const.ELEMENT_LIST) or searchindex.is_search_index_file(rel_path)
+
+
+# Hhc used by a worker process to build the TOC fragments of the packages
+_package_worker = None
+
+
+def init_package_worker(content_file, default_file, manifest, root):
+    global _package_worker
+    _package_worker = Hhc('', content_file, default_file, manifest, root=root)
+
+
+def create_package_fragment(book):
+    """Returns the TOC fragment of a package (book).
+
+    Runs in the worker processes of Hhc.create_packages.
+    """
+    _package_worker.hhc_file = io.StringIO()
+    _package_worker.create_package(*book)
+    return _package_worker.hhc_file.getvalue()
+
+
+def entry_key(entry):
+    """Sorts the (href, title, java_class) entries of the index by title, ignoring
+    the case (the order of the Javadoc index), the entries of a keyword being
+    adjacent"""
+    return entry[1].lower(), entry[1], entry[0]
+
+
+def index_file_key(file_name):
+    """Sorts the split index files in numeric order (index-2.html before index-10.html)"""
+    match = re.match(r'index-(\d+)\.html$', file_name)
+    if match:
+        return 0, int(match.group(1)), file_name
+    return 1, 0, file_name
+
+
+def read_index_file(index_file):
+    """Returns the entries of an index file.
+
+    Runs in the worker processes of Hhk.create_index.
+    """
+    return list(IndexParser().iter_entries(index_file))
+
+
+def stage_item(mode, clean_up, item):
+    """Stages a (src, dst) item (see stage_file).
+
+    Runs in the worker processes of ChmEnv.stage_tree.
+    """
+    return stage_file(mode, *item, clean_up=clean_up)
+
+
+def stage_file(mode, src, dst, clean_up=True):
+    """Stages the Javadoc file src into dst in one pass. An HTML file is read
+    once, cleaned-up (see clean_html_lines) and written once, or staged with the
+    function of the staging mode if not modified in link mode. The other files
+    are staged with the function of the mode (see staging.get_copy_function).
+    Returns dst and the number of lines modified, None if the HTML file was
+    skipped by the clean-up (disabled, or nothing to quote)."""
+    copy_function = staging.get_copy_function(mode)
+    if not is_html_file(src):
+        copy_function(src, dst)
+        return dst, 0
+    if not clean_up:
+        metrics_.count(files_skipped=1)
+        copy_function(src, dst)
+        return dst, None
+    data = archive.read_file(src)
+    lines_modified = None
+    if has_unquoted_urls(data):
+        new_lines, lines_modified = clean_html_lines(data.splitlines(True), get_charset(data))
+    else:
+        metrics_.count(files_skipped=1)
+    if not lines_modified and mode == const.STAGING_LINK:
+        copy_function(src, dst)
+        return dst, lines_modified
+    with open(dst, 'wb') as fo:
+        fo.write(b''.join(new_lines) if lines_modified else data)
+    archive.copystat(src, dst)
+    metrics_.count_written(dst, regex_matches=lines_modified or 0)
+    return dst, lines_modified
+
+
+def has_unquoted_urls(data):
+    """Returns False if the HTML data (bytes) has nothing to be quoted by
+    clean_html_lines. Checks the whole file at once, much faster than the
+    regex's of every line."""
+    return any(marker in data for marker in CLEAN_UP_MARKERS) and RE_UNQUOTED_METHOD.search(data) is not None
+
+
+def get_charset(data):
+    """Returns the charset of an HTML page (bytes), declared by a meta element in its
+    head, const.DEFAULT_CHARSET if not declared or unknown"""
+    match = RE_CHARSET.search(data, 0, const.CHARSET_SCAN_SIZE)
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return const.DEFAULT_CHARSET
+
+
+def decode(data, charset):
+    """Decodes a title or a URL extracted from a page. The invalid bytes are replaced."""
+    return data.decode(charset, 'replace')
+
+
+def get_doclet_version(index_html):
+    """Returns the major version of the Javadoc (1.8 is 8) that generated
+    index_html, None if unknown"""
+    try:
+        data = archive.read_file(index_html)
+    except OSError:
+        return None
+    match = RE_DOCLET_VERSION.search(data)
+    if not match:
+        return None
+    major = int(match.group(1))
+    if major == 1 and match.group(2):
+        return int(match.group(2))
+    return major
+
+
+def clean_html_lines(lines, charset=const.DEFAULT_CHARSET):
+    """Quotes the method URL's (links and anchors) of the lines (bytes) of an HTML
+    file. Returns the new lines and the number of lines modified."""
+    lines_modified = 0
+    new_lines = []
+    for line in lines:
+        # Check link method
+        new_line = quote_url(RE_METHOD_URL, line, charset)
+        if new_line:
+            line = new_line
+            lines_modified += 1
+            new_lines.append(line)
+            # Should not have the link and anchor on the same line
+            continue
+        # Check bookmark method
+        new_line = quote_url(RE_BOOKMARK, line, charset)
+        if new_line:
+            line = new_line
+            lines_modified += 1
+        new_lines.append(line)
+    return new_lines, lines_modified
+
+
+def quote_url(regex, line, charset=const.DEFAULT_CHARSET):
+    match = regex.search(line)
+    new_line = None
+    # The line can be a method line (link or anchor)
+    if match:
+        method = decode(match.group(1), charset)
+        href = quote_method(method)
+        if href != method:
+            # The quoted URL is ASCII
+            new_line = line.replace(match.group(1), href.encode('ascii'))
+    return new_line
+
+
+def quote_method(method):
+    """Returns the URL of a method quoted like in the cleaned-up pages"""
+    # if the last char is ')', it is a method (not a field)
+    # if if has a space, need to be modified
+    if method and method[-1] == ')' and method.find(' ') != -1:
+        return urllib.parse.quote(method, safe='()/,#')
+    return method
+
+
+def get_member_title(label):
+    """Returns the TOC title of a member of the search index: 'add (int, String)'
+    like the methods extracted from the class pages"""
+    name, sep, args = label.partition('(')
+    if sep:
+        return '%s (%s' % (name, args)
+    return label
+
+
+def create_about(root='.'):
+    """Creates an HTML about file to be included in the project."""
+    about_path = os.path.join(root, const.ABOUT_FILE)
+    staging.unshare(about_path)
+    about_file = open(about_path, 'w')
+    about_file.write(const.ABOUT_TEXT)
+    about_file.close()
+    metrics_.count_written(about_path)
 
 
 def print_dot(cpt):
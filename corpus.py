@@ -0,0 +1,220 @@
+"""Synthetic Javadoc corpus generator (used by the tests and the benchmarks).
+
+Generates a framed Javadoc tree (index.html, overview-frame.html,
+package-frame.html...) of packages x classes x (methods, inner classes),
+with an index either unique (index-all.html) or split
+(index-files/index-N.html). The markup follows what the jd2chm parsers
+expect, including method URL's with spaces to be cleaned-up. Optionally,
+the search index of the Javadoc 9+ is generated as well (.js or .zip).
+"""
+
+import json
+import os
+import zipfile
+
+# Method names start with different letters, so that a split index has more
+# than 9 files (index-10.html sorts before index-2.html)
+METHOD_NAMES = ["add", "build", "create", "delete", "equals", "find", "get", "hash", "insert", "join",
+                "keep", "load", "merge", "next", "open", "put", "query", "remove", "set", "toString",
+                "update", "visit", "write"]
+
+INDEX_TEMPLATE = """<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Frameset//EN" "http://www.w3.org/TR/html4/frameset.dtd">
+<!-- NewPage -->
+<html lang="en">
+<head>
+<!-- Generated by javadoc ({doclet}) on Sun Jan 01 00:00:00 UTC 2017 -->
+<title>{title}</title>
+<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
+</head>
+<frameset cols="20%,80%" title="Documentation frame">
+<frameset rows="30%,70%" title="Left frames">
+<frame src="overview-frame.html" name="packageListFrame" title="All Packages">
+<frame src="allclasses-frame.html" name="packageFrame" title="All classes and interfaces">
+</frameset>
+<frame src="overview-summary.html" name="classFrame" title="Package, class and interface descriptions" scrolling="yes">
+</frameset>
+</html>
+"""
+
+PAGE_TEMPLATE = """<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
+<html lang="en">
+<head>
+<!-- Generated by javadoc ({doclet}) on Sun Jan 01 00:00:00 UTC 2017 -->
+<title>{title}</title>
+<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
+<link rel="stylesheet" type="text/css" href="{root}stylesheet.css" title="Style">
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+class Corpus:
+    """Writes a synthetic Javadoc tree of packages x classes x (methods, inners)."""
+
+    def __init__(self, root, packages=3, classes=4, methods=12, inners=1, split_index=False,
+                 title="Synthetic API", doclet="1.4.2", search_index=None):
+        self.root = root
+        self.packages = packages
+        self.classes = classes
+        self.methods = methods
+        self.inners = inners
+        self.split_index = split_index
+        self.title = title
+        self.doclet = doclet
+        self.search_index = search_index  # None, 'js' or 'zip'
+        self.entries = []
+        # Records of the search index: packages, types and members
+        self.records = {'package': [], 'type': [], 'member': []}
+        self.pages = 0
+
+    def package_names(self):
+        return ["org.synth.p%d" % p for p in range(self.packages)]
+
+    @classmethod
+    def for_pages(cls, root, pages, **kwargs):
+        """Returns a corpus of about the given number of pages, adjusting the number
+        of packages."""
+        corpus = cls(root, **kwargs)
+        pages_per_package = corpus.classes * (1 + corpus.inners) + 4
+        corpus.packages = max(1, round(pages / pages_per_package))
+        return corpus
+
+    def class_names(self):
+        """Returns the (name, interface) of the types of a package"""
+        names = []
+        for c in range(self.classes):
+            # Every 4th type is an interface
+            names.append(("Type%d" % c, c % 4 == 3))
+        return names
+
+    def write(self, rel_path, title, body, text=None):
+        path = os.path.join(self.root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if text is None:
+            root = '../' * rel_path.count('/')
+            text = PAGE_TEMPLATE.format(doclet=self.doclet, title=title, root=root, body=body)
+        with open(path, 'w', newline='\n') as fo:
+            fo.write(text)
+        self.pages += 1
+
+    def generate(self):
+        """Writes the full tree. Returns the number of pages written."""
+        os.makedirs(self.root, exist_ok=True)
+        self.write("index.html", self.title, None, INDEX_TEMPLATE.format(doclet=self.doclet, title=self.title))
+        self.write("stylesheet.css", None, None, "body { color: black }\n")
+        self.write("package-list", None, None, "".join(p + "\n" for p in self.package_names()))
+        books = ['<li><a href="allclasses-frame.html" target="packageFrame">All Classes</a></li>']
+        all_classes = []
+        for package in self.package_names():
+            books.append('<li><a href="%s/package-frame.html" target="packageFrame">%s</a></li>'
+                         % (package.replace('.', '/'), package))
+            all_classes.extend(self.generate_package(package))
+        self.write("overview-frame.html", "Overview List", "<ul>\n%s\n</ul>" % "\n".join(books))
+        self.write("overview-summary.html", "Overview", "<h1>%s</h1>" % self.title)
+        self.write("overview-tree.html", "Class Hierarchy", "<h1>Hierarchy For All Packages</h1>")
+        items = "\n".join(self.class_item("%s/%s.html" % (package.replace('.', '/'), name), package, name, interface)
+                          for package, name, interface in all_classes)
+        self.write("allclasses-frame.html", "All Classes", "<ul>\n%s\n</ul>" % items)
+        self.write("allclasses-noframe.html", "All Classes", "<ul>\n%s\n</ul>" % items)
+        self.generate_index()
+        if self.search_index:
+            self.generate_search_index()
+        return self.pages
+
+    @staticmethod
+    def class_item(href, package, name, interface):
+        if interface:
+            return ('<li><a href="%s" title="interface in %s" target="classFrame">'
+                    '<span class="interfaceName">%s</span></a></li>' % (href, package, name))
+        return '<li><a href="%s" title="class in %s" target="classFrame">%s</a></li>' % (href, package, name)
+
+    def generate_package(self, package):
+        path = package.replace('.', '/')
+        classes = []
+        items = []
+        for name, interface in self.class_names():
+            classes.append((package, name, interface))
+            items.append(self.class_item(name + ".html", package, name, interface))
+            self.generate_class(package, name, interface)
+        self.write(path + "/package-frame.html", package, "<ul>\n%s\n</ul>" % "\n".join(items))
+        self.write(path + "/package-summary.html", package, "<h1>Package %s</h1>" % package)
+        self.write(path + "/package-tree.html", package, "<h1>Hierarchy For Package %s</h1>" % package)
+        self.write(path + "/package-use.html", package, "<h1>Uses of Package %s</h1>" % package)
+        self.entries.append((package, path + "/package-summary.html", "Package %s" % package))
+        self.records['package'].append({"l": package})
+        return classes
+
+    def generate_class(self, package, name, interface, outer=None):
+        path = package.replace('.', '/')
+        full_name = "%s.%s" % (outer, name) if outer else name
+        rel_path = "%s/%s.html" % (path, full_name)
+        root = '../' * rel_path.count('/')
+        rows = []
+        if not outer:
+            for i in range(self.inners):
+                inner = "Inner%d" % i
+                rows.append('<td><code><b><a href="%s%s/%s.%s.html" title="class in %s">%s.%s</a></b></code></td>'
+                            % (root, path, name, inner, package, name, inner))
+                self.generate_class(package, inner, False, name)
+        rows.append('<td><code><b><a href="%s%s#FIELD">FIELD</a></b></code></td>' % (root, rel_path))
+        rows.append('<a name="FIELD"><!-- --></a>')
+        self.entries.append(("FIELD", rel_path + "#FIELD", "Variable in class %s.%s" % (package, full_name)))
+        self.records['member'].append({"p": package, "c": full_name, "l": "FIELD"})
+        for m in range(self.methods):
+            method = METHOD_NAMES[m % len(METHOD_NAMES)]
+            if m >= len(METHOD_NAMES):
+                method += str(m // len(METHOD_NAMES))
+            signature = "%s(int, java.lang.String)" % method
+            rows.append('<td><code><b><a href="%s%s#%s">%s</a></b>(int&nbsp;count, '
+                        '<a href="%sjava/lang/String.html">String</a>&nbsp;text)</code></td>'
+                        % (root, rel_path, signature, method, root))
+            rows.append('<a name="%s"><!-- --></a>' % signature)
+            self.entries.append(("%s(int, String)" % method, rel_path + "#" + signature,
+                                 "Method in class %s.%s" % (package, full_name)))
+            self.records['member'].append({"p": package, "c": full_name, "l": "%s(int, String)" % method,
+                                           "url": signature})
+        self.entries.append((full_name, rel_path, "%s in %s" % ("Interface" if interface else "Class", package)))
+        self.records['type'].append({"p": package, "l": full_name})
+        self.write(rel_path, full_name, "\n".join(rows))
+
+    @staticmethod
+    def index_line(prefix, entry):
+        title, href, description = entry
+        return ('<dt><span class="memberNameLink"><a href="%s%s">%s</a></span> - %s</dt>'
+                % (prefix, href, title, description))
+
+    def generate_index(self):
+        self.entries.sort(key=lambda entry: (entry[0].lower(), entry[0], entry[1]))
+        if not self.split_index:
+            lines = [self.index_line('', entry) for entry in self.entries]
+            self.write("index-all.html", "Index", "<dl>\n%s\n</dl>" % "\n".join(lines))
+            return
+        letters = {}
+        for entry in self.entries:
+            letters.setdefault(entry[0][0].upper(), []).append(entry)
+        for i, letter in enumerate(sorted(letters), 1):
+            lines = [self.index_line('../', entry) for entry in letters[letter]]
+            self.write("index-files/index-%d.html" % i, "%s-Index" % letter, "<dl>\n%s\n</dl>" % "\n".join(lines))
+
+    def generate_search_index(self):
+        """Writes the search index like the Javadoc 9 (with the pseudo records)"""
+        records = dict(self.records)
+        records['package'] = [{"l": "All Packages", "url": "overview-summary.html"}] + records['package']
+        records['type'] = [{"l": "All Classes", "url": "allclasses-noframe.html"}] + records['type']
+        for kind, kind_records in records.items():
+            name = "%s-search-index" % kind
+            data = json.dumps(kind_records, separators=(',', ':'))
+            if self.search_index == 'zip':
+                with zipfile.ZipFile(os.path.join(self.root, name + ".zip"), 'w', zipfile.ZIP_DEFLATED) as archive:
+                    archive.writestr(name + ".json", data)
+                self.pages += 1
+            else:
+                self.write(name + ".js", None, None, "%sSearchIndex = %s" % (kind, data))
+
+
+def generate(root, **kwargs):
+    """Generates a synthetic Javadoc tree in root. Returns the number of pages."""
+    return Corpus(root, **kwargs).generate()
@@ -0,0 +1,63 @@
+"""External sort, used to group the entries of the HHK index (see core.Hhk).
+
+The items are collected into runs of at most run_size items. A full run is
+sorted and spilled to a temporary file, then the runs are merged with a
+k-way merge (heapq.merge): the memory used is bounded by the run size,
+whatever the number of items. A single run is sorted in memory, never
+written to disk.
+"""
+
+import heapq
+import itertools
+import pickle
+import tempfile
+
+import const
+import log as log_
+
+
+def sort(items, key, run_size=const.INDEX_RUN_SIZE):
+    """Yields items sorted by key. The sort is stable: the items with the same key
+    are yielded in their original order."""
+    runs = []
+    run = []
+    try:
+        for item in items:
+            run.append(item)
+            if len(run) >= run_size:
+                runs.append(write_run(sorted(run, key=key)))
+                run = []
+        run.sort(key=key)
+        if not runs:
+            yield from run
+            return
+        log_.get_logger().debug('%d runs of %d items merged' % (len(runs) + 1, run_size))
+        # On a tie, heapq.merge yields the item of the first run: the runs are in order
+        yield from heapq.merge(*([read_run(fo) for fo in runs] + [iter(run)]), key=key)
+    finally:
+        for fo in runs:
+            fo.close()
+
+
+def write_run(items):
+    """Writes items (any iterable, consumed one block at a time) into a temporary
+    file. Returns the file, positioned at the start (see read_run)."""
+    fo = tempfile.TemporaryFile()
+    items = iter(items)
+    while True:
+        block = list(itertools.islice(items, const.RUN_BLOCK_SIZE))
+        if not block:
+            break
+        pickle.dump(block, fo, pickle.HIGHEST_PROTOCOL)
+    fo.seek(0)
+    return fo
+
+
+def read_run(fo):
+    """Yields the items of a run written by write_run, one block in memory at a time"""
+    while True:
+        try:
+            block = pickle.load(fo)
+        except EOFError:
+            return
+        yield from block
@@ -67,6 +67,16 @@ class Jd2chmLogging:
         file_handler.setFormatter(self.formatter)
         self.logger.addHandler(file_handler)
 
+    def add_stream(self, stream):
+        """Also logs into stream (e.g. io.StringIO). Returns the handler (see remove_handler)."""
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(self.formatter)
+        self.logger.addHandler(handler)
+        return handler
+
+    def remove_handler(self, handler):
+        self.logger.removeHandler(handler)
+
     def set_level(self, level=2):
         """level is between 0 and 5: CRITICAL = 5, ERROR = 4, WARNING = 3, INFO = 2, DEBUG = 1, NOTSET = 0."""
         if level not in range(6):
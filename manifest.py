@@ -0,0 +1,108 @@
+"""In-memory manifest of a directory tree.
+
+The tree is scanned once with os.scandir. The build stages then query the
+manifest (existence, listing, size) instead of the file system. Paths are
+relative to the root of the tree and use '/' as separator.
+"""
+
+import os
+import posixpath
+
+
+def normalize(path):
+    """Returns the manifest key of a path relative to the root ('' for the root)."""
+    path = posixpath.normpath(path.replace('\\', '/'))
+    if path == '.':
+        return ''
+    return path
+
+
+class FileManifest:
+    """Files (with size and modification time) and directories of a tree."""
+
+    def __init__(self):
+        self.files = {}          # relative path -> (size, mtime in ns)
+        self.dirs = {'': []}     # relative directory -> entry names, in scan order
+
+    @classmethod
+    def scan(cls, root):
+        """Scans the tree rooted at root, one os.scandir per directory."""
+        manifest = cls()
+        pending = ['']
+        while pending:
+            rel_dir = pending.pop()
+            folder = os.path.join(root, rel_dir) if rel_dir else root
+            names = manifest.dirs.setdefault(rel_dir, [])
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    rel_path = '%s/%s' % (rel_dir, entry.name) if rel_dir else entry.name
+                    if entry.is_dir():
+                        names.append(entry.name)
+                        manifest.dirs[rel_path] = []
+                        pending.append(rel_path)
+                    elif entry.is_file():
+                        names.append(entry.name)
+                        st = entry.stat()
+                        manifest.files[rel_path] = (st.st_size, st.st_mtime_ns)
+        return manifest
+
+    def exists(self, path):
+        """Returns True if path is a file or a directory of the tree."""
+        path = normalize(path)
+        return path in self.files or path in self.dirs
+
+    def isfile(self, path):
+        return normalize(path) in self.files
+
+    def isdir(self, path):
+        return normalize(path) in self.dirs
+
+    def size(self, path):
+        return self.files[normalize(path)][0]
+
+    def mtime(self, path):
+        """Returns the modification time of a file, in nanoseconds"""
+        return self.files[normalize(path)][1]
+
+    def listdir(self, folder=''):
+        """Returns the names of the entries of a directory, in scan order."""
+        return list(self.dirs[normalize(folder)])
+
+    def walk(self, folder='', skip=()):
+        """Yields the relative path of every file below folder, depth first and in
+        scan order. Directories in skip (relative paths) are not visited."""
+        folder = normalize(folder)
+        for name in self.dirs[folder]:
+            rel_path = '%s/%s' % (folder, name) if folder else name
+            if rel_path in self.dirs:
+                if rel_path not in skip:
+                    yield from self.walk(rel_path, skip)
+            else:
+                yield rel_path
+
+    def add(self, path, size=0, mtime=0):
+        """Records a file created after the scan (parent directories included)."""
+        path = normalize(path)
+        if path not in self.files:
+            parent, name = posixpath.split(path)
+            if parent not in self.dirs:
+                self.add_dir(parent)
+            self.dirs[parent].append(name)
+        self.files[path] = (size, mtime)
+
+    def add_dir(self, path):
+        path = normalize(path)
+        if path in self.dirs:
+            return
+        parent, name = posixpath.split(path)
+        if parent not in self.dirs:
+            self.add_dir(parent)
+        self.dirs[parent].append(name)
+        self.dirs[path] = []
+
+    def remove(self, path):
+        """Removes a file deleted after the scan."""
+        path = normalize(path)
+        if self.files.pop(path, None) is not None:
+            parent, name = posixpath.split(path)
+            self.dirs[parent].remove(name)
@@ -0,0 +1,260 @@
+"""Merge of several Javadoc sets into one CHM file, with a unified contents and index.
+
+Each Javadoc root (directory or archive, see archive) is staged into a
+subdirectory of the working directory, named after the library. The
+contents of a library become a top-level book of the HHC file: its items are
+the ones of a single build (see core.Hhc), their links prefixed by the
+subdirectory of the library. The index entries of each library are sorted
+on their own (see extsort) into a run, then the runs are merged with a k-way
+merge (heapq.merge) into one HHK file: the combined index is never held in
+memory. The entries of a keyword are qualified with the title of their
+library ("in java.util.List (Java SE 8)").
+
+The libraries are processed concurrently (see taskgraph): the tasks of a
+library only depend on its own staging. The worker processes (see
+parallel) are divided between the libraries. The contents and the index of the
+libraries are regenerated by every build, the compiler is not run if its
+inputs are unchanged (see core.ChmEnv.compile).
+"""
+
+import collections
+import functools
+import heapq
+import html
+import os
+import shutil
+import tempfile
+import time
+
+import const
+import core
+import extsort
+import log as log_
+import metrics as metrics_
+import parallel
+import staging
+import taskgraph
+from manifest import FileManifest
+
+# A Javadoc set of a merged build: path (directory or archive), name (subdirectory
+# in the working directory) and title (book of the contents)
+Library = collections.namedtuple('Library', ['path', 'name', 'title'])
+
+LOCAL_PARAM = '<param name="Local" value="'
+
+
+class LinkPrefixer:
+    """Writes the items of the contents of a library into fo, the links (Local
+    parameters) prefixed by the subdirectory of the library"""
+
+    def __init__(self, fo, prefix):
+        self.fo = fo
+        self.prefix = prefix
+
+    def write(self, text):
+        self.fo.write(text.replace(LOCAL_PARAM, LOCAL_PARAM + self.prefix))
+
+
+class Merge:
+    """Creates the project files of a merged build in the working directory of env
+    (core.ChmEnv)"""
+
+    def __init__(self, env, libraries, project_title, verify_toc=const.VERIFY_TOC):
+        self.env = env
+        self.libraries = libraries
+        self.project_title = project_title
+        self.verify_toc = verify_toc
+        self.envs = {}       # name -> core.ChmEnv of the library
+        self.contents = {}   # name -> (default file, contents in a temporary file)
+        self.runs = {}       # name -> sorted index entries in a temporary file (see extsort.write_run)
+        self.log = log_.get_logger()
+
+    def add_tasks(self, graph):
+        """Adds the tasks of the libraries (staging, contents, sorted index) and the
+        tasks creating the project files from their results"""
+        for library in self.libraries:
+            env = core.ChmEnv()
+            env.project_name = library.name
+            # The worker processes are shared by the libraries
+            env.jobs = max(1, parallel.get_jobs(self.env.jobs) // len(self.libraries))
+            env.staging = self.env.staging
+            env.incremental = self.env.incremental
+            env.temp_dir = os.path.join(self.env.temp_dir, library.name)
+            self.envs[library.name] = env
+            staged = '%s:%s' % (const.RESOURCE_STAGED, library.name)
+            graph.add('copy_javadoc:%s' % library.name, functools.partial(self.copy_javadoc, library),
+                      inputs=(const.RESOURCE_JAVADOC,), outputs=(staged,))
+            graph.add('create_hhc:%s' % library.name, functools.partial(self.create_contents, library),
+                      inputs=(staged,), outputs=('%s:%s' % (const.RESOURCE_HHC, library.name),))
+            graph.add('create_hhk:%s' % library.name, functools.partial(self.sort_index, library),
+                      inputs=(staged,), outputs=('%s:%s' % (const.RESOURCE_HHK, library.name),))
+        names = [library.name for library in self.libraries]
+        graph.add('create_about', self.create_about,
+                  inputs=['%s:%s' % (const.RESOURCE_STAGED, name) for name in names],
+                  outputs=(const.RESOURCE_STAGED,))
+        graph.add('create_hhp', self.create_hhp, inputs=(const.RESOURCE_STAGED,), outputs=(const.RESOURCE_HHP,))
+        graph.add('create_hhc', self.create_hhc,
+                  inputs=[const.RESOURCE_STAGED] + ['%s:%s' % (const.RESOURCE_HHC, name) for name in names],
+                  outputs=(const.RESOURCE_HHC,))
+        graph.add('create_hhk', self.create_hhk,
+                  inputs=[const.RESOURCE_STAGED] + ['%s:%s' % (const.RESOURCE_HHK, name) for name in names],
+                  outputs=(const.RESOURCE_HHK,))
+
+    def copy_javadoc(self, library):
+        """Stages the Javadoc files of a library into its subdirectory"""
+        env = self.envs[library.name]
+        env.copy_javadoc(library.path)
+        if const.CUSTOM_CSS:
+            env.create_css()
+
+    def create_contents(self, library):
+        """Writes the contents of a library into a temporary file"""
+        env = self.envs[library.name]
+        content_file, default_file = core.read_index_frames(env.temp_dir)
+        self.log.info("Creating HTML Help Contents of %s" % library.name)
+        hhc = core.Hhc(library.name, content_file, default_file, env.manifest, env.jobs, self.verify_toc,
+                       env.temp_dir)
+        fo = tempfile.TemporaryFile('w+', encoding='utf-8')
+        hhc.hhc_file = LinkPrefixer(fo, library.name + '/')
+        # The libraries are processed concurrently: the CR after the dots is written
+        # with the merged index (see core.Hhk.create_hhk)
+        hhc.write_contents()
+        fo.seek(0)
+        self.contents[library.name] = (default_file, fo)
+
+    def sort_index(self, library):
+        """Writes the index entries of a library, sorted by keyword (see
+        core.entry_key), into a temporary file"""
+        env = self.envs[library.name]
+        self.log.info("Sorting HTML Help Index of %s" % library.name)
+        hhk = core.Hhk(library.name, env.manifest, env.jobs, env.temp_dir)
+        prefix = library.name + '/'
+        title = html.escape(library.title)
+        entries = ((prefix + href, keyword, qualify(java_class, title))
+                   for href, keyword, java_class in hhk.iter_entries())
+        self.runs[library.name] = extsort.write_run(extsort.sort(entries, core.entry_key, hhk.run_size))
+
+    def create_about(self):
+        """Creates the About file and the manifest of the working directory, from
+        the manifests of the libraries (the working directory is not scanned)"""
+        manifest = FileManifest()
+        for library in self.libraries:
+            for rel_path, (size, mtime) in self.envs[library.name].manifest.files.items():
+                manifest.add('%s/%s' % (library.name, rel_path), size, mtime)
+        core.create_about(self.env.temp_dir)
+        manifest.add(const.ABOUT_FILE)
+        self.env.manifest = manifest
+        self.env.build_time = self.get_build_time()
+
+    def create_hhp(self):
+        """Creates the HHP file. The default topic is the one of the first library."""
+        first = self.libraries[0]
+        content_file, default_file = core.read_index_frames(self.envs[first.name].temp_dir)
+        self.log.info("Creating HTML Help Project")
+        hhp = core.Hhp(self.env.project_name, self.project_title, '%s/%s' % (first.name, default_file),
+                       self.env.manifest, self.env.temp_dir,
+                       skip=['%s/%s' % (library.name, const.INDEX_DIR) for library in self.libraries])
+        hhp.create_hhp()
+
+    def create_hhc(self):
+        """Creates the HHC file: a book per library, in the order of the libraries"""
+        self.log.info("Creating HTML Help Contents")
+        hhc_file_name = os.path.join(self.env.temp_dir, self.env.project_name + '.hhc')
+        staging.unshare(hhc_file_name)
+        hhc_file = core.ProjectFile(hhc_file_name)
+        str_time = time.strftime("%B-%d-%Y", time.gmtime(self.env.build_time))
+        hhc_file.write(const.FORMAT_TOC_HEADER % str_time)
+        hhc_file.write('<ul>\n')
+        for library in self.libraries:
+            default_file, fo = self.contents.pop(library.name)
+            hhc_file.write(const.FORMAT_CONTENT_BOOK_ITEM % (html.escape(library.title),
+                                                             '%s/%s' % (library.name, default_file)))
+            hhc_file.write('<ul>\n')
+            with fo:
+                shutil.copyfileobj(fo, hhc_file)
+            hhc_file.write('</ul>\n')
+        hhc_file.write('</ul>\n</body>\n</html>\n')
+        hhc_file.close()
+        metrics_.count_written(hhc_file_name)
+
+    def create_hhk(self):
+        """Creates the HHK file from the k-way merge of the sorted index of the
+        libraries"""
+        self.log.info("Creating HTML Help Index")
+        runs = [self.runs.pop(library.name) for library in self.libraries]
+        hhk = core.Hhk(self.env.project_name, self.env.manifest, root=self.env.temp_dir)
+        hhk.build_time = self.env.build_time
+        try:
+            hhk.create_hhk(heapq.merge(*[extsort.read_run(fo) for fo in runs], key=core.entry_key))
+        finally:
+            for fo in runs:
+                fo.close()
+
+    def get_build_time(self):
+        """Returns the time written into the project files and the CHM file: the
+        latest build time of the libraries"""
+        return max(core.get_build_time(self.envs[library.name].manifest) for library in self.libraries)
+
+
+def qualify(java_class, title):
+    """Returns the class of an index entry qualified with the title of its library"""
+    if java_class:
+        return '%s (%s)' % (java_class, title)
+    return title
+
+
+def get_libraries(paths, titles):
+    """Returns the Library of each Javadoc path, with its title. The name is the
+    name of the directory or of the archive, made unique."""
+    libraries = []
+    names = set()
+    for path, title in zip(paths, titles):
+        path = os.path.abspath(path)
+        base_name = os.path.splitext(os.path.basename(path.rstrip('/\\')))[0] or 'javadoc'
+        name = base_name
+        cpt = 1
+        while name.lower() in names:
+            cpt += 1
+            name = '%s-%d' % (base_name, cpt)
+        names.add(name.lower())
+        libraries.append(Library(path, name, title))
+    return libraries
+
+
+def build(libraries, project_name, project_title, work_dir=None, output_dir=None, jobs=const.JOBS,
+          staging_mode=const.STAGING, incremental=const.INCREMENTAL, compiler=const.COMPILER,
+          verify_toc=const.VERIFY_TOC):
+    """Builds one CHM file from several Javadoc sets (Library, see get_libraries).
+    Returns a core.BuildResult.
+
+    The options are the ones of core.build. The CHM file is written into
+    output_dir (default: the output directory of the first library, see
+    core.get_output_dir).
+    """
+    libraries = [library._replace(path=os.path.abspath(library.path)) for library in libraries]
+    if not libraries:
+        raise ValueError('No Javadoc to merge')
+    if len(set(library.name.lower() for library in libraries)) < len(libraries):
+        raise ValueError('The names of the libraries are not unique')
+    if output_dir is None:
+        output_dir = core.get_output_dir(libraries[0].path)
+    remove_work_dir = work_dir is None and not incremental
+    if work_dir is None:
+        work_dir = core.get_work_dir(project_name) if incremental else core.create_work_dir(project_name)
+    metrics = metrics_.set_metrics(None)
+    env = core.ChmEnv()
+    # The libraries are staged, and their contents and index created, concurrently
+    graph = taskgraph.TaskGraph()
+    try:
+        env.configure(project_name, jobs, staging_mode, incremental, compiler, work_dir, output_dir)
+        os.makedirs(env.temp_dir, exist_ok=True)
+        Merge(env, libraries, project_title, verify_toc).add_tasks(graph)
+        graph.add('make', env.compile, inputs=(const.RESOURCE_STAGED, const.RESOURCE_HHP, const.RESOURCE_HHC,
+                                               const.RESOURCE_HHK), outputs=(const.RESOURCE_CHM,))
+        chm_file = graph.run(parallel.get_jobs(jobs))['make']
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    metrics.task_graph = graph.report()
+    log_.get_logger().info('Build stages:\n%s' % graph.format_report())
+    return core.BuildResult(chm_file, project_name, None if remove_work_dir else env.temp_dir, metrics)
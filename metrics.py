@@ -0,0 +1,156 @@
+"""
+Build metrics for jd2chm.
+
+Every build stage is recorded with its wall time, CPU time (its thread and
+the tasks of its worker processes), files and bytes read/written, files
+skipped by the clean-up and regex matches. The stages count their I/O with
+count(). In a worker process, the counts are accumulated and sent back with
+the result of each task (see parallel.imap_ordered). The peak resident
+memory is only reported for the whole build, as the stages may run
+concurrently in threads of the same process.
+"""
+
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+COUNTERS = ['files_read', 'files_written', 'files_linked', 'files_skipped', 'bytes_read', 'bytes_written',
+            'regex_matches']
+
+_local = threading.local()
+# Counts made outside of any stage (worker processes)
+_pending = collections.Counter()
+
+
+class Metrics:
+    """Metrics of the stages of one build"""
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+        self.start_time = time.time()
+        # Start times, durations and critical path of the stages (taskgraph.TaskGraph.report)
+        self.task_graph = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager recording a stage. The counts and the CPU time of the
+        current thread are attributed to the stage while it runs."""
+        record = self.stages.setdefault(name, dict.fromkeys(COUNTERS, 0))
+        stack = get_stack()
+        stack.append(record)
+        start_wall = time.perf_counter()
+        start_cpu = cpu_time()
+        try:
+            yield record
+        finally:
+            stack.pop()
+            record['wall_time'] = round(record.get('wall_time', 0) + time.perf_counter() - start_wall, 4)
+            record['cpu_time'] = round(record.get('cpu_time', 0) + cpu_time() - start_cpu, 4)
+
+    def report(self):
+        """Returns the metrics as a dictionary (JSON serializable)"""
+        totals = dict.fromkeys(COUNTERS, 0)
+        totals['wall_time'] = 0
+        totals['cpu_time'] = 0
+        for record in self.stages.values():
+            for key in totals:
+                totals[key] += record.get(key, 0)
+        totals['wall_time'] = round(totals['wall_time'], 4)
+        totals['cpu_time'] = round(totals['cpu_time'], 4)
+        totals['peak_rss'], totals['peak_rss_children'] = peak_rss()
+        report = {
+            'start_time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.start_time)),
+            'stages': self.stages,
+            'total': totals,
+        }
+        if self.task_graph is not None:
+            report['task_graph'] = self.task_graph
+        return report
+
+    def write(self, path):
+        """Writes the JSON report"""
+        with open(path, 'w') as fo:
+            json.dump(self.report(), fo, indent=2)
+
+
+def get_stack():
+    """Returns the stack of the stages running in the current thread"""
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def get_metrics():
+    """Returns the metrics of the build running in the current thread."""
+    if getattr(_local, 'metrics', None) is None:
+        _local.metrics = Metrics()
+    return _local.metrics
+
+
+def set_metrics(metrics):
+    """Attaches metrics to the current thread (a new build if None). Returns the metrics."""
+    _local.metrics = metrics if metrics is not None else Metrics()
+    return _local.metrics
+
+
+def count(**counters):
+    """Adds counts (see COUNTERS) to the stage running in the current thread"""
+    stack = get_stack()
+    target = stack[-1] if stack else _pending
+    for key, value in counters.items():
+        target[key] = target.get(key, 0) + value
+
+
+def count_read(fo, **counters):
+    """Counts a file read by a stage (fo: open file object) and other counts"""
+    count(files_read=1, bytes_read=os.fstat(fo.fileno()).st_size, **counters)
+
+
+def count_written(path, **counters):
+    """Counts a file written by a stage and other counts"""
+    count(files_written=1, bytes_written=os.path.getsize(path), **counters)
+
+
+def start_task():
+    """Starts a task in a worker process: the counts are accumulated until
+    pop_pending (the stages inherited from a forked parent are dropped)."""
+    get_stack().clear()
+    _pending.clear()
+
+
+def pop_pending():
+    """Returns and resets the counts made outside of any stage"""
+    counts = dict(_pending)
+    _pending.clear()
+    return counts
+
+
+def cpu_time():
+    """Returns the CPU time of the current thread (seconds). The CPU time of the
+    tasks run by the worker processes is counted by parallel.imap_ordered."""
+    return time.thread_time()
+
+
+def peak_rss():
+    """Returns the peak resident set size (bytes) of the process and of its children
+    (None if not available)."""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource:
+        # ru_maxrss is in kilobytes, except on macOS
+        unit = 1 if sys.platform == 'darwin' else 1024
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+    try:
+        import win32api
+        import win32process
+    except ImportError:
+        return None, None
+    info = win32process.GetProcessMemoryInfo(win32api.GetCurrentProcess())
+    return info['PeakWorkingSetSize'], None
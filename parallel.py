@@ -0,0 +1,83 @@
+"""Process pool helpers shared by the jd2chm build stages."""
+
+import collections
+import functools
+import multiprocessing
+import os
+import threading
+import concurrent.futures
+
+import metrics as metrics_
+
+
+def get_jobs(jobs=0):
+    """Returns the number of worker processes to use (0 or None: one per core)."""
+    if not jobs or jobs < 1:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def get_context():
+    """Returns the multiprocessing context of the process pools (None: default).
+
+    A process forked while other threads run (concurrent build stages, see
+    taskgraph) may inherit a lock held by one of these threads: the workers
+    are then started by a fork server, where available.
+    """
+    if threading.active_count() > 1 and 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return None
+
+
+def imap_ordered(func, items, jobs=0, initializer=None, initargs=(), window=None):
+    """Applies func to every item and yields the results in the order of items.
+
+    With more than one job, the items are sharded across a process pool. func
+    must be a module level function so that it can be sent to the workers.
+    initializer(*initargs) is called once in each worker. If window is
+    provided, at most window items are in flight (submitted or waiting to be
+    yielded), which bounds the memory used by the results. The counts made by
+    the workers (metrics.count) and the CPU time of their tasks are added to
+    the stage of the caller.
+    """
+    items = list(items)
+    jobs = min(get_jobs(jobs), len(items))
+    if jobs <= 1:
+        if initializer:
+            initializer(*initargs)
+        for item in items:
+            yield func(item)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=initializer,
+                                                initargs=initargs, mp_context=get_context()) as pool:
+        if window is None:
+            chunksize = max(1, len(items) // (jobs * 4))
+            for result, counts in pool.map(functools.partial(call_counted, func), items, chunksize=chunksize):
+                metrics_.count(**counts)
+                yield result
+            return
+        pending = collections.deque()
+        for item in items:
+            if len(pending) >= window:
+                yield get_counted(pending.popleft())
+            pending.append(pool.submit(call_counted, func, item))
+        while pending:
+            yield get_counted(pending.popleft())
+
+
+def call_counted(func, item):
+    """Runs func(item) in a worker. Returns the result and the counts made by func,
+    including its CPU time."""
+    metrics_.start_task()
+    start_cpu = metrics_.cpu_time()
+    result = func(item)
+    metrics_.count(cpu_time=metrics_.cpu_time() - start_cpu)
+    return result, metrics_.pop_pending()
+
+
+def get_counted(future):
+    """Returns the result of a call_counted future, after adding its counts to the
+    current stage."""
+    result, counts = future.result()
+    metrics_.count(**counts)
+    return result
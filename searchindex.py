@@ -0,0 +1,188 @@
+"""Search index of the Javadoc 9 and later.
+
+Besides the HTML index (index-all.html or index-files), the Javadoc 9+
+generates the search index of the packages, types and members as JSON
+records: package-search-index.js, type-search-index.js and
+member-search-index.js (a JavaScript assignment of a JSON array). The
+Javadoc 9 and 10 also zip the records (package-search-index.zip containing
+package-search-index.json...).
+
+The records are turned into the (href, title, class) entries of the HHK file,
+the way search.js computes the URL of a search result. With the package
+list (package-list, or element-list since the Javadoc 10), they also give
+the packages, types and members of the HHC file without reading the class
+pages.
+"""
+
+import collections
+import json
+import os
+import zipfile
+
+import const
+import metrics as metrics_
+
+
+def get_path(manifest, name):
+    """Returns the path of the search index name (.js or .zip), None if not found."""
+    for ext in ('.js', '.zip'):
+        if manifest.isfile(name + ext):
+            return name + ext
+    return None
+
+
+def has_search_index(manifest):
+    """Returns True if the Javadoc in manifest has a search index"""
+    return get_path(manifest, const.TYPE_SEARCH_INDEX) is not None
+
+
+def is_search_index_file(rel_path):
+    return rel_path in [name + ext
+                        for name in (const.PACKAGE_SEARCH_INDEX, const.TYPE_SEARCH_INDEX, const.MEMBER_SEARCH_INDEX)
+                        for ext in ('.js', '.zip')]
+
+
+def load(manifest, name, root='.'):
+    """Returns the records of the search index name (empty if not found). root is
+    the directory of manifest."""
+    path = get_path(manifest, name)
+    if path is None:
+        return []
+    with open(os.path.join(root, path), 'rb') as fo:
+        metrics_.count_read(fo)
+        if path.endswith('.zip'):
+            with zipfile.ZipFile(fo) as archive:
+                members = archive.namelist()
+                member = name + '.json' if name + '.json' in members else members[0]
+                data = archive.read(member)
+        else:
+            data = fo.read()
+    # Javadoc 12+ appends ';updateSearchResults();' to the array
+    start = data.find(b'[')
+    end = data.rfind(b']')
+    if start == -1 or end < start:
+        return []
+    return json.loads(data[start:end + 1].decode('utf-8'))
+
+
+def read_package_list(manifest, root='.'):
+    """Returns the packages of element-list or package-list, in order (None if
+    not found). The module lines (module:name) of element-list are skipped."""
+    for name in (const.ELEMENT_LIST, const.PACKAGE_LIST):
+        if manifest.isfile(name):
+            with open(os.path.join(root, name), 'rb') as fo:
+                metrics_.count_read(fo)
+                lines = fo.read().decode('utf-8').splitlines()
+            return [line.strip() for line in lines if line.strip() and not line.startswith('module:')]
+    return None
+
+
+class SearchIndex:
+    """Packages, types and members of a Javadoc search index"""
+
+    def __init__(self, manifest, root='.'):
+        self.manifest = manifest
+        self.root = root
+        self.packages = load(manifest, const.PACKAGE_SEARCH_INDEX, root)
+        self.types = load(manifest, const.TYPE_SEARCH_INDEX, root)
+        self.members = load(manifest, const.MEMBER_SEARCH_INDEX, root)
+        # Module of the packages, when the pages are in module directories (Javadoc 11+)
+        self.modules = {}
+        for record in self.packages:
+            if 'm' in record and manifest.isdir(record['m']):
+                self.modules[record['l']] = record['m']
+        # Types by package and by outer type, members by type
+        self.package_types = collections.defaultdict(list)
+        self.inner_types = collections.defaultdict(list)
+        self.type_members = collections.defaultdict(list)
+        names = set((record['p'], record['l']) for record in self.types if 'p' in record)
+        for record in self.types:
+            if 'p' not in record:
+                continue
+            outer = record['l'].rpartition('.')[0]
+            if outer and (record['p'], outer) in names:
+                self.inner_types[record['p'], outer].append(record)
+            else:
+                self.package_types[record['p']].append(record)
+        for record in self.members:
+            self.type_members[record['p'], record['c']].append(record)
+
+    def get_prefix(self, package):
+        """Returns the directory of the pages of a package ('' for the unnamed package)"""
+        prefix = ''
+        if package in self.modules:
+            prefix = self.modules[package] + '/'
+        if package and package != const.UNNAMED_PACKAGE:
+            prefix += package.replace('.', '/') + '/'
+        return prefix
+
+    def get_packages(self):
+        """Returns the packages in the order of the package list (or by name),
+        the unnamed package last"""
+        packages = read_package_list(self.manifest, self.root)
+        if packages is None:
+            packages = sorted(record['l'] for record in self.packages
+                              if 'u' not in record and 'url' not in record and record['l'] != const.UNNAMED_PACKAGE)
+        if const.UNNAMED_PACKAGE in self.package_types and const.UNNAMED_PACKAGE not in packages:
+            packages.append(const.UNNAMED_PACKAGE)
+        return packages
+
+    def get_types(self, package):
+        """Returns the records of the top level types of a package, by name"""
+        return sorted(self.package_types.get(package, []), key=type_key)
+
+    def get_all_types(self):
+        """Returns the records of the top level types of all the packages, by name"""
+        return sorted([record for records in self.package_types.values() for record in records],
+                      key=lambda record: type_key(record) + (record['p'],))
+
+    def get_inners(self, record):
+        """Returns the records of the types nested in a type, by name"""
+        return sorted(self.inner_types.get((record['p'], record['l']), []), key=type_key)
+
+    def get_members(self, record):
+        """Returns the records of the members of a type, in the order of the search index"""
+        return self.type_members.get((record['p'], record['l']), [])
+
+    def package_url(self, record):
+        return self.get_prefix(record['l']) + const.PACKAGE_SUMMARY
+
+    def type_url(self, record):
+        if 'u' in record:
+            return record['u']
+        return '%s%s.html' % (self.get_prefix(record['p']), record['l'])
+
+    def member_url(self, record):
+        # The anchor is the label unless provided (url with Javadoc 9-15, u since)
+        anchor = record.get('u', record.get('url', record['l']))
+        return '%s%s.html#%s' % (self.get_prefix(record['p']), record['c'], anchor)
+
+    def iter_records(self):
+        """Yields the (href, title, java_class) of the packages, types and members,
+        java_class being the qualified name of the type (of the package for a
+        package record). The pseudo records ('All Classes', 'All Packages') are
+        skipped."""
+        for record in self.packages:
+            if 'u' not in record and 'url' not in record:
+                yield self.package_url(record), record['l'], record['l']
+        for record in self.types:
+            if 'p' in record:
+                yield self.type_url(record), record['l'], qualify(record['p'], record['l'])
+        for record in self.members:
+            yield self.member_url(record), record['l'], qualify(record['p'], record['c'])
+
+    def get_entries(self):
+        """Returns the (href, title, java_class) of the records in the order of the
+        index (by title, ignoring the case), the entries of a keyword being adjacent."""
+        return sorted(self.iter_records(), key=lambda entry: (entry[1].lower(), entry[1], entry[0]))
+
+
+def qualify(package, name):
+    """Returns the qualified name of a type of a package"""
+    if package == const.UNNAMED_PACKAGE:
+        return name
+    return '%s.%s' % (package, name)
+
+
+def type_key(record):
+    return record['l'].lower(), record['l']
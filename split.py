@@ -0,0 +1,283 @@
+"""Split build of a very large Javadoc: several CHM files merged by a master CHM
+file (modular HTML Help).
+
+The HTML Help compiler slows down sharply, and eventually fails, on the
+largest projects (JDK). The packages are partitioned into sub-projects of
+about the same size (bytes of the pages, see partition), consecutive in the
+order of the packages so that the merged contents keeps this order. Each
+sub-project has its own HHP, HHC and HHK files, made of the pages of its
+packages, and is compiled into its own CHM file. The master project holds
+the other pages (overview, hierarchy...): its HHP file lists the CHM files
+of the sub-projects in [MERGE FILES] and its HHC file merges their contents
+after the overview. The CHM files of the sub-projects are written next to
+the master CHM file, where the help viewer looks for them.
+
+The Javadoc is staged once, into one working directory. The index is sorted
+once, each entry written into the HHK file of the sub-project of its page.
+The sub-projects are compiled concurrently (see taskgraph), at most one per
+job. The viewer doesn't follow the links between the pages of two CHM files.
+"""
+
+import functools
+import os
+import posixpath
+import shutil
+import time
+
+import archive
+import const
+import core
+import extsort
+import log as log_
+import metrics as metrics_
+import parallel
+import staging
+import taskgraph
+from manifest import FileManifest
+
+
+class Split:
+    """Creates and compiles the sub-projects and the master project of a split
+    build in the working directory of env (core.ChmEnv, master project)"""
+
+    def __init__(self, env, groups, project_title, verify_toc=const.VERIFY_TOC):
+        self.env = env
+        self.groups = groups
+        self.project_title = project_title
+        self.verify_toc = verify_toc
+        self.part_of = {package_dir: number for number, group in enumerate(groups) for package_dir in group}
+        self.parts = []
+        for number in range(len(groups)):
+            part = core.ChmEnv()
+            part.project_name = const.SPLIT_PART_NAME % (env.project_name, number + 1)
+            part.jobs = env.jobs
+            part.staging = env.staging
+            part.incremental = env.incremental
+            part.compiler = env.compiler
+            part.html_compiler = env.html_compiler
+            part.start_dir = env.start_dir
+            part.temp_dir = env.temp_dir
+            self.parts.append(part)
+        self.manifest = None  # Manifest of all the staged files (env.manifest: files of the master project)
+        self.log = log_.get_logger()
+
+    def add_tasks(self, graph):
+        """Adds the tasks creating the project files of the sub-projects and of the
+        master project, and compiling them (the sub-projects concurrently)"""
+        graph.add('split_manifest', self.split_manifest, outputs=(const.RESOURCE_STAGED,))
+        for number, part in enumerate(self.parts):
+            hhp, hhc = ['%s:%d' % (resource, number + 1) for resource in (const.RESOURCE_HHP, const.RESOURCE_HHC)]
+            graph.add('create_hhp:%d' % (number + 1), functools.partial(self.create_part_hhp, number),
+                      inputs=(const.RESOURCE_STAGED,), outputs=(hhp,))
+            graph.add('create_hhc:%d' % (number + 1), functools.partial(self.create_part_hhc, number),
+                      inputs=(const.RESOURCE_STAGED,), outputs=(hhc,))
+        graph.add('create_hhp', self.create_hhp, inputs=(const.RESOURCE_STAGED,), outputs=(const.RESOURCE_HHP,))
+        graph.add('create_hhc', self.create_hhc, inputs=(const.RESOURCE_STAGED,), outputs=(const.RESOURCE_HHC,))
+        graph.add('create_hhk', self.create_hhk, inputs=(const.RESOURCE_STAGED,), outputs=(const.RESOURCE_HHK,))
+        chm_files = []
+        for number, part in enumerate(self.parts):
+            resources = ['%s:%d' % (resource, number + 1) for resource in (const.RESOURCE_HHP, const.RESOURCE_HHC)]
+            chm_files.append('%s:%d' % (const.RESOURCE_CHM, number + 1))
+            graph.add('make:%d' % (number + 1), part.compile,
+                      inputs=[const.RESOURCE_STAGED, const.RESOURCE_HHK] + resources, outputs=(chm_files[-1],))
+        # The master CHM file is compiled once the CHM files it merges are written
+        graph.add('make', self.env.compile, inputs=[const.RESOURCE_STAGED, const.RESOURCE_HHP, const.RESOURCE_HHC,
+                                                    const.RESOURCE_HHK] + chm_files, outputs=(const.RESOURCE_CHM,))
+
+    def split_manifest(self):
+        """Splits the manifest of the staged files: the pages of the packages of each
+        sub-project, the other pages for the master project. The other files
+        (stylesheet, scripts, search index) are shared by all the projects, the
+        project files and the CHM files of a previous build are left out."""
+        self.manifest = self.env.manifest
+        names = [self.env.project_name] + [part.project_name for part in self.parts]
+        generated = {const.STAGING_MANIFEST, const.HHC_LOG}
+        for name in names:
+            generated.update(name + ext for ext in ('.hhp', '.hhc', '.hhk', '.chm', '.chm' + const.FINGERPRINT_EXT,
+                                                    '.log'))
+        master = FileManifest()
+        manifests = [FileManifest() for part in self.parts]
+        for rel_path, (size, mtime) in self.manifest.files.items():
+            if rel_path in generated:
+                continue
+            number = self.get_part(rel_path)
+            if number is not None:
+                manifests[number].add(rel_path, size, mtime)
+            else:
+                master.add(rel_path, size, mtime)
+                if not core.is_html_file(rel_path):
+                    for manifest in manifests:
+                        manifest.add(rel_path, size, mtime)
+        # The files of all the projects have the time of the Javadoc (see core.get_build_time)
+        build_time = core.get_build_time(self.manifest)
+        for part, manifest in zip(self.parts, manifests):
+            part.manifest = manifest
+            part.build_time = build_time
+        self.env.manifest = master
+        self.env.build_time = build_time
+
+    def get_part(self, rel_path):
+        """Returns the number (from 0) of the sub-project of a file, None if the file
+        is not in a package"""
+        package_dir = get_package_dir(rel_path, self.part_of)
+        return None if package_dir is None else self.part_of[package_dir]
+
+    def create_part_hhp(self, number):
+        """Creates the HHP file of a sub-project. The default topic is its first package."""
+        part = self.parts[number]
+        title = '%s (%d/%d)' % (self.project_title, number + 1, len(self.parts))
+        default_file = posixpath.join(self.groups[number][0], const.PACKAGE_SUMMARY)
+        self.log.info("Creating HTML Help Project %s" % part.project_name)
+        core.Hhp(part.project_name, title, default_file, part.manifest, part.temp_dir,
+                 log_file=part.project_name + '.log').create_hhp()
+
+    def create_part_hhc(self, number):
+        """Creates the HHC file of a sub-project: the books of its packages"""
+        part = self.parts[number]
+        content_file, default_file = core.read_index_frames(part.temp_dir)
+        self.log.info("Creating HTML Help Contents %s" % part.project_name)
+        hhc = core.Hhc(part.project_name, content_file, default_file, part.manifest, part.jobs, self.verify_toc,
+                       part.temp_dir)
+        hhc.build_time = part.build_time
+        hhc.create_hhc()
+        print()  # Add a CR after the dots
+
+    def create_hhp(self):
+        """Creates the HHP file of the master project"""
+        content_file, default_file = core.read_index_frames(self.env.temp_dir)
+        self.log.info("Creating HTML Help Project")
+        core.Hhp(self.env.project_name, self.project_title, default_file, self.env.manifest, self.env.temp_dir,
+                 merge_files=[part.project_name + '.chm' for part in self.parts], binary=False).create_hhp()
+
+    def create_hhc(self):
+        """Creates the HHC file of the master project: the overview, then the contents
+        of the sub-projects"""
+        content_file, default_file = core.read_index_frames(self.env.temp_dir)
+        self.log.info("Creating HTML Help Contents")
+        hhc = core.Hhc(self.env.project_name, content_file, default_file, self.env.manifest,
+                       root=self.env.temp_dir)
+        hhc_file_name = os.path.join(self.env.temp_dir, hhc.hhc_file_name)
+        staging.unshare(hhc_file_name)
+        hhc.hhc_file = core.ProjectFile(hhc_file_name)
+        str_time = time.strftime("%B-%d-%Y", time.gmtime(self.env.build_time))
+        hhc.hhc_file.write(const.FORMAT_TOC_HEADER % str_time)
+        hhc.hhc_file.write('<ul>\n')
+        hhc.write_overview()
+        for part in self.parts:
+            hhc.hhc_file.write(const.FORMAT_CONTENT_MERGE_ITEM % (part.project_name + '.chm',
+                                                                  part.project_name + '.hhc'))
+        hhc.hhc_file.write('</ul>\n</body>\n</html>\n')
+        hhc.hhc_file.close()
+        metrics_.count_written(hhc_file_name)
+
+    def create_hhk(self):
+        """Creates the HHK files: the index is sorted once (see core.Hhk), each entry
+        is written into the HHK file of the project of its page"""
+        self.log.info("Creating HTML Help Index")
+        master = core.Hhk(self.env.project_name, self.manifest, self.env.jobs, self.env.temp_dir)
+        hhks = [core.Hhk(part.project_name, part.manifest, root=part.temp_dir) for part in self.parts]
+        for hhk in hhks + [master]:
+            hhk.build_time = self.env.build_time
+            hhk.open_file()
+        for href, title, java_class in extsort.sort(master.iter_entries(), core.entry_key, master.run_size):
+            number = self.get_part(href.partition('#')[0])
+            hhk = master if number is None else hhks[number]
+            hhk.write_index(href, title, java_class)
+        print()  # Add a CR after the dots
+        for hhk in hhks + [master]:
+            hhk.close_file()
+
+
+def get_package_dirs(manifest):
+    """Returns the directories of the packages of a Javadoc (with a package summary),
+    sorted"""
+    return sorted(rel_dir for rel_dir in manifest.dirs
+                  if rel_dir and manifest.isfile(posixpath.join(rel_dir, const.PACKAGE_SUMMARY)))
+
+
+def get_package_dir(rel_path, package_dirs):
+    """Returns the directory of the package of a file (the deepest of package_dirs
+    containing the file), None if the file is not in a package"""
+    rel_dir = posixpath.dirname(rel_path)
+    while rel_dir:
+        if rel_dir in package_dirs:
+            return rel_dir
+        rel_dir = posixpath.dirname(rel_dir)
+    return None
+
+
+def get_package_sizes(manifest, package_dirs):
+    """Returns [(package directory, bytes of its pages)], in the order of package_dirs"""
+    sizes = dict.fromkeys(package_dirs, 0)
+    for rel_path in manifest.files:
+        package_dir = get_package_dir(rel_path, sizes)
+        if package_dir is not None and core.is_html_file(rel_path):
+            sizes[package_dir] += manifest.size(rel_path)
+    return list(sizes.items())
+
+
+def partition(weights, parts):
+    """Splits the items of weights [(item, weight)] into at most parts groups of
+    consecutive items, of about the same total weight. Returns the groups (lists
+    of items)."""
+    total = sum(weight for item, weight in weights)
+    groups = [[]]
+    start = 0  # Weight of the previous groups
+    cumul = 0
+    for item, weight in weights:
+        if groups[-1] and len(groups) < parts:
+            # The remaining weight is shared by the remaining groups: a new group starts
+            # when the middle of the item is past the end of the current group
+            end = start + (total - start) / (parts - len(groups) + 1)
+            if cumul + weight / 2 > end:
+                groups.append([])
+                start = cumul
+        groups[-1].append(item)
+        cumul += weight
+    return groups
+
+
+def build(javadoc_dir, project_name, project_title, parts, work_dir=None, output_dir=None, jobs=const.JOBS,
+          staging_mode=const.STAGING, incremental=const.INCREMENTAL, compiler=const.COMPILER,
+          verify_toc=const.VERIFY_TOC):
+    """Builds the CHM file of a Javadoc split into at most parts sub-projects, and
+    the CHM files of the sub-projects. Returns a core.BuildResult (master CHM
+    file).
+
+    The options are the ones of core.build. A Javadoc without packages is not
+    split (see core.build).
+    """
+    javadoc_dir = os.path.abspath(javadoc_dir)
+    log = log_.get_logger()
+    source = archive.get_manifest(javadoc_dir)
+    groups = partition(get_package_sizes(source, get_package_dirs(source)), parts)
+    if not groups[0]:
+        log.warning('No package found in %s, the Javadoc is not split' % javadoc_dir)
+        return core.build(javadoc_dir, project_name, project_title, work_dir, output_dir, jobs, staging_mode,
+                          incremental, compiler, verify_toc)
+    log.info('%d packages split into %d sub-projects' % (sum(len(group) for group in groups), len(groups)))
+    if output_dir is None:
+        output_dir = core.get_output_dir(javadoc_dir)
+    remove_work_dir = work_dir is None and not incremental
+    if work_dir is None:
+        work_dir = core.get_work_dir(project_name) if incremental else core.create_work_dir(project_name)
+    metrics = metrics_.set_metrics(None)
+    env = core.ChmEnv()
+    graph = taskgraph.TaskGraph()
+    try:
+        env.configure(project_name, jobs, staging_mode, incremental, compiler, work_dir, output_dir)
+        split = Split(env, groups, project_title, verify_toc)
+        for part in split.parts:
+            # CHM file of a previous build (raises OSError if the file is open)
+            chm_file = os.path.join(env.start_dir, part.project_name + '.chm')
+            if os.path.exists(chm_file):
+                os.unlink(chm_file)
+        env.add_tasks(graph, javadoc_dir)
+        split.add_tasks(graph)
+        chm_file = graph.run(parallel.get_jobs(jobs))['make']
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    metrics.task_graph = graph.report()
+    log.info('Build stages:\n%s' % graph.format_report())
+    return core.BuildResult(chm_file, project_name, None if remove_work_dir else env.temp_dir, metrics)
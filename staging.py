@@ -0,0 +1,219 @@
+"""Staging of the Javadoc files into the jd2chm working directory.
+
+The staging directory keeps a manifest (const.STAGING_MANIFEST) of the
+source files it was built from: size, modification time and hash. An
+incremental build only syncs the files added, changed or deleted since the
+previous build.
+
+Besides a plain copy, the files can be staged as reflinks (copy-on-write
+clones, where the file system supports it) or as hard links. A hard link
+shares the data with the Javadoc source: any stage that modifies a staged
+file must call unshare() first, so that the source tree is never modified.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+
+import archive
+import const
+import metrics as metrics_
+import parallel
+
+# ioctl request to clone a file on Linux (btrfs, xfs...): _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+_reflink_supported = None
+
+
+def reflink(src, dst):
+    """Clones src into dst (copy-on-write). Returns False if the file system
+    or the platform doesn't support it."""
+    global _reflink_supported
+    if _reflink_supported is False:
+        return False
+    try:
+        import fcntl
+    except ImportError:
+        _reflink_supported = False
+        return False
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            cloned = False
+        else:
+            cloned = True
+    if not cloned:
+        os.unlink(dst)
+        _reflink_supported = False
+        return False
+    _reflink_supported = True
+    shutil.copystat(src, dst)
+    return True
+
+
+def link_file(src, dst):
+    """Stages src as a reflink, or a hard link. Falls back to a copy if the file
+    can't be linked (for example, if the working directory is on another volume).
+
+    Can be used as the copy_function of shutil.copytree.
+    """
+    if archive.split_member(src):
+        # A member of a Javadoc archive is extracted
+        return copy_file(src, dst)
+    if reflink(src, dst):
+        metrics_.count(files_linked=1)
+        return dst
+    try:
+        os.link(src, dst)
+    except OSError:
+        return copy_file(src, dst)
+    metrics_.count(files_linked=1)
+    return dst
+
+
+def copy_file(src, dst):
+    """Stages src as a copy (shutil.copy2), or extracted from a Javadoc archive."""
+    member = archive.split_member(src)
+    if member:
+        return member[0].extract(member[1], dst)
+    dst = shutil.copy2(src, dst)
+    metrics_.count_written(dst)
+    return dst
+
+
+def get_copy_function(mode):
+    """Returns the function staging a file for the given mode (const.STAGING_*)."""
+    if mode == const.STAGING_LINK:
+        return link_file
+    return copy_file
+
+
+def unshare(path):
+    """Breaks the hard link between a staged file and its source.
+
+    The file is removed if it has more than one link, therefore the caller
+    creates a private copy when writing the file. Must be called before
+    modifying a staged file.
+    """
+    try:
+        if os.stat(path).st_nlink > 1:
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+# Files added, changed and deleted in the staging directory (relative paths).
+# full is True when the whole tree was staged.
+Changes = collections.namedtuple('Changes', ['full', 'added', 'changed', 'deleted'])
+
+
+def scan_tree(root):
+    """Returns {relative path: (size, mtime)} for the files under root (a
+    directory or a Javadoc archive). Relative paths use '/' as separator."""
+    return archive.get_manifest(root).files
+
+
+def hash_file(path):
+    """Returns the path and the SHA-1 digest of the file content."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fo:
+        metrics_.count_read(fo)
+        for block in iter(lambda: fo.read(const.HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return path, digest.hexdigest()
+
+
+def hash_files(root, rel_paths, jobs=const.JOBS):
+    """Returns {relative path: hash} for the given files under root. The files of
+    a Javadoc archive are not read (see archive.JavadocArchive.get_hashes)."""
+    if archive.is_archive(root):
+        return archive.get_archive(root).get_hashes(rel_paths)
+    paths = [os.path.join(root, rel_path) for rel_path in rel_paths]
+    hashes = parallel.imap_ordered(hash_file, paths, jobs)
+    return {rel_path: digest for rel_path, (path, digest) in zip(rel_paths, hashes)}
+
+
+def load_manifest(staging_dir):
+    """Returns the files recorded in the manifest of staging_dir, or None if the
+    manifest is missing or invalid."""
+    manifest_path = os.path.join(staging_dir, const.STAGING_MANIFEST)
+    try:
+        with open(manifest_path) as fo:
+            manifest = json.load(fo)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != const.STAGING_MANIFEST_VERSION:
+        return None
+    return manifest.get('files')
+
+
+def save_manifest(staging_dir, files):
+    """Writes the manifest {relative path: {'size', 'mtime', 'hash'}} of staging_dir."""
+    manifest_path = os.path.join(staging_dir, const.STAGING_MANIFEST)
+    with open(manifest_path, 'w') as fo:
+        json.dump({'version': const.STAGING_MANIFEST_VERSION, 'files': files}, fo, sort_keys=True)
+
+
+def sync_tree(src, dst, copy_function, staged, jobs=const.JOBS):
+    """Brings the staging directory dst up to date with the source tree src.
+
+    Files whose size and modification time match the manifest are kept. Other
+    files are hashed and staged again only if the content changed. Files no
+    longer in src are deleted. staged is the FileManifest of dst, updated with
+    the files added and deleted. Returns the Changes, or None if dst has no
+    valid manifest (the caller has to stage the full tree).
+    """
+    old_files = load_manifest(dst)
+    if old_files is None:
+        return None
+    current = scan_tree(src)
+    files = {}
+    candidates = []
+    for rel_path, (size, mtime) in current.items():
+        old = old_files.get(rel_path)
+        if old and old['size'] == size and old['mtime'] == mtime and staged.isfile(rel_path):
+            files[rel_path] = old
+        else:
+            candidates.append(rel_path)
+    added = []
+    changed = []
+    for rel_path, digest in hash_files(src, candidates, jobs).items():
+        size, mtime = current[rel_path]
+        files[rel_path] = {'size': size, 'mtime': mtime, 'hash': digest}
+        old = old_files.get(rel_path)
+        dst_path = os.path.join(dst, rel_path)
+        if old and old['hash'] == digest and staged.isfile(rel_path):
+            # Only the time stamp changed
+            continue
+        if staged.isfile(rel_path):
+            os.unlink(dst_path)
+            changed.append(rel_path)
+        else:
+            os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+            added.append(rel_path)
+        copy_function(archive.join(src, rel_path), dst_path)
+        staged.add(rel_path, size, mtime)
+    deleted = [rel_path for rel_path in old_files if rel_path not in current]
+    for rel_path in deleted:
+        try:
+            os.unlink(os.path.join(dst, rel_path))
+        except FileNotFoundError:
+            pass
+        staged.remove(rel_path)
+    save_manifest(dst, files)
+    return Changes(False, sorted(added), sorted(changed), sorted(deleted))
+
+
+def record_tree(src, dst, jobs=const.JOBS):
+    """Writes the manifest of a staging directory dst freshly staged from src.
+    Returns the Changes (all the files are added)."""
+    current = scan_tree(src)
+    hashes = hash_files(src, list(current), jobs)
+    files = {rel_path: {'size': size, 'mtime': mtime, 'hash': hashes[rel_path]}
+             for rel_path, (size, mtime) in current.items()}
+    save_manifest(dst, files)
+    return Changes(True, sorted(files), [], [])
@@ -0,0 +1,155 @@
+"""Build stages run as a task graph.
+
+Each task declares the resources it reads (inputs) and writes (outputs). A
+task depends on the tasks added before it that write one of its inputs, or
+read or write one of its outputs: running the graph gives the same result
+as running the tasks in the order they were added. The tasks whose
+dependencies are done run concurrently in threads (the heavy stages shard
+their work across processes, see parallel).
+
+Each task is recorded as a stage of the build metrics (metrics.Metrics.stage).
+The critical path is the chain of dependent tasks with the longest duration:
+it bounds the total time of the build, whatever the number of threads.
+"""
+
+import collections
+import queue
+import threading
+import time
+
+import metrics as metrics_
+
+# A task of the graph: name (stage), function (no argument), resources read and written
+Task = collections.namedtuple('Task', ['name', 'func', 'inputs', 'outputs'])
+
+
+class TaskGraph:
+    """Tasks with their dependencies, run concurrently when independent"""
+
+    def __init__(self):
+        self.tasks = collections.OrderedDict()
+        self.dependencies = {}
+        # Start time (relative to the start of the graph) and duration of the tasks run
+        self.start_times = {}
+        self.durations = {}
+        self.elapsed = 0
+
+    def add(self, name, func, inputs=(), outputs=()):
+        """Adds a task, depending on the tasks already added that conflict with it"""
+        task = Task(name, func, frozenset(inputs), frozenset(outputs))
+        self.dependencies[name] = [other.name for other in self.tasks.values()
+                                   if other.outputs & (task.inputs | task.outputs) or other.inputs & task.outputs]
+        self.tasks[name] = task
+
+    def run(self, workers=None):
+        """Runs the tasks, at most workers at the same time (default: all the tasks
+        ready). Returns the results {name: result}.
+
+        A task ready alone runs in the calling thread; concurrent tasks run in
+        threads, joined when they end, so that the process pools of the serial
+        stages fork a process without other threads (see parallel.get_context).
+        After a failure, no task is started: the exception of the first task
+        that failed is raised once the running tasks are done.
+        """
+        metrics = metrics_.get_metrics()
+        pending = list(self.tasks)
+        running = {}
+        results = {}
+        error = None
+        done = queue.Queue()
+        start = time.perf_counter()
+        while pending or running:
+            if error is None:
+                ready = [name for name in pending if all(dep in results for dep in self.dependencies[name])]
+                if len(ready) == 1 and not running:
+                    pending.remove(ready[0])
+                    try:
+                        results[ready[0]] = self.run_task(metrics, ready[0], start)
+                    except BaseException as e:
+                        error = e
+                    continue
+                for name in ready[:max(0, (workers or len(ready)) - len(running))]:
+                    pending.remove(name)
+                    running[name] = threading.Thread(target=self.run_thread, args=(metrics, name, start, done),
+                                                     name='jd2chm-%s' % name)
+                    running[name].start()
+            if not running:
+                break
+            name, result, exception = done.get()
+            running.pop(name).join()
+            if exception is not None:
+                if error is None:
+                    error = exception
+            else:
+                results[name] = result
+        self.elapsed = time.perf_counter() - start
+        if error is not None:
+            raise error
+        return results
+
+    def run_thread(self, metrics, name, graph_start, done):
+        """Runs a task in a thread. Puts (name, result, exception) into the done queue."""
+        try:
+            done.put((name, self.run_task(metrics, name, graph_start), None))
+        except BaseException as e:
+            done.put((name, None, e))
+
+    def run_task(self, metrics, name, graph_start):
+        """Runs a task, as a stage of the metrics of the build"""
+        metrics_.set_metrics(metrics)
+        start = time.perf_counter()
+        try:
+            with metrics.stage(name):
+                return self.tasks[name].func()
+        finally:
+            self.start_times[name] = start - graph_start
+            self.durations[name] = time.perf_counter() - start
+
+    def get_critical_path(self):
+        """Returns the names of the tasks of the critical path (in order) and its
+        duration (seconds)"""
+        finish = {}
+        previous = {}
+        for name in self.tasks:
+            # The dependencies of a task are added before it
+            deps = [dep for dep in self.dependencies[name] if dep in finish]
+            previous[name] = max(deps, key=lambda dep: finish[dep]) if deps else None
+            finish[name] = (finish[previous[name]] if previous[name] else 0) + self.durations.get(name, 0)
+        if not finish:
+            return [], 0
+        name = max(finish, key=lambda task: finish[task])
+        duration = finish[name]
+        path = []
+        while name:
+            path.append(name)
+            name = previous[name]
+        return path[::-1], duration
+
+    def report(self):
+        """Returns the start time, duration and dependencies of the tasks, and the
+        critical path (JSON serializable)"""
+        path, duration = self.get_critical_path()
+        tasks = collections.OrderedDict()
+        for name in self.tasks:
+            tasks[name] = {
+                'start': round(self.start_times.get(name, 0), 4),
+                'duration': round(self.durations.get(name, 0), 4),
+                'dependencies': self.dependencies[name],
+            }
+        return {
+            'tasks': tasks,
+            'critical_path': path,
+            'critical_time': round(duration, 4),
+            'elapsed': round(self.elapsed, 4),
+        }
+
+    def format_report(self):
+        """Returns the report as a table, the tasks of the critical path marked with '*'"""
+        path, duration = self.get_critical_path()
+        width = max([len(name) for name in self.tasks] + [len('Stage')])
+        lines = ['  %-*s  %9s  %9s' % (width, 'Stage', 'Start (s)', 'Time (s)')]
+        for name in self.tasks:
+            lines.append('%s %-*s  %9.2f  %9.2f' % ('*' if name in path else ' ', width, name,
+                                                    self.start_times.get(name, 0), self.durations.get(name, 0)))
+        lines.append('Critical path: %s (%.2fs of %.2fs)' % (' > '.join(path), duration, self.elapsed))
+        return '\n'.join(lines)
@@ -0,0 +1,86 @@
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.abspath('.'))
+import archive
+import const
+import core
+import corpus
+import staging
+
+
+def make_jar(javadoc_dir, jar_file, prefix='apidocs/', replace=None):
+    """Zips javadoc_dir into jar_file as a Maven -javadoc.jar (META-INF, Javadoc
+    under prefix). replace: {relative path: content} of modified members."""
+    replace = replace or {}
+    with zipfile.ZipFile(jar_file, 'w', zipfile.ZIP_DEFLATED) as jar:
+        jar.writestr('META-INF/MANIFEST.MF', 'Manifest-Version: 1.0\n')
+        jar.writestr('META-INF/maven/index.html', '')
+        for folder, dirs, files in os.walk(javadoc_dir):
+            for name in sorted(files):
+                path = os.path.join(folder, name)
+                rel_path = os.path.relpath(path, javadoc_dir).replace(os.sep, '/')
+                if rel_path in replace:
+                    jar.writestr(prefix + rel_path, replace[rel_path])
+                else:
+                    jar.write(path, prefix + rel_path)
+    return jar_file
+
+
+def test_javadoc_archive(tmp_path):
+    jar_file = str(tmp_path / 'test-javadoc.jar')
+    with zipfile.ZipFile(jar_file, 'w') as jar:
+        jar.writestr('META-INF/MANIFEST.MF', '')
+        jar.writestr('docs/index.html', '<title>Test</title>')
+        jar.writestr('docs/org/A.html', 'A')
+        jar.writestr('docs/../escape.html', 'x')
+        jar.writestr('other.txt', 'x')
+    javadoc_archive = archive.get_archive(jar_file)
+    assert archive.get_archive(jar_file) is javadoc_archive
+    assert javadoc_archive.root == 'docs/'
+    assert sorted(javadoc_archive.manifest.files) == ['index.html', 'org/A.html']
+    assert javadoc_archive.manifest.listdir('org') == ['A.html']
+    assert archive.is_archive(jar_file) and not archive.is_archive(str(tmp_path))
+    member = archive.join(jar_file, 'org/A.html')
+    assert member == jar_file + '!/org/A.html'
+    assert archive.isfile(member) and not archive.isfile(archive.join(jar_file, 'org/B.html'))
+    assert archive.read_file(member) == b'A'
+    assert staging.hash_files(jar_file, ['org/A.html']) == {'org/A.html': 'crc32:%08x' % zipfile.crc32(b'A')}
+    dst = str(tmp_path / 'A.html')
+    staging.copy_file(member, dst)
+    assert open(dst).read() == 'A'
+    assert os.stat(dst).st_mtime_ns == javadoc_archive.manifest.mtime('org/A.html')
+
+
+def test_build_from_archive(tmp_path, monkeypatch):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1500000000')
+    javadoc_dir = str(tmp_path / 'javadoc')
+    corpus.generate(javadoc_dir)
+    jar_file = make_jar(javadoc_dir, str(tmp_path / 'synth-javadoc.jar'))
+    os.mkdir(str(tmp_path / 'dir'))
+    os.mkdir(str(tmp_path / 'jar'))
+    results = [core.build(source, 'test', 'Test', work_dir=str(tmp_path / (name + '_work')),
+                          output_dir=str(tmp_path / name), jobs=jobs, incremental=1,
+                          compiler=const.COMPILER_INTERNAL)
+               for source, name, jobs in ((javadoc_dir, 'dir', 1), (jar_file, 'jar', 2))]
+    # The archive gives the same CHM file as the extracted tree
+    for name in ('test.hhp', 'test.hhc', 'test.hhk', 'test.chm'):
+        with open(os.path.join(results[0].work_dir, name), 'rb') as fo:
+            with open(os.path.join(results[1].work_dir, name), 'rb') as fj:
+                assert fo.read() == fj.read()
+    assert not os.path.exists(os.path.join(results[1].work_dir, const.META_INF))
+
+    # Incremental build from a new version of the archive: only the modified member is staged
+    page = 'org/synth/p0/package-summary.html'
+    with open(os.path.join(javadoc_dir, page), 'rb') as fo:
+        data = fo.read().replace(b'</body>', b'<p>Changed</p></body>')
+    os.unlink(jar_file)
+    make_jar(javadoc_dir, jar_file, replace={page: data})
+    env = core.ChmEnv()
+    env.configure('test', 1, incremental=1, compiler=const.COMPILER_INTERNAL, work_dir=results[1].work_dir,
+                  output_dir=str(tmp_path / 'jar'))
+    env.copy_javadoc(jar_file)
+    assert env.changes.changed == [page] and not env.changes.added and not env.changes.deleted
+    with open(os.path.join(results[1].work_dir, page), 'rb') as fo:
+        assert fo.read() == data
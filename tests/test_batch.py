@@ -0,0 +1,51 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.abspath('.'))
+import batch
+import const
+import corpus
+
+
+def test_read_manifest(tmp_path):
+    corpus.generate(str(tmp_path / 'small'), title='Small API')
+    (tmp_path / 'batch.toml').write_text('[[build]]\npath = "small"\n\n[[build]]\npath = "other"\n'
+                                         'name = "other"\ntitle = "Other"\n')
+    entries = batch.read_manifest(str(tmp_path / 'batch.toml'))
+    assert entries == [batch.BatchEntry(str(tmp_path / 'small'), 'small_api', 'Small API'),
+                       batch.BatchEntry(str(tmp_path / 'other'), 'other', 'Other')]
+    (tmp_path / 'batch.json').write_text(json.dumps({'builds': [{'path': 'a', 'name': 'x', 'title': 'A'},
+                                                                {'path': 'b', 'name': 'x', 'title': 'B'}]}))
+    try:
+        batch.read_manifest(str(tmp_path / 'batch.json'))
+        assert False
+    except ValueError as e:
+        assert 'duplicate' in str(e)
+
+
+def test_run(tmp_path):
+    corpus.generate(str(tmp_path / 'small'), packages=1)
+    corpus.generate(str(tmp_path / 'large'), packages=4)
+    entries = [batch.BatchEntry(str(tmp_path / 'small'), 'small', 'Small'),
+               batch.BatchEntry(str(tmp_path / 'missing'), 'missing', 'Missing'),
+               batch.BatchEntry(str(tmp_path / 'large'), 'large', 'Large')]
+    output_dir = str(tmp_path / 'out')
+    os.mkdir(output_dir)
+    results = batch.run(entries, output_dir, 2, 1, const.COMPILER_INTERNAL)
+    assert [result.entry for result in results] == entries
+    small, missing, large = results
+    assert large.size > small.size > 0
+    assert small.chm_file == os.path.join(output_dir, 'small.chm') and os.path.isfile(small.chm_file)
+    assert large.error is None and os.path.isfile(large.chm_file)
+    # The failure doesn't stop the other builds
+    assert missing.error and missing.chm_file is None
+    assert 'Compilation' in large.log
+    log_file = str(tmp_path / 'batch.log')
+    batch.write_log(results, log_file)
+    with open(log_file) as fo:
+        log = fo.read()
+    assert log.index('==== small') < log.index('==== missing') < log.index('==== large')
+    summary = batch.format_summary(results)
+    assert 'FAILED' in summary
+    assert '3 builds, 1 failed' in summary
@@ -0,0 +1,77 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.abspath('.'))
+import chm
+import const
+import core
+import corpus
+
+
+def test_encode_int():
+    for value in (0, 1, 0x7f, 0x80, 0x3fff, 0x4000, 1 << 40):
+        data = chm.encode_int(value)
+        assert chm.decode_int(data, 0) == (value, len(data))
+    assert chm.encode_int(0x80) == b'\x81\x00'
+
+
+def test_write_read(tmp_path):
+    chm_file = str(tmp_path / 'test.chm')
+    writer = chm.ChmWriter(chm_file)
+    # Spans several LZX frames and reset intervals
+    data = bytes(random.Random(1).getrandbits(8) for _ in range(3 * chm.LZX_FRAME_SIZE + 5))
+    writer.add_data('data.bin', data)
+    # Long names: several listing chunks and two levels of index chunks
+    names = ['/d%d/%s%04d.html' % (i % 3, 'n' * 200, i) for i in range(1500)]
+    for i, name in enumerate(names):
+        writer.add_data(name[1:], b'page %d' % i)
+    writer.add_data('Upper/Case.HTML', b'upper')
+    writer.write()
+
+    reader = chm.ChmReader(chm_file)
+    assert reader.depth == 3
+    assert reader.read('/data.bin') == data
+    for i, name in enumerate(names):
+        assert reader.read(name) == b'page %d' % i
+    for name, entry in reader.entries.items():
+        assert reader.resolve(name) == entry
+    assert reader.resolve('/upper/case.html').name == '/Upper/Case.HTML'
+    assert reader.resolve('/d0/missing.html') is None
+    assert '/d1/' in reader.entries
+    assert reader.file_size == os.path.getsize(chm_file)
+
+
+def test_compile_project(tmp_path, monkeypatch):
+    javadoc_dir = str(tmp_path / 'javadoc')
+    corpus.generate(javadoc_dir)
+    os.mkdir(os.path.join(javadoc_dir, 'resources'))
+    with open(os.path.join(javadoc_dir, 'resources', 'inherit.gif'), 'wb') as fo:
+        fo.write(b'GIF89a')
+    with open(os.path.join(javadoc_dir, const.CSS_FILE_NAME), 'w') as fo:
+        fo.write('body {}\n')
+    # The original stylesheet is saved as stylesheet.css.bak
+    monkeypatch.setattr(const, 'CUSTOM_CSS', 1)
+    result = core.build(javadoc_dir, 'test', 'Test Title', work_dir=str(tmp_path / 'work'), output_dir=str(tmp_path),
+                        jobs=1, compiler=const.COMPILER_INTERNAL)
+    work_dir = result.work_dir
+
+    reader = chm.ChmReader(result.chm_file)
+    system = reader.get_system()
+    assert system[chm.SYSTEM_CONTENTS_FILE] == b'test.hhc\0'
+    assert system[chm.SYSTEM_TITLE] == b'Test Title\0'
+    assert system[chm.SYSTEM_DEFAULT_TOPIC] == b'overview-summary.html\0'
+    options, files = chm.read_project(os.path.join(work_dir, 'test.hhp'))
+    for name in files + ['test.hhc', 'test.hhk']:
+        with open(os.path.join(work_dir, name), 'rb') as fo:
+            assert reader.read('/' + name) == fo.read()
+    # The files referenced by the pages are compiled, not the outputs of the compiler
+    for name in (const.CSS_FILE_NAME, 'resources/inherit.gif'):
+        with open(os.path.join(work_dir, name), 'rb') as fo:
+            assert reader.read('/' + name) == fo.read()
+    assert reader.resolve('/test.hhp') is None and reader.resolve('/test.chm') is None
+    # Nor the original stylesheet
+    assert os.path.isfile(os.path.join(work_dir, const.CSS_FILE_NAME + '.bak'))
+    assert reader.resolve('/' + const.CSS_FILE_NAME + '.bak') is None
+    topics = reader.read('/#TOPICS')
+    assert len(topics) == 16 * len([name for name in files if name.endswith('.html')])
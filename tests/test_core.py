@@ -0,0 +1,277 @@
+import os
+import sys
+import shutil
+import concurrent.futures
+import pytest
+
+sys.path.insert(0, os.path.abspath('.'))
+import chm
+import const
+import core
+import corpus
+import metrics as metrics_
+import staging
+from manifest import FileManifest
+
+
+@pytest.fixture(params=[False, True], ids=['unsplit', 'split'])
+def javadoc(request, tmp_path):
+    root = str(tmp_path / 'javadoc')
+    corpus.generate(root, split_index=request.param)
+    return root
+
+
+def build_project(javadoc_dir, work_dir, jobs):
+    """Builds javadoc_dir in work_dir. Returns the content of the HHP, HHC and HHK
+    files."""
+    core.build(javadoc_dir, 'test', 'Test', work_dir=work_dir, output_dir=os.path.dirname(work_dir), jobs=jobs,
+               compiler=const.COMPILER_INTERNAL)
+    outputs = []
+    for ext in ('.hhp', '.hhc', '.hhk'):
+        with open(os.path.join(work_dir, 'test' + ext)) as fo:
+            outputs.append(fo.read())
+    return outputs
+
+
+def test_parallel_build_matches_serial(javadoc, tmp_path):
+    serial = build_project(javadoc, str(tmp_path / 'serial'), 1)
+    parallel = build_project(javadoc, str(tmp_path / 'parallel'), 4)
+    assert serial == parallel
+    for name in os.listdir(str(tmp_path / 'serial' / 'org' / 'synth' / 'p0')):
+        with open(str(tmp_path / 'serial' / 'org' / 'synth' / 'p0' / name), 'rb') as fo:
+            serial_page = fo.read()
+        with open(str(tmp_path / 'parallel' / 'org' / 'synth' / 'p0' / name), 'rb') as fo:
+            assert fo.read() == serial_page
+
+
+def test_project_files(javadoc, tmp_path):
+    hhp, hhc, hhk = build_project(javadoc, str(tmp_path / 'work'), 2)
+    files = hhp.split('[FILES]\n')[1].split()
+    assert 'org/synth/p0/Type0.html' in files
+    assert not [f for f in files if f.startswith(const.INDEX_DIR)]
+    assert '<param name="Name" value="org.synth.p2">' in hhc
+    assert '<param name="Name" value="Type3 (Interface)">' in hhc
+    assert '<param name="Local" value="org/synth/p0/Type0.Inner0.html">' in hhc
+    assert 'org/synth/p0/Type0.html#add(int,%20java.lang.String)' in hhc
+    assert '<param name="Name" value="in org.synth.p1.Type2">' in hhk
+
+
+def test_clean_html_page(tmp_path):
+    page = tmp_path / 'page.html'
+    page.write_text('<td><code><b><a href="A.html#m(int, int)">m</a>\n<a name="m(int, int)">\n<a name="f">\n')
+    dst, lines_modified = core.stage_file(const.STAGING_COPY, str(page), str(tmp_path / 'staged.html'))
+    assert lines_modified == 2
+    with open(dst) as fo:
+        assert fo.read() == '<td><code><b><a href="A.html#m(int,%20int)">m</a>\n<a name="m(int,%20int)">\n' \
+                            '<a name="f">\n'
+
+
+def test_index_file_key():
+    files = ['index-10.html', 'index-2.html', 'index-1.html', 'other.html']
+    assert sorted(files, key=core.index_file_key) == ['index-1.html', 'index-2.html', 'index-10.html', 'other.html']
+
+
+def test_link_staging_keeps_source(javadoc, tmp_path):
+    work_dir = str(tmp_path / 'work')
+    page = os.path.join('org', 'synth', 'p0', 'Type0.html')
+    summary = os.path.join('org', 'synth', 'p0', 'package-summary.html')
+    with open(os.path.join(javadoc, page), 'rb') as fo:
+        source = fo.read()
+    env = core.ChmEnv()
+    env.jobs = 1
+    env.staging = const.STAGING_LINK
+    env.temp_dir = work_dir
+    env.copy_javadoc(javadoc)
+    with open(os.path.join(javadoc, page), 'rb') as fo:
+        assert fo.read() == source
+    assert not os.path.samefile(os.path.join(javadoc, page), os.path.join(work_dir, page))
+    # Not modified by the clean-up: linked
+    assert os.path.samefile(os.path.join(javadoc, summary), os.path.join(work_dir, summary))
+
+
+@pytest.mark.parametrize('mode', [const.STAGING_COPY, const.STAGING_LINK])
+def test_stage_file(mode, javadoc, tmp_path):
+    page = os.path.join(javadoc, 'org', 'synth', 'p0', 'Type0.html')
+    summary = os.path.join(javadoc, 'org', 'synth', 'p0', 'package-summary.html')
+    with open(page, 'rb') as fo:
+        source = fo.read()
+    dst, lines_modified = core.stage_file(mode, page, str(tmp_path / 'Type0.html'))
+    assert lines_modified
+    with open(page, 'rb') as fo:
+        assert fo.read() == source
+    with open(dst, 'rb') as fo:
+        assert fo.readlines() == core.clean_html_lines(source.splitlines(True))[0]
+    # Nothing to quote in the package summary: skipped by the clean-up
+    dst, lines_modified = core.stage_file(mode, summary, str(tmp_path / 'package-summary.html'))
+    assert lines_modified is None
+    with open(summary, 'rb') as fo, open(dst, 'rb') as fo_dst:
+        assert fo.read() == fo_dst.read()
+    dst, lines_modified = core.stage_file(mode, page, str(tmp_path / 'Type0-skipped.html'), clean_up=False)
+    assert lines_modified is None
+    with open(dst, 'rb') as fo:
+        assert fo.read() == source
+
+
+def test_has_unquoted_urls(javadoc):
+    assert core.has_unquoted_urls(b'<a name="add(int, java.lang.String)"><!-- --></a>')
+    assert core.has_unquoted_urls(b'<td><code><b><a href="Type0.html#get(int, int)">get</a>')
+    assert not core.has_unquoted_urls(b'<a name="add(int,java.lang.String)"><!-- --></a>')
+    assert not core.has_unquoted_urls(b'<a name="add-int-java.lang.String-"><!-- --></a>')
+    assert not core.has_unquoted_urls(b'<p title="a (b c)">no marker</p>')
+    # Every HTML file modified by the clean-up passes the check
+    for dir_path, dir_names, file_names in os.walk(javadoc):
+        for file_name in file_names:
+            if core.is_html_file(file_name):
+                with open(os.path.join(dir_path, file_name), 'rb') as fo:
+                    data = fo.read()
+                if core.clean_html_lines(data.splitlines(True))[1]:
+                    assert core.has_unquoted_urls(data)
+
+
+@pytest.mark.parametrize('comment, version', [
+    ('<!-- Generated by javadoc (1.4.2) on Mon Jan 01 -->', 4),
+    ('<!-- Generated by javadoc (build 1.6.0_45) on Mon Jan 01 -->', 6),
+    ('<!-- Generated by javadoc (version 1.7.0_80) on Mon Jan 01 -->', 7),
+    ('<!-- Generated by javadoc (1.8.0_121) on Mon Jan 01 -->', 8),
+    ('<!-- Generated by javadoc (9.0.1) on Mon Jan 01 -->', 9),
+    ('<!-- Generated by javadoc (17) on Mon Jan 01 -->', 17),
+    ('<!-- Generated by javadoc on Mon Jan 01 -->', None),
+])
+def test_get_doclet_version(comment, version, tmp_path):
+    index_html = tmp_path / 'index.html'
+    index_html.write_text('<html>\n%s\n<head></head></html>\n' % comment)
+    assert core.get_doclet_version(str(index_html)) == version
+    assert core.get_doclet_version(str(tmp_path / 'missing.html')) is None
+
+
+def test_incremental_sync(javadoc, tmp_path):
+    work_dir = str(tmp_path / 'work')
+    shutil.copytree(javadoc, work_dir)
+    staging.record_tree(javadoc, work_dir, 1)
+    page = os.path.join(javadoc, 'org', 'synth', 'p1', 'Type1.html')
+    with open(page, 'a') as fo:
+        fo.write('<!-- changed -->\n')
+    os.unlink(os.path.join(javadoc, 'org', 'synth', 'p2', 'Type2.html'))
+    changes = staging.sync_tree(javadoc, work_dir, shutil.copy2, FileManifest.scan(work_dir), 1)
+    assert changes == staging.Changes(False, [], ['org/synth/p1/Type1.html'], ['org/synth/p2/Type2.html'])
+    assert not os.path.exists(os.path.join(work_dir, 'org', 'synth', 'p2', 'Type2.html'))
+
+
+def test_metrics_include_worker_counts(javadoc, tmp_path):
+    reports = []
+    for jobs in (1, 4):
+        result = core.build(javadoc, 'test', 'Test', work_dir=str(tmp_path / ('work%d' % jobs)),
+                            output_dir=str(tmp_path), jobs=jobs, compiler=const.COMPILER_INTERNAL)
+        reports.append(result.metrics.report()['stages'])
+    serial, parallel = reports
+    # The class pages cache of the HHC is per process: only the other stages read
+    # the same files in both builds
+    for stage in ('copy_javadoc', 'create_hhp', 'create_hhk', 'make'):
+        for key in metrics_.COUNTERS:
+            assert serial[stage][key] == parallel[stage][key]
+    assert serial['create_hhc']['bytes_written'] == parallel['create_hhc']['bytes_written']
+    assert serial['copy_javadoc']['files_read'] > 0
+    assert serial['copy_javadoc']['regex_matches'] > 0
+    assert set(serial) == {'copy_javadoc', 'create_css_about', 'create_hhp', 'create_hhc', 'create_hhk', 'make'}
+
+
+def test_concurrent_builds(javadoc, tmp_path):
+    start_dir = os.getcwd()
+    output_dirs = [str(tmp_path / ('out%d' % i)) for i in range(3)]
+    for output_dir in output_dirs:
+        os.mkdir(output_dir)
+    with concurrent.futures.ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(lambda output_dir: core.build(javadoc, 'test', 'Test', output_dir=output_dir, jobs=1,
+                                                              compiler=const.COMPILER_INTERNAL), output_dirs))
+    assert os.getcwd() == start_dir
+    for output_dir, result in zip(output_dirs, results):
+        assert result.chm_file == os.path.join(output_dir, 'test.chm')
+        assert result.work_dir is None
+        assert chm.ChmReader(result.chm_file).get_system()[chm.SYSTEM_TITLE] == b'Test\0'
+        assert result.metrics.stages['make']['files_written'] == 1
+        task_graph = result.metrics.report()['task_graph']
+        assert task_graph['critical_path'][0] == 'copy_javadoc' and task_graph['critical_path'][-1] == 'make'
+        assert task_graph['tasks']['make']['dependencies'][-3:] == ['create_hhp', 'create_hhc', 'create_hhk']
+    page = '/org/synth/p0/Type0.html'
+    assert chm.ChmReader(results[1].chm_file).read(page) == chm.ChmReader(results[0].chm_file).read(page)
+
+
+def test_reproducible_build(javadoc, tmp_path):
+    results = [core.build(javadoc, 'test', 'Test', output_dir=str(tmp_path), work_dir=str(tmp_path / ('work%d' % i)),
+                          jobs=1, compiler=const.COMPILER_INTERNAL) for i in range(2)]
+    for name in ('test.hhp', 'test.hhc', 'test.hhk', 'test.chm'):
+        with open(os.path.join(results[0].work_dir, name), 'rb') as fo:
+            data = fo.read()
+        with open(os.path.join(results[1].work_dir, name), 'rb') as fo:
+            assert fo.read() == data
+
+
+def test_incremental_reuses_chm(javadoc, tmp_path, monkeypatch):
+    compiled = []
+    compile_project = chm.compile_project
+
+    def counting_compile_project(*args, **kwargs):
+        compiled.append(args[0])
+        return compile_project(*args, **kwargs)
+
+    monkeypatch.setattr(chm, 'compile_project', counting_compile_project)
+
+    def build():
+        return core.build(javadoc, 'test', 'Test', work_dir=str(tmp_path / 'work'), output_dir=str(tmp_path), jobs=1,
+                          incremental=True, compiler=const.COMPILER_INTERNAL)
+
+    result = build()
+    assert len(compiled) == 1
+    assert os.path.isfile(os.path.join(result.work_dir, 'test.chm' + const.FINGERPRINT_EXT))
+    with open(result.chm_file, 'rb') as fo:
+        data = fo.read()
+    os.unlink(result.chm_file)
+    # No change: the CHM file of the previous build is copied
+    result = build()
+    assert len(compiled) == 1
+    with open(result.chm_file, 'rb') as fo:
+        assert fo.read() == data
+    with open(os.path.join(javadoc, 'org', 'synth', 'p1', 'Type1.html'), 'a') as fo:
+        fo.write('<!-- changed -->\n')
+    result = build()
+    assert len(compiled) == 2
+    page = chm.ChmReader(result.chm_file).read('/org/synth/p1/Type1.html')
+    assert page.endswith(b'<!-- changed -->\n')
+
+
+@pytest.mark.parametrize('head, charset', [
+    (b'<meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-1">', 'iso8859-1'),
+    (b'<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=windows-1252">', 'cp1252'),
+    (b'<meta charset="utf-8">', 'utf-8'),
+    (b"<meta charset='Shift_JIS'>", 'shift_jis'),
+    (b'<meta charset="unknown-charset">', const.DEFAULT_CHARSET),
+    (b'<title>No charset</title>', const.DEFAULT_CHARSET),
+])
+def test_get_charset(head, charset):
+    assert core.get_charset(b'<html><head>' + head + b'</head></html>') == charset
+
+
+def test_non_ascii_pages(tmp_path):
+    """The titles are decoded with the charset of each page and written in the code
+    page of the project (character references out of the code page)"""
+    work_dir = str(tmp_path / 'javadoc')
+    corpus.generate(work_dir)
+    frame = os.path.join(work_dir, 'org', 'synth', 'p0', 'package-frame.html')
+    with open(frame, 'rb') as fo:
+        data = fo.read()
+    data = data.replace(b'charset=UTF-8', b'charset=ISO-8859-1').replace(b'>Type1<', b'>Typ\xe91<')
+    with open(frame, 'wb') as fo:
+        fo.write(data)
+    page = os.path.join(work_dir, 'org', 'synth', 'p0', 'Type0.html')
+    with open(page, 'rb') as fo:
+        data = fo.read()
+    with open(page, 'wb') as fo:
+        fo.write(data.replace(b'>Type0.Inner0<', '>Type0.Ωnner0<'.encode('utf-8')))
+    work_dir = core.build(work_dir, 'test', 'Test é', work_dir=str(tmp_path / 'work'), output_dir=str(tmp_path),
+                          jobs=1, compiler=const.COMPILER_INTERNAL).work_dir
+    with open(os.path.join(work_dir, 'test.hhc'), 'rb') as fo:
+        hhc = fo.read()
+    assert b'<param name="Name" value="Typ\xe91">' in hhc
+    assert b'<param name="Name" value="&#937;nner0">' in hhc
+    with open(os.path.join(work_dir, 'test.hhp'), 'rb') as fo:
+        assert b'Title=Test \xe9' in fo.read()
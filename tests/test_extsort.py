@@ -0,0 +1,34 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+import const
+import core
+import extsort
+from manifest import FileManifest
+
+
+def test_sort_runs():
+    items = [(random.Random(i).randrange(50), i) for i in range(1000)]
+    # Spilled runs (and a last partial run), or one run in memory: stable in both cases
+    for run_size in (64, 1000, 5000):
+        assert list(extsort.sort(iter(items), lambda item: item[0], run_size)) == sorted(items)
+    assert list(extsort.sort([], lambda item: item, 4)) == []
+
+
+def test_hhk_groups_keywords(tmp_path):
+    entry = '<dt><span class="memberNameLink"><a href="../%s.html#%s()">%s()</a></span> - '
+    index_dir = tmp_path / const.INDEX_DIR
+    index_dir.mkdir()
+    # Split index files, not sorted: the entries of a keyword are in several files
+    (index_dir / 'index-1.html').write_text(entry % ('org/B', 'add', 'add') + entry % ('org/A', 'size', 'size'))
+    (index_dir / 'index-2.html').write_text(entry % ('org/A', 'add', 'add') + entry % ('org/C', 'Add', 'Add'))
+    hhk = core.Hhk('test', FileManifest.scan(str(tmp_path)), 1, str(tmp_path), run_size=2)
+    hhk.create_hhk()
+    data = (tmp_path / 'test.hhk').read_text()
+    assert data.count('value="add()"') == 2
+    assert data.index('value="Add()"') < data.index('value="add()"') < data.index('value="size()"')
+    assert data.index('org/A.html#add()') < data.index('org/B.html#add()')
+    assert (const.FORMAT_INDEX_ITEM % ('org/A.html#add()', 'in org.A') +
+            const.FORMAT_INDEX_ITEM % ('org/B.html#add()', 'in org.B')) in data
@@ -0,0 +1,111 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+import const
+import core
+import parallel
+from manifest import FileManifest
+
+OVERVIEW_FRAME = '''<ul>
+<li><a href="allclasses-frame.html" target="packageFrame">All Classes</a></li>
+<li><a href="org/a/package-frame.html" target="packageFrame">org.a</a></li>
+<li><a href="org/b/package-frame.html" target="packageFrame">org.b</a></li>
+</ul>
+'''
+
+CLASS_PAGE = '''<html>
+<td><code><b><a href="../../org/%(package)s/%(name)s.Inner.html" title="class in org">%(name)s.Inner</a></b></code></td>
+<td><code><b><a href="../../org/%(package)s/%(name)s.html#get(int)">get</a></b>(int&nbsp;i)</code></td>
+<td><code><b><a href="../../org/%(package)s/%(name)s.html#size()">size</a></b>()</code></td>
+</html>
+'''
+
+INNER_PAGE = '''<html>
+<td><code><b><a href="../../org/%(package)s/%(name)s.Inner.html#run()">run</a></b>()</code></td>
+</html>
+'''
+
+
+def write_file(root, rel_path, content):
+    path = os.path.join(root, *rel_path.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fo:
+        fo.write(content)
+
+
+def write_javadoc(root, classes=3):
+    """Writes a Javadoc tree with the packages org.a and org.b"""
+    write_file(root, 'overview-summary.html', '<html></html>\n')
+    write_file(root, const.JDK_BOOK_FILE, OVERVIEW_FRAME)
+    all_classes = []
+    for package in ('a', 'b'):
+        lines = []
+        for i in range(classes):
+            name = 'Type%s%d' % (package.upper(), i)
+            values = {'package': package, 'name': name}
+            write_file(root, 'org/%s/%s.html' % (package, name), CLASS_PAGE % values)
+            write_file(root, 'org/%s/%s.Inner.html' % (package, name), INNER_PAGE % values)
+            lines.append('<li><a href="%s.html" title="class in org.%s" target="classFrame">%s</a></li>\n'
+                         % (name, package, name))
+            # Public inner class: listed in the package, handled with its class
+            lines.append('<li><a href="%s.Inner.html" title="class in org.%s" target="classFrame">%s.Inner</a></li>\n'
+                         % (name, package, name))
+            all_classes.append('<li><a href="org/%s/%s.html" title="class in org.%s" target="classFrame">%s</a></li>\n'
+                               % (package, name, package, name))
+        write_file(root, 'org/%s/package-frame.html' % package, ''.join(lines))
+    write_file(root, 'allclasses-frame.html', ''.join(all_classes))
+
+
+def create_hhc(root, project_name='test', jobs=1):
+    """Creates the contents file in root, returns (content, Hhc)"""
+    start_dir = os.getcwd()
+    os.chdir(root)
+    try:
+        hhc = core.Hhc(project_name, const.JDK_BOOK_FILE, 'overview-summary.html', FileManifest.scan('.'), jobs)
+        hhc.create_hhc()
+        with open(hhc.hhc_file_name) as fo:
+            content = fo.read()
+    finally:
+        os.chdir(start_dir)
+    # The header holds the date of the build
+    return content[content.index('<ul>'):], hhc
+
+
+def test_class_page_cache(tmp_path):
+    write_javadoc(str(tmp_path))
+    content, hhc = create_hhc(str(tmp_path))
+    cache_info = hhc.class_pages.cache_info()
+    # Every page is read once: visited again from the All Classes book and for its methods
+    assert cache_info.misses == cache_info.currsize == 12
+    assert cache_info.hits > 0
+    assert '<param name="Local" value="org/a/TypeA0.Inner.html#run()">' in content
+    assert '<param name="Name" value="get (int&nbsp;i)">' in content
+
+
+def test_class_page_cache_size(tmp_path, monkeypatch):
+    write_javadoc(str(tmp_path))
+    content, hhc = create_hhc(str(tmp_path))
+    monkeypatch.setattr(const, 'CLASS_PAGE_CACHE_SIZE', 1)
+    small_content, small_hhc = create_hhc(str(tmp_path))
+    assert small_hhc.class_pages.cache_info().maxsize == 1
+    assert small_content == content
+
+
+def test_package_fragments(tmp_path, monkeypatch):
+    write_javadoc(str(tmp_path))
+    windows = []
+    imap_ordered = parallel.imap_ordered
+
+    def imap_window(*args, **kwargs):
+        windows.append(kwargs.get('window'))
+        return imap_ordered(*args, **kwargs)
+
+    monkeypatch.setattr(parallel, 'imap_ordered', imap_window)
+    serial, hhc = create_hhc(str(tmp_path), jobs=1)
+    fragments, hhc = create_hhc(str(tmp_path), jobs=3)
+    # The fragments are written in the order of overview-frame.html, a few per job in flight
+    assert fragments == serial
+    books = [serial.index('<param name="Name" value="%s">' % title) for title in ('All Classes', 'org.a', 'org.b')]
+    assert books == sorted(books)
+    assert windows == [3 * const.TOC_FRAGMENTS_PER_JOB]
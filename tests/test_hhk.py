@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+import const
+import core
+from manifest import FileManifest
+
+ENTRY = '<dt><span class="memberNameLink"><a href="%s">%s</a></span> - Method in class</dt>\n'
+
+
+def test_index_parser_iter_entries(tmp_path):
+    index_file = tmp_path / const.INDEX_ALL
+    index_file.write_text('<dl>\n' + ''.join(ENTRY % (href, title) for href, title in [
+        ('org/a/A.html#get()', 'get()'),
+        ('../org/a/B.html#size()', 'size()'),
+        ('org/a/B.html#' + 'x' * const.MAX_SIZE_KEYWORD, 'long()'),
+        ('org/a/B.html', 'B')]) + '</dl>\n')
+    entries = core.IndexParser().iter_entries(str(index_file))
+    assert next(entries) == ('org/a/A.html#get()', 'get()', 'org.a.A')
+    # The (../)* prefix is removed, the too long href is skipped
+    assert list(entries) == [('org/a/B.html#size()', 'size()', 'org.a.B'), ('org/a/B.html', 'B', 'org.a.B')]
+    # An empty file can't be memory mapped
+    index_file.write_text('')
+    assert list(core.IndexParser().iter_entries(str(index_file))) == []
+
+
+def test_create_hhk(tmp_path):
+    (tmp_path / const.INDEX_ALL).write_text(''.join(ENTRY % (href, title) for href, title in [
+        ('org/a/A.html#get()', 'get()'),
+        ('org/a/B.html#get()', 'get()'),
+        ('org/a/B.html', 'B')]))
+    start_dir = os.getcwd()
+    os.chdir(str(tmp_path))
+    try:
+        core.Hhk('test', FileManifest.scan('.')).create_hhk()
+        with open('test.hhk') as fo:
+            content = fo.read()
+    finally:
+        os.chdir(start_dir)
+    # Entries with the same keyword are grouped
+    assert content.count('<param name="See Also" value="get()">') == 1
+    assert '<param name="Local" value="org/a/B.html#get()">\n  <param name="Name" value="in org.a.B">' in content
+    assert '<param name="Local" value="org/a/B.html">\n  <param name="Name" value="B">' in content
+
+
+def test_index_file_key():
+    names = ['index-10.html', 'index-2.html', 'other.html', 'index-1.html']
+    assert sorted(names, key=core.index_file_key) == ['index-1.html', 'index-2.html', 'index-10.html', 'other.html']
+
+
+def test_split_index_order(tmp_path):
+    index_dir = tmp_path / const.INDEX_DIR
+    index_dir.mkdir()
+    manifest = FileManifest()
+    # Listed in the order of the file system: index-10.html before index-2.html
+    for number in (10, 1, 2, 11, 3):
+        name = 'index-%d.html' % number
+        (index_dir / name).write_text('<dt><span class="typeNameLink"><a href="../org/T%d.html">T%d</a></span></dt>'
+                                      % (number, number))
+        manifest.add('%s/%s' % (const.INDEX_DIR, name))
+    start_dir = os.getcwd()
+    os.chdir(str(tmp_path))
+    try:
+        hhks = []
+        for jobs in (1, 3):
+            hhk = core.Hhk('test', manifest, jobs)
+            assert [title for href, title, java_class in hhk.iter_entries()] == ['T1', 'T2', 'T3', 'T10', 'T11']
+            hhk.create_hhk()
+            with open('test.hhk') as fo:
+                content = fo.read()
+            # The header holds the date of the build
+            hhks.append(content[content.index('<ul>'):])
+    finally:
+        os.chdir(start_dir)
+    assert hhks[0] == hhks[1]
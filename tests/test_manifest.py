@@ -0,0 +1,74 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+import const
+import core
+import manifest
+from manifest import FileManifest
+
+
+def write_files(root, rel_paths):
+    for rel_path in rel_paths:
+        path = os.path.join(root, *rel_path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fo:
+            fo.write(rel_path)
+
+
+def test_normalize():
+    assert manifest.normalize('.') == ''
+    assert manifest.normalize('./a/b.html') == 'a/b.html'
+    assert manifest.normalize('a\\b.html') == 'a/b.html'
+    assert manifest.normalize('a/../b.html') == 'b.html'
+
+
+def test_scan(tmp_path):
+    write_files(str(tmp_path), ['index.html', 'org/A.html', 'org/sub/B.html'])
+    (tmp_path / 'empty').mkdir()
+    files = FileManifest.scan(str(tmp_path))
+    assert sorted(files.files) == ['index.html', 'org/A.html', 'org/sub/B.html']
+    assert files.size('org/A.html') == len('org/A.html')
+    assert files.isfile('./org/A.html') and not files.isfile('org')
+    assert files.isdir('org') and files.isdir('empty') and files.exists('org/sub')
+    assert not files.exists('missing.html')
+    assert sorted(files.listdir('org')) == ['A.html', 'sub']
+    assert files.listdir('empty') == []
+
+
+def test_walk_skip(tmp_path):
+    write_files(str(tmp_path), ['index.html', 'org/A.html', const.INDEX_DIR + '/index-1.html'])
+    files = FileManifest.scan(str(tmp_path))
+    assert sorted(files.walk()) == ['index-files/index-1.html', 'index.html', 'org/A.html']
+    assert sorted(files.walk(skip=(const.INDEX_DIR,))) == ['index.html', 'org/A.html']
+    assert list(files.walk('org')) == ['org/A.html']
+
+
+def test_add_remove(tmp_path):
+    write_files(str(tmp_path), ['org/A.html'])
+    files = FileManifest.scan(str(tmp_path))
+    files.add('new/sub/C.html', 3, 4)
+    assert files.isfile('new/sub/C.html') and files.isdir('new/sub')
+    assert 'new' in files.listdir() and files.files['new/sub/C.html'] == (3, 4)
+    # Adding an existing file again does not duplicate the listing
+    files.add('org/A.html')
+    assert files.listdir('org') == ['A.html']
+    files.remove('org/A.html')
+    assert not files.exists('org/A.html') and files.listdir('org') == []
+    files.remove('missing.html')
+
+
+def test_hhp_file_section(tmp_path):
+    write_files(str(tmp_path), ['index.html', 'stylesheet.css', 'org/A.html', const.INDEX_DIR + '/index-1.html'])
+    start_dir = os.getcwd()
+    os.chdir(str(tmp_path))
+    try:
+        hhp = core.Hhp('test', 'Test', 'overview-summary.html', FileManifest.scan('.'))
+        hhp.create_hhp()
+        with open('test.hhp') as fo:
+            content = fo.read()
+    finally:
+        os.chdir(start_dir)
+    lines = content[content.index('[FILES]'):].splitlines()
+    # Only the HTML files, without './' and without the split index files
+    assert sorted(line for line in lines if line.endswith('.html')) == ['index.html', 'org/A.html']
@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+import chm
+import const
+import corpus
+import merge
+
+
+def test_get_libraries(tmp_path):
+    paths = [str(tmp_path / 'a' / 'apidocs'), str(tmp_path / 'b' / 'apidocs') + os.sep, str(tmp_path / 'c.jar')]
+    libraries = merge.get_libraries(paths, ['A', 'B', 'C'])
+    assert [library.name for library in libraries] == ['apidocs', 'apidocs-2', 'c']
+    assert libraries[1] == merge.Library(os.path.abspath(paths[1]), 'apidocs-2', 'B')
+
+
+def test_merge(tmp_path, monkeypatch):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1500000000')
+    corpus.generate(str(tmp_path / 'alpha'), packages=2, classes=2, methods=2, title='Alpha API')
+    corpus.generate(str(tmp_path / 'beta'), packages=2, classes=2, methods=2, title='Beta API', split_index=True)
+    libraries = merge.get_libraries([str(tmp_path / 'alpha'), str(tmp_path / 'beta')], ['Alpha & API', 'Beta API'])
+    result = merge.build(libraries, 'all', 'All', work_dir=str(tmp_path / 'work'), output_dir=str(tmp_path),
+                         jobs=1, compiler=const.COMPILER_INTERNAL)
+    assert result.chm_file == str(tmp_path / 'all.chm')
+    # The libraries are processed concurrently
+    dependencies = result.metrics.task_graph['tasks']['create_hhk:beta']['dependencies']
+    assert dependencies == ['copy_javadoc:beta']
+
+    with open(os.path.join(result.work_dir, 'all.hhc'), encoding=const.PROJECT_ENCODING) as fo:
+        hhc = fo.read()
+    # A book per library, all the links prefixed by the directory of the library
+    alpha = hhc.index('<param name="Name" value="Alpha &amp; API">\n  <param name="Local" value="alpha/')
+    assert alpha < hhc.index('<param name="Name" value="Beta API">\n  <param name="Local" value="beta/')
+    assert hhc.count('value="alpha/') + hhc.count('value="beta/') == hhc.count('<param name="Local"')
+    assert 'value="beta/org/synth/p1/Type1.html"' in hhc
+
+    with open(os.path.join(result.work_dir, 'all.hhk'), encoding=const.PROJECT_ENCODING) as fo:
+        hhk = fo.read()
+    # The keywords of both libraries are grouped, each entry qualified with its library
+    keyword = hhk.index('<param name="Name" value="Type0">')
+    group = hhk[keyword:hhk.index('</ul>', keyword)]
+    assert group.index('in org.synth.p0.Type0 (Alpha &amp; API)') < group.index('in org.synth.p0.Type0 (Beta API)')
+    assert group.count('<param name="Local" value="beta/org/synth/p') == 2
+    assert hhk.count('<param name="See Also" value="Type0">') == 1
+
+    options, files = chm.read_project(os.path.join(result.work_dir, 'all.hhp'))
+    assert options['Default topic'] == 'alpha/overview-summary.html'
+    assert 'beta/org/synth/p0/Type0.html' in files and not any('/index-files/' in name for name in files)
+    reader = chm.ChmReader(result.chm_file)
+    with open(os.path.join(result.work_dir, 'beta', 'org', 'synth', 'p0', 'Type0.html'), 'rb') as fo:
+        assert reader.read('/beta/org/synth/p0/Type0.html') == fo.read()
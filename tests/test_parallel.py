@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath('.'))
+import core
+import metrics as metrics_
+import parallel
+
+PAGE = '''<html>
+<td><code><b><a href="Type%d.html#get(int, java.lang.String)">get</a></b>(int&nbsp;i, java.lang.String&nbsp;s)</code>
+<a name="get(int, java.lang.String)"><!-- --></a>
+<a name="size()"><!-- --></a>
+</html>
+'''
+
+
+def square(value):
+    return value * value
+
+
+def write_tree(root, pages=12):
+    """Writes class pages with method URL's to be quoted"""
+    for i in range(pages):
+        folder = os.path.join(root, 'org', 'p%d' % (i % 3))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, 'Type%d.html' % i), 'w') as fo:
+            fo.write(PAGE % i)
+
+
+def read_tree(root):
+    """Returns {relative path: content} of the files under root"""
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(root):
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            with open(path, 'rb') as fo:
+                files[os.path.relpath(path, root)] = fo.read()
+    return files
+
+
+def stage(javadoc_dir, work_dir, jobs):
+    """Stages javadoc_dir into work_dir, the HTML files being cleaned-up"""
+    env = core.ChmEnv()
+    env.jobs = jobs
+    env.temp_dir = work_dir
+    env.copy_javadoc(javadoc_dir)
+
+
+def test_get_jobs():
+    assert parallel.get_jobs(0) == (os.cpu_count() or 1)
+    assert parallel.get_jobs(None) == (os.cpu_count() or 1)
+    assert parallel.get_jobs(3) == 3
+
+
+def test_imap_ordered():
+    items = list(range(50))
+    for jobs in (1, 3):
+        assert list(parallel.imap_ordered(square, items, jobs)) == [i * i for i in items]
+
+
+def spin(value):
+    start = time.thread_time()
+    while time.thread_time() - start < 0.05:
+        pass
+    return value
+
+
+def test_imap_ordered_worker_cpu_time():
+    metrics = metrics_.set_metrics(None)
+    with metrics.stage('test') as record:
+        assert list(parallel.imap_ordered(spin, range(4), 2)) == list(range(4))
+    # The CPU time of the tasks run by the workers is added to the stage of the caller
+    assert record['cpu_time'] >= 4 * 0.05
+
+
+def test_clean_up_matches_serial(tmp_path):
+    javadoc_dir = str(tmp_path / 'javadoc')
+    write_tree(javadoc_dir)
+    trees = []
+    for jobs in (1, 4):
+        work_dir = str(tmp_path / ('work%d' % jobs))
+        stage(javadoc_dir, work_dir, jobs)
+        trees.append(read_tree(work_dir))
+    serial, parallel_tree = trees
+    assert serial == parallel_tree
+    page = serial[os.path.join('org', 'p0', 'Type0.html')]
+    assert b'<a href="Type0.html#get(int,%20java.lang.String)">' in page
+    assert b'<a name="get(int,%20java.lang.String)">' in page
+    assert b'<a name="size()">' in page
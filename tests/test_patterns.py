@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import pytest
+
+sys.path.insert(0, os.path.abspath('.'))
+import cli
+import core
+from manifest import FileManifest
+
+# Size factor between the small and the large inputs: a linear parsing is about
+# FACTOR times slower on the large input, a quadratic one FACTOR ** 2 times.
+FACTOR = 8
+
+INDEX_ENTRY = (b'<dt><span class="memberNameLink"><a href="org/A.html#m(int, java.lang.String)">m(int, String)</a>'
+               b'</span> - ')
+INDEX_UNCLOSED = (b'<dt><span class="x"><a href="org/A.html">A', b'<dt><span class="x',
+                  b'<dt><span class="x"><a href="')
+CLASS_INNER = '<td><code><b><a href="../org/A.Inner%d.html" title="class in org">A.Inner%d</a></b></code></td>'
+CLASS_METHOD = ('<td><code><b><a href="../org/A.html#m%d(int, java.lang.String)">m%d</a></b>(int&nbsp;count, '
+                '<a href="../java/lang/String.html">String</a>&nbsp;text)</code></td>')
+CLASS_UNCLOSED = (b'<td><code><b><a href="A.B.html">A.B</a>', b'<td><code><b>', b'<td><code><b><a href="x')
+FRAME_LINES = (lambda size: b'<li><a href="x"' + b' >' * size,
+               lambda size: b'<li><a href="x">' + b'<b>' * size,
+               lambda size: b'<li><a href="x">' + b'a>' * size + b'</a>')
+
+
+def best_time(func, data, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def assert_linear(func, make_input, size):
+    """Checks that func runs in linear time on the inputs of make_input(size).
+
+    Based on the wall time: only run by test_linear, marked slow (pytest -m slow).
+    """
+    small = best_time(func, make_input(size))
+    large = best_time(func, make_input(size * FACTOR))
+    # Generous margin (timer noise), still far below FACTOR ** 2
+    assert large < small * FACTOR * 3 + 0.01, (small, large)
+
+
+def get_hhc():
+    return core.Hhc('test', '', '', FileManifest())
+
+
+def index_entries(data, tmp_path):
+    index_file = tmp_path / 'index-all.html'
+    index_file.write_bytes(data)
+    return list(core.IndexParser().iter_entries(str(index_file)))
+
+
+def make_class_page(size):
+    return ''.join(CLASS_INNER % (i, i) + CLASS_METHOD % (i, i) for i in range(size)).encode()
+
+
+def get_title(data, tmp_path):
+    index_html = tmp_path / 'index.html'
+    index_html.write_text(data)
+    return cli.get_title(str(index_html))
+
+
+def get_linear_cases(tmp_path):
+    """Returns the (func, make_input, size) checked by test_linear"""
+    parser = core.IndexParser()
+    hhc = get_hhc()
+    cases = [(lambda data: index_entries(data, tmp_path), lambda size: INDEX_ENTRY * size, 5000)]
+    for entry in INDEX_UNCLOSED:
+        cases.append((lambda data: index_entries(data, tmp_path), lambda size, entry=entry: entry * size, 2000))
+    cases.append((lambda href: parser.get_entry(href, 'x'), lambda size: '../' * size + 'a.' * size, 2000))
+    cases.append((hhc.extract_inners, make_class_page, 1000))
+    cases.append((hhc.extract_methods, make_class_page, 1000))
+    for cell in CLASS_UNCLOSED:
+        cases.append((hhc.extract_inners, lambda size, cell=cell: cell * size, 2000))
+        cases.append((hhc.extract_methods, lambda size, cell=cell: cell * size, 2000))
+    for make_line in FRAME_LINES:
+        cases.append((hhc.re_anchor_page.match, make_line, 2000))
+        cases.append((hhc.re_anchor_book.search, make_line, 2000))
+    cases.append((lambda data: get_title(data, tmp_path), lambda size: '<title>' + ' ' * size, 20000))
+    cases.append((core.has_unquoted_urls, lambda size: b'<a name="' + b' ' * size, 20000))
+    cases.append((core.has_unquoted_urls, lambda size: b'<a name="' + b'" ' * size, 20000))
+    return cases
+
+
+def test_index_one_line(tmp_path):
+    entries = index_entries(INDEX_ENTRY * 100000, tmp_path)
+    assert len(entries) == 100000
+    assert entries[0] == ('org/A.html#m(int, java.lang.String)', 'm(int, String)', 'org.A')
+
+
+def test_index_unclosed_tags(tmp_path):
+    for entry in INDEX_UNCLOSED:
+        assert index_entries(entry * 1000, tmp_path) == []
+
+
+def test_index_entry_long_href():
+    parser = core.IndexParser()
+    assert parser.get_entry('../../org/A.html#x.html', 'x')[2] == 'org.A'
+    assert parser.get_entry('io/File.html', 'File')[0] == 'io/File.html'
+    href = '../' * 2000 + 'a.' * 2000
+    assert parser.get_entry(href, 'x') is None
+
+
+def test_class_page_one_line():
+    hhc = get_hhc()
+    page = make_class_page(1000)
+    assert len(hhc.extract_inners(page)) == 1000
+    assert hhc.extract_methods(page)[1] == ('m1 (int&nbsp;count, String&nbsp;text)',
+                                            'org/A.html#m1(int, java.lang.String)')
+
+
+def test_class_page_unclosed_tags():
+    hhc = get_hhc()
+    for cell in CLASS_UNCLOSED:
+        assert hhc.extract_inners(cell * 1000) == []
+        assert hhc.extract_methods(cell * 1000) == []
+
+
+def test_frame_long_lines():
+    hhc = get_hhc()
+    line = (b'<li><a href="org/A.html" title="interface in org" target="classFrame">'
+            b'<span class="interfaceName">A</span></a></li>')
+    res = hhc.re_anchor_page.match(line)
+    assert res.groups() == (b'org/A.html', b'<span class="interfaceName">', b'A')
+    res = hhc.re_anchor_book.search(b'<li><a href="org/package-frame.html" target="packageFrame">org</a></li>')
+    assert res.group(2) == b'org'
+    res = hhc.re_anchor_book.search(b'<li><a href="org/package-frame.html"><span><b>org</b></span></a></li>')
+    assert res.group(2) == b'org'
+    for make_line in FRAME_LINES:
+        assert hhc.re_anchor_page.match(make_line(2000)) is None
+
+
+def test_title_whitespace(tmp_path):
+    assert get_title('<title>\n  Groovy 2.5  \n</title>', tmp_path) == 'Groovy 2.5'
+
+
+def test_unquoted_urls_check():
+    assert not core.has_unquoted_urls(b'<a name="' + b' ' * 20000)
+    assert not core.has_unquoted_urls(b'<a name="' + b'" ' * 20000)
+
+
+@pytest.mark.slow
+def test_linear(tmp_path):
+    for func, make_input, size in get_linear_cases(tmp_path):
+        assert_linear(func, make_input, size)
@@ -0,0 +1,177 @@
+import os
+import re
+import sys
+import shutil
+import pytest
+
+sys.path.insert(0, os.path.abspath('.'))
+import core
+import corpus
+import metrics as metrics_
+import searchindex
+from manifest import FileManifest
+
+
+def build_hhc(javadoc_dir, work_dir, verify_toc=0):
+    """Stages javadoc_dir into work_dir and creates the HHC file. Returns the HHC and
+    the Hhc instance."""
+    env = core.ChmEnv()
+    env.jobs = 1
+    env.temp_dir = work_dir
+    env.copy_javadoc(javadoc_dir)
+    start_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        hhc = core.Hhc('test', 'overview-frame.html', 'overview-summary.html', env.manifest, 1, verify_toc)
+        with metrics_.get_metrics().stage('create_hhc'):
+            hhc.create_hhc()
+        with open('test.hhc') as fo:
+            return fo.read(), hhc
+    finally:
+        os.chdir(start_dir)
+
+
+def build_hhk(javadoc_dir, work_dir):
+    shutil.copytree(javadoc_dir, work_dir)
+    start_dir = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        manifest = FileManifest.scan('.')
+        core.Hhk('test', manifest, 1).create_hhk()
+        with open('test.hhk') as fo:
+            return fo.read()
+    finally:
+        os.chdir(start_dir)
+
+
+@pytest.mark.parametrize('search_index', ['js', 'zip'])
+def test_search_index_matches_html_index(search_index, tmp_path):
+    html_dir = str(tmp_path / 'html')
+    search_dir = str(tmp_path / 'search')
+    corpus.generate(html_dir)
+    corpus.generate(search_dir, search_index=search_index)
+    # Without the HTML index, the entries can only come from the search index
+    os.unlink(os.path.join(search_dir, 'index-all.html'))
+    hhk = build_hhk(search_dir, str(tmp_path / 'work_search'))
+    assert hhk == build_hhk(html_dir, str(tmp_path / 'work_html'))
+    assert '<param name="Local" value="org/synth/p0/Type0.html#add(int, java.lang.String)">' in hhk
+
+
+def test_search_index_urls(tmp_path):
+    root = tmp_path / 'javadoc'
+    (root / 'java.base').mkdir(parents=True)
+    (root / 'package-search-index.js').write_text(
+        'packageSearchIndex = [{"l":"All Packages","u":"allpackages-index.html"},'
+        '{"m":"java.base","l":"java.lang"},{"l":"<Unnamed>"}];updateSearchResults();')
+    (root / 'type-search-index.js').write_text(
+        'typeSearchIndex = [{"l":"All Classes","u":"allclasses-index.html"},'
+        '{"p":"java.lang","l":"String"},{"p":"<Unnamed>","l":"Main"}];updateSearchResults();')
+    (root / 'member-search-index.js').write_text(
+        'memberSearchIndex = [{"p":"java.lang","c":"String","l":"charAt(int)"},'
+        '{"p":"java.lang","c":"String","l":"indexOf(String, int)","u":"indexOf(java.lang.String,int)"}];')
+    start_dir = os.getcwd()
+    os.chdir(str(root))
+    try:
+        manifest = FileManifest.scan('.')
+        assert searchindex.has_search_index(manifest)
+        entries = searchindex.SearchIndex(manifest).get_entries()
+    finally:
+        os.chdir(start_dir)
+    assert entries == [
+        ('package-summary.html', '<Unnamed>', '<Unnamed>'),
+        ('java.base/java/lang/String.html#charAt(int)', 'charAt(int)', 'java.lang.String'),
+        ('java.base/java/lang/String.html#indexOf(java.lang.String,int)', 'indexOf(String, int)', 'java.lang.String'),
+        ('java.base/java/lang/package-summary.html', 'java.lang', 'java.lang'),
+        ('Main.html', 'Main', 'Main'),
+        ('java.base/java/lang/String.html', 'String', 'java.lang.String'),
+    ]
+
+
+def test_search_index_modules(tmp_path):
+    root = tmp_path / 'javadoc'
+    (root / 'java.base').mkdir(parents=True)
+    (root / 'java.sql').mkdir()
+    (root / 'package-search-index.js').write_text(
+        'packageSearchIndex = [{"m":"java.base","l":"java.lang"},{"m":"java.sql","l":"java.sql"}];')
+    (root / 'type-search-index.js').write_text(
+        'typeSearchIndex = [{"p":"java.lang","l":"String"},{"p":"java.sql","l":"Date"}];')
+    (root / 'member-search-index.js').write_text(
+        'memberSearchIndex = [{"p":"java.lang","c":"String","l":"valueOf(int)"},'
+        '{"p":"java.sql","c":"Date","l":"valueOf(String)","u":"valueOf(java.lang.String)"},'
+        '{"p":"java.sql","c":"Date","l":"valueOf(int)"}];')
+    start_dir = os.getcwd()
+    os.chdir(str(root))
+    try:
+        core.Hhk('test', FileManifest.scan('.'), 1).create_hhk()
+        with open('test.hhk') as fo:
+            hhk = fo.read()
+    finally:
+        os.chdir(start_dir)
+    # The class of an entry is the qualified name of its type, without the module directory
+    assert '<param name="Local" value="java.base/java/lang/String.html#valueOf(int)">\n' \
+        '  <param name="Name" value="in java.lang.String">' in hhk
+    assert '<param name="Local" value="java.sql/java/sql/Date.html#valueOf(int)">\n' \
+        '  <param name="Name" value="in java.sql.Date">' in hhk
+    assert 'java.base.' not in hhk and 'java.sql.java' not in hhk
+
+
+def test_search_index_toc(tmp_path):
+    html_dir = str(tmp_path / 'html')
+    search_dir = str(tmp_path / 'search')
+    corpus.generate(html_dir)
+    corpus.generate(search_dir, search_index='js')
+    html_hhc, hhc = build_hhc(html_dir, str(tmp_path / 'work_html'))
+    metrics = metrics_.set_metrics(None)
+    search_hhc, hhc = build_hhc(search_dir, str(tmp_path / 'work_search'))
+    # Only the package list and the search index are read, not the class pages
+    assert metrics.stages['create_hhc']['files_read'] == 4
+    re_local = re.compile(r'<param name="Local" value="([^"]*)">')
+    # Same pages and members (the All Classes book of the corpus is not sorted by name)
+    assert sorted(re_local.findall(search_hhc)) == sorted(re_local.findall(html_hhc))
+    assert '<param name="Name" value="add (int, String)">' in search_hhc
+    assert '<param name="Local" value="org/synth/p0/Type0.html#add(int,%20java.lang.String)">' in search_hhc
+    search_hhc, hhc = build_hhc(search_dir, str(tmp_path / 'work_verify'), verify_toc=1)
+    assert hhc.missing_anchors == 0
+
+
+def test_search_index_toc_escapes_labels(tmp_path):
+    root = tmp_path / 'javadoc'
+    (root / 'java' / 'util').mkdir(parents=True)
+    for name in ('package-summary.html', 'ArrayList.html'):
+        (root / 'java' / 'util' / name).write_text('<html></html>')
+    (root / 'package-search-index.js').write_text('packageSearchIndex = [{"l":"java.util"}];')
+    (root / 'type-search-index.js').write_text('typeSearchIndex = [{"p":"java.util","l":"ArrayList"}];')
+    (root / 'member-search-index.js').write_text(
+        'memberSearchIndex = [{"p":"java.util","c":"ArrayList","l":"addAll(int, Collection<? extends E>)",'
+        '"u":"addAll(int,java.util.Collection)"}];')
+    start_dir = os.getcwd()
+    os.chdir(str(root))
+    try:
+        hhc = core.Hhc('test', 'overview-frame.html', 'overview-summary.html', FileManifest.scan('.'), 1)
+        hhc.create_hhc()
+        with open('test.hhc') as fo:
+            content = fo.read()
+    finally:
+        os.chdir(start_dir)
+    assert '<param name="Name" value="addAll (int, Collection&lt;? extends E&gt;)">' in content
+    assert 'Collection<' not in content
+
+
+def test_search_index_hhk_escapes_labels(tmp_path):
+    root = tmp_path / 'javadoc'
+    root.mkdir()
+    (root / 'package-search-index.js').write_text('packageSearchIndex = [{"l":"org.a"}];')
+    (root / 'type-search-index.js').write_text('typeSearchIndex = [{"p":"org.a","l":"Pair"}];')
+    (root / 'member-search-index.js').write_text(
+        'memberSearchIndex = [{"p":"org.a","c":"Pair","l":"of(Map<K, V> & Serializable)","u":"of(java.util.Map)"}];')
+    start_dir = os.getcwd()
+    os.chdir(str(root))
+    try:
+        core.Hhk('test', FileManifest.scan('.'), 1).create_hhk()
+        with open('test.hhk') as fo:
+            hhk = fo.read()
+    finally:
+        os.chdir(start_dir)
+    # Same keyword as the entity-encoded title of the HTML index
+    assert '<param name="Name" value="of(Map&lt;K, V&gt; &amp; Serializable)">' in hhk
+    assert 'Map<' not in hhk
@@ -0,0 +1,91 @@
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.abspath('.'))
+import chm
+import const
+import core
+import corpus
+import split
+
+
+def test_partition():
+    weights = [('a', 10), ('b', 30), ('c', 20), ('d', 20), ('e', 10), ('f', 10)]
+    assert split.partition(weights, 3) == [['a', 'b'], ['c', 'd'], ['e', 'f']]
+    assert split.partition(weights, 1) == [['a', 'b', 'c', 'd', 'e', 'f']]
+    assert split.partition(weights[:2], 4) == [['a'], ['b']]
+    # A package larger than a part makes its own part
+    assert split.partition([('a', 1), ('b', 100), ('c', 1)], 3) == [['a'], ['b'], ['c']]
+
+
+def test_get_package_dir():
+    package_dirs = {'org/a', 'org/a/b'}
+    assert split.get_package_dir('org/a/A.html', package_dirs) == 'org/a'
+    assert split.get_package_dir('org/a/class-use/A.html', package_dirs) == 'org/a'
+    assert split.get_package_dir('org/a/b/B.html', package_dirs) == 'org/a/b'
+    assert split.get_package_dir('org/C.html', package_dirs) is None
+    assert split.get_package_dir('index.html', package_dirs) is None
+
+
+def read_locals(path):
+    with open(path, encoding=const.PROJECT_ENCODING) as fo:
+        return re.findall(r'<param name="Local" value="([^"]*)">', fo.read())
+
+
+def test_split_build(tmp_path, monkeypatch):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1500000000')
+    javadoc_dir = str(tmp_path / 'javadoc')
+    corpus.generate(javadoc_dir, packages=5, classes=3, methods=3)
+    result = split.build(javadoc_dir, 'test', 'Test', 3, work_dir=str(tmp_path / 'work'), output_dir=str(tmp_path),
+                         jobs=2, incremental=1, compiler=const.COMPILER_INTERNAL)
+    work_dir = result.work_dir
+    parts = ['test_1', 'test_2', 'test_3']
+    assert result.chm_file == str(tmp_path / 'test.chm')
+    assert all(os.path.isfile(str(tmp_path / (part + '.chm'))) for part in parts)
+    # The sub-projects are compiled concurrently, before the master project
+    dependencies = result.metrics.task_graph['tasks']
+    assert dependencies['make:2']['dependencies'][-3:] == ['create_hhp:2', 'create_hhc:2', 'create_hhk']
+    assert dependencies['make']['dependencies'][-3:] == ['make:1', 'make:2', 'make:3']
+
+    options, files = chm.read_project(os.path.join(work_dir, 'test.hhp'))
+    assert options['Binary TOC'] == 'No' and options['Default topic'] == 'overview-summary.html'
+    assert not any(name.startswith('org/') for name in files)
+    with open(os.path.join(work_dir, 'test.hhp'), encoding=const.PROJECT_ENCODING) as fo:
+        assert fo.read().endswith('[MERGE FILES]\ntest_1.chm\ntest_2.chm\ntest_3.chm\n')
+    with open(os.path.join(work_dir, 'test.hhc'), encoding=const.PROJECT_ENCODING) as fo:
+        hhc = fo.read()
+    assert hhc.count('<param name="Merge" value="test_') == 3
+    assert hhc.index('value="overview-summary.html"') < hhc.index('value="test_1.chm::/test_1.hhc"')
+
+    # The packages in order, each in one sub-project with its pages, contents and index
+    packages = []
+    index = []
+    for part in parts:
+        options, files = chm.read_project(os.path.join(work_dir, part + '.hhp'))
+        assert options['Error log file'] == part + '.log'
+        part_packages = sorted(set(os.path.dirname(name) for name in files))
+        assert options['Default topic'] == part_packages[0] + '/package-summary.html'
+        assert set(os.path.dirname(local) for local in read_locals(os.path.join(work_dir, part + '.hhc'))) \
+            == set(part_packages)
+        part_index = read_locals(os.path.join(work_dir, part + '.hhk'))
+        assert set(os.path.dirname(local) for local in part_index) <= set(part_packages)
+        packages += part_packages
+        index += part_index
+    assert packages == ['org/synth/p%d' % p for p in range(5)]
+    single = core.build(javadoc_dir, 'single', 'Single', work_dir=str(tmp_path / 'single'),
+                        output_dir=str(tmp_path), jobs=1, compiler=const.COMPILER_INTERNAL)
+    assert sorted(index) == sorted(read_locals(os.path.join(single.work_dir, 'single.hhk')))
+
+    # Incremental build: only the sub-project of the changed page is compiled
+    page = os.path.join(javadoc_dir, 'org', 'synth', 'p4', 'Type0.html')
+    with open(page) as fo:
+        data = fo.read()
+    with open(page, 'w') as fo:
+        fo.write(data.replace('</body>', '<p>Changed</p></body>'))
+    chm_files = [os.path.join(work_dir, name + '.chm') for name in ['test'] + parts]
+    mtimes = [os.stat(chm_file).st_mtime_ns for chm_file in chm_files]
+    split.build(javadoc_dir, 'test', 'Test', 3, work_dir=work_dir, output_dir=str(tmp_path), jobs=1, incremental=1,
+                compiler=const.COMPILER_INTERNAL)
+    assert [os.stat(chm_file).st_mtime_ns == mtime for chm_file, mtime in zip(chm_files, mtimes)] \
+        == [True, True, True, False]
@@ -0,0 +1,136 @@
+import os
+import sys
+import shutil
+import logging
+
+sys.path.insert(0, os.path.abspath('.'))
+import const
+import core
+import staging
+from manifest import FileManifest
+
+PAGE = '<td><code><b><a href="A.html#m(int, int)">m</a></b></code>\n<a name="m(int, int)"><!-- --></a>\n'
+
+
+def test_get_copy_function():
+    assert staging.get_copy_function(const.STAGING_LINK) is staging.link_file
+    assert staging.get_copy_function(const.STAGING_COPY) is staging.copy_file
+
+
+def test_link_file(tmp_path):
+    src = tmp_path / 'src.html'
+    src.write_bytes(b'<html>source</html>')
+    dst = str(tmp_path / 'dst.html')
+    assert staging.link_file(str(src), dst) == dst
+    with open(dst, 'rb') as fo:
+        assert fo.read() == b'<html>source</html>'
+    # A modified staged file is unshared first: the source is never modified
+    staging.unshare(dst)
+    with open(dst, 'wb') as fo:
+        fo.write(b'<html>staged</html>')
+    assert src.read_bytes() == b'<html>source</html>'
+    # A file with a single link is kept
+    staging.unshare(dst)
+    assert os.path.isfile(dst)
+    staging.unshare(str(tmp_path / 'missing.html'))
+
+
+def test_link_staging_keeps_source(tmp_path):
+    javadoc_dir = tmp_path / 'javadoc'
+    javadoc_dir.mkdir()
+    (javadoc_dir / 'A.html').write_text(PAGE)
+    (javadoc_dir / 'B.html').write_text('<html>nothing to quote</html>\n')
+    (javadoc_dir / const.CSS_FILE_NAME).write_text('body {}\n')
+    work_dir = str(tmp_path / 'work')
+    env = core.ChmEnv()
+    env.jobs = 1
+    env.staging = const.STAGING_LINK
+    env.temp_dir = work_dir
+    env.copy_javadoc(str(javadoc_dir))
+    env.create_css()
+    assert (javadoc_dir / 'A.html').read_text() == PAGE
+    assert (javadoc_dir / const.CSS_FILE_NAME).read_text() == 'body {}\n'
+    with open(os.path.join(work_dir, 'A.html')) as fo:
+        assert '<a name="m(int,%20int)">' in fo.read()
+    with open(os.path.join(work_dir, const.CSS_FILE_NAME)) as fo:
+        assert fo.read() == const.FORMAT_CSS
+    with open(os.path.join(work_dir, const.CSS_FILE_NAME + '.bak')) as fo:
+        assert fo.read() == 'body {}\n'
+    # Not modified: still linked to the source
+    assert os.path.samefile(str(javadoc_dir / 'B.html'), os.path.join(work_dir, 'B.html'))
+
+
+def test_stage_tree_log(tmp_path, caplog):
+    javadoc_dir = tmp_path / 'javadoc'
+    javadoc_dir.mkdir()
+    (javadoc_dir / 'A.html').write_text(PAGE)
+    (javadoc_dir / 'B.html').write_text('<html>nothing to quote</html>\n')
+    (javadoc_dir / const.CSS_FILE_NAME).write_text('body {}\n')
+    caplog.set_level(logging.DEBUG, logger='jd2chm')
+    env = core.ChmEnv()
+    env.jobs = 1
+    env.temp_dir = str(tmp_path / 'work')
+    env.copy_javadoc(str(javadoc_dir))
+    messages = [record.getMessage() for record in caplog.records]
+    # One line per HTML file, modified or not
+    assert 'A.html: 2 lines modified' in messages
+    assert 'B.html: 0 lines modified' in messages
+    assert not [message for message in messages if message.startswith(const.CSS_FILE_NAME)]
+
+
+def test_load_manifest(tmp_path):
+    staging_dir = str(tmp_path)
+    assert staging.load_manifest(staging_dir) is None
+    files = {'a.html': {'size': 1, 'mtime': 2, 'hash': 'h'}}
+    staging.save_manifest(staging_dir, files)
+    assert staging.load_manifest(staging_dir) == files
+    # A manifest of another version is ignored: the tree is staged again
+    (tmp_path / const.STAGING_MANIFEST).write_text('{"version": 0, "files": {}}')
+    assert staging.load_manifest(staging_dir) is None
+    (tmp_path / const.STAGING_MANIFEST).write_text('{"version"')
+    assert staging.load_manifest(staging_dir) is None
+
+
+def test_sync_tree(tmp_path):
+    src = tmp_path / 'src'
+    dst = tmp_path / 'dst'
+    src.mkdir()
+    for name in ('a.html', 'b.html', 'c.html'):
+        (src / name).write_text(name)
+    shutil.copytree(str(src), str(dst))
+    assert staging.record_tree(str(src), str(dst), 1) == staging.Changes(True, ['a.html', 'b.html', 'c.html'], [], [])
+    # Only the time stamp changed: the file is not staged again
+    os.utime(str(src / 'a.html'), ns=(1, 1))
+    (src / 'b.html').write_text('changed')
+    (src / 'c.html').unlink()
+    (src / 'sub').mkdir()
+    (src / 'sub' / 'd.html').write_text('d')
+    staged = FileManifest.scan(str(dst))
+    changes = staging.sync_tree(str(src), str(dst), shutil.copy2, staged, 1)
+    assert changes == staging.Changes(False, ['sub/d.html'], ['b.html'], ['c.html'])
+    assert (dst / 'b.html').read_text() == 'changed' and (dst / 'sub' / 'd.html').read_text() == 'd'
+    assert not (dst / 'c.html').exists()
+    # The manifest of the staging directory is kept up to date
+    assert staged.isfile('sub/d.html') and not staged.isfile('c.html')
+    assert staging.load_manifest(str(dst))['a.html']['mtime'] == 1
+    # Nothing changed since the previous sync
+    staged = FileManifest.scan(str(dst))
+    assert staging.sync_tree(str(src), str(dst), shutil.copy2, staged, 1) == staging.Changes(False, [], [], [])
+
+
+def test_is_outdated(tmp_path):
+    for ext in ('.hhp', '.hhc', '.hhk'):
+        (tmp_path / ('test' + ext)).write_text('')
+    project = core.ChmProject()
+    manifest = FileManifest.scan(str(tmp_path))
+    # Only the index changed: the HHK file is regenerated, not the HHC file
+    changes = staging.Changes(False, [], [const.INDEX_ALL], [])
+    assert project.is_outdated(manifest, 'test.hhk', changes, core.is_index_file)
+    assert not project.is_outdated(manifest, 'test.hhc', changes, core.is_content_file)
+    # The file section of the HHP file only depends on the files added or deleted
+    changes = staging.Changes(False, [], ['org/A.html'], [])
+    assert not project.is_outdated(manifest, 'test.hhp', changes, core.is_html_file, changes.added + changes.deleted)
+    assert project.is_outdated(manifest, 'test.hhc', changes, core.is_content_file)
+    # Full build, or missing file
+    assert project.is_outdated(manifest, 'test.hhc', staging.Changes(True, [], [], []), core.is_content_file)
+    assert project.is_outdated(manifest, 'missing.hhc', staging.Changes(False, [], [], []), core.is_content_file)
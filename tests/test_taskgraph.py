@@ -0,0 +1,101 @@
+import os
+import sys
+import threading
+import time
+import pytest
+
+sys.path.insert(0, os.path.abspath('.'))
+import metrics as metrics_
+import taskgraph
+
+
+def make_graph(calls, barrier=None):
+    """stage -> (hhc, hhk) -> make, hhc and hhk waiting for each other on barrier"""
+    def task(name):
+        def run():
+            if barrier is not None and name in ('hhc', 'hhk'):
+                barrier.wait()
+            calls.append(name)
+            metrics_.count(files_read=1)
+            return name.upper()
+        return run
+
+    graph = taskgraph.TaskGraph()
+    graph.add('stage', task('stage'), inputs=('javadoc',), outputs=('staged',))
+    graph.add('hhc', task('hhc'), inputs=('staged',), outputs=('hhc',))
+    graph.add('hhk', task('hhk'), inputs=('staged',), outputs=('hhk',))
+    graph.add('make', task('make'), inputs=('staged', 'hhc', 'hhk'), outputs=('chm',))
+    return graph
+
+
+def test_dependencies():
+    graph = make_graph([])
+    assert graph.dependencies == {'stage': [], 'hhc': ['stage'], 'hhk': ['stage'], 'make': ['stage', 'hhc', 'hhk']}
+    # A task writing a resource read by a previous task runs after it
+    graph.add('clean', lambda: None, outputs=('hhk',))
+    assert graph.dependencies['clean'] == ['hhk', 'make']
+
+
+def test_run_concurrently():
+    calls = []
+    # The barrier is only passed if hhc and hhk run at the same time
+    graph = make_graph(calls, threading.Barrier(2, timeout=10))
+    metrics = metrics_.set_metrics(None)
+    results = graph.run()
+    assert results == {'stage': 'STAGE', 'hhc': 'HHC', 'hhk': 'HHK', 'make': 'MAKE'}
+    assert calls[0] == 'stage' and calls[3] == 'make'
+    assert sorted(metrics.stages) == ['hhc', 'hhk', 'make', 'stage']
+    assert all(record['files_read'] == 1 for record in metrics.stages.values())
+    assert graph.start_times['make'] >= graph.start_times['hhc'] + graph.durations['hhc']
+
+
+def test_cpu_time_of_concurrent_stages():
+    barrier = threading.Barrier(2, timeout=10)
+
+    def idle():
+        barrier.wait()
+        time.sleep(0.2)
+
+    def busy():
+        barrier.wait()
+        start = time.thread_time()
+        while time.thread_time() - start < 0.2:
+            pass
+
+    graph = taskgraph.TaskGraph()
+    graph.add('idle', idle, outputs=('a',))
+    graph.add('busy', busy, outputs=('b',))
+    metrics = metrics_.set_metrics(None)
+    graph.run()
+    # The CPU time of a stage is the time of its thread, not of the process
+    assert metrics.stages['busy']['cpu_time'] >= 0.2
+    assert metrics.stages['idle']['cpu_time'] < 0.1
+    # The peak memory is reported once for the build
+    assert 'peak_rss' not in metrics.stages['busy']
+    assert 'peak_rss' in metrics.report()['total']
+
+
+def test_critical_path():
+    graph = make_graph([])
+    graph.durations = {'stage': 2, 'hhc': 1, 'hhk': 3, 'make': 1}
+    assert graph.get_critical_path() == (['stage', 'hhk', 'make'], 6)
+    graph.durations['hhc'] = 4
+    assert graph.get_critical_path() == (['stage', 'hhc', 'make'], 7)
+    report = graph.report()
+    assert report['critical_path'] == ['stage', 'hhc', 'make']
+    assert report['tasks']['make']['dependencies'] == ['stage', 'hhc', 'hhk']
+    lines = graph.format_report().splitlines()
+    assert lines[2].startswith('* hhc') and lines[3].startswith('  hhk')
+    assert lines[-1].startswith('Critical path: stage > hhc > make (7.00s')
+
+
+def test_failure():
+    calls = []
+    graph = taskgraph.TaskGraph()
+    graph.add('stage', lambda: calls.append('stage'), outputs=('staged',))
+    graph.add('hhc', lambda: 1 / 0, inputs=('staged',), outputs=('hhc',))
+    graph.add('hhk', lambda: calls.append('hhk'), inputs=('staged',), outputs=('hhk',))
+    graph.add('make', lambda: calls.append('make'), inputs=('hhc', 'hhk'))
+    with pytest.raises(ZeroDivisionError):
+        graph.run()
+    assert 'make' not in calls